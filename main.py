@@ -13,6 +13,8 @@ import qrcode
 import mysql.connector
 import csv
 import io
+import sqlite3
+import json
 import pandas as pd
 from datetime import datetime
 from PIL import ImageDraw, ImageFont
@@ -21,6 +23,16 @@ import os
 import platform
 import socket
 import threading
+import multiprocessing
+import queue
+import shutil
+import subprocess
+import time
+import atexit
+import hashlib
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # =====================================================
 # 🌍 DETECCIÓN DE SISTEMA OPERATIVO
@@ -31,36 +43,50 @@ IS_MACOS = CURRENT_OS == "Darwin"
 IS_LINUX = CURRENT_OS == "Linux"
 
 # Importaciones condicionales para Windows
+# (sin mensajes al importar: los procesos del pre-renderizado vuelven a importar
+# este módulo; el resumen lo muestra informar_entorno() al arrancar)
 if IS_WINDOWS:
     try:
         import win32print
         PRINTING_AVAILABLE = True
     except ImportError:
         PRINTING_AVAILABLE = False
-        print("⚠️  win32print no disponible. Funcionalidad de impresión limitada.")
 else:
     PRINTING_AVAILABLE = False
-    print(f"🌍 Sistema detectado: {CURRENT_OS}")
-    print("📱 Modo multiplataforma: Impresión deshabilitada, guardado de etiquetas habilitado")
 
 # Importaciones condicionales para MySQL
 try:
     import pymysql
     PYMYSQL_AVAILABLE = True
-    print("✅ PyMySQL disponible para conexiones MySQL")
 except ImportError:
     PYMYSQL_AVAILABLE = False
-    print("📌 PyMySQL no disponible, usando solo mysql.connector")
 
 # Importaciones condicionales para Brother QL (Mac/Linux)
+BROTHER_QL_AVAILABLE = False
 if not IS_WINDOWS:
     try:
         import brother_ql
         BROTHER_QL_AVAILABLE = True
-        print("✅ brother_ql disponible para impresión directa")
     except ImportError:
-        BROTHER_QL_AVAILABLE = False
-        print("⚠️ brother_ql no disponible. Instalar con: pip install brother_ql")
+        pass
+
+def informar_entorno():
+    """Muestra el sistema detectado y los drivers opcionales disponibles."""
+    if IS_WINDOWS:
+        if not PRINTING_AVAILABLE:
+            print("⚠️  win32print no disponible. Funcionalidad de impresión limitada.")
+    else:
+        print(f"🌍 Sistema detectado: {CURRENT_OS}")
+        print("📱 Modo multiplataforma: Impresión deshabilitada, guardado de etiquetas habilitado")
+    if PYMYSQL_AVAILABLE:
+        print("✅ PyMySQL disponible para conexiones MySQL")
+    else:
+        print("📌 PyMySQL no disponible, usando solo mysql.connector")
+    if not IS_WINDOWS:
+        if BROTHER_QL_AVAILABLE:
+            print("✅ brother_ql disponible para impresión directa")
+        else:
+            print("⚠️ brother_ql no disponible. Instalar con: pip install brother_ql")
 
 # =====================================================
 # 🔤 SISTEMA DE FUENTES MULTIPLATAFORMA
@@ -92,23 +118,52 @@ def get_font_path(font_name, is_bold=False):
                 return font_path
         return None
 
+# Registro de fuentes del proceso: cada (ruta, tamaño) se abre una sola vez
+_FUENTES = {}
+_FUENTES_LOCK = threading.Lock()
+_RUTAS_FUENTE = {}
+
+def ruta_fuente(font_name, is_bold=False):
+    """``get_font_path`` resuelto una sola vez por (fuente, negrita)."""
+    clave = (font_name, is_bold)
+    if clave not in _RUTAS_FUENTE:
+        _RUTAS_FUENTE[clave] = get_font_path(font_name, is_bold)
+    return _RUTAS_FUENTE[clave]
+
+def obtener_fuente(ruta, tamano):
+    """Devuelve la fuente TrueType (ruta, tamaño) cacheada, o ``None`` si no se puede abrir."""
+    clave = (ruta, tamano)
+    with _FUENTES_LOCK:
+        if clave in _FUENTES:
+            return _FUENTES[clave]
+    try:
+        fuente = ImageFont.truetype(ruta, tamano)
+    except Exception:
+        fuente = None  # Se recuerda el fallo para no volver a intentarlo en cada etiqueta
+    with _FUENTES_LOCK:
+        return _FUENTES.setdefault(clave, fuente)
+
 def load_fonts():
     """Carga las fuentes según el sistema operativo"""
     try:
         if IS_WINDOWS:
             # Windows: código exacto original que funciona
-            font_name = ImageFont.truetype('C:/Windows/Fonts/arialbd.ttf', 95)
-            font_empresa = ImageFont.truetype('C:/Windows/Fonts/arial.ttf', 60)
-            font_dias = ImageFont.truetype('C:/Windows/Fonts/arial.ttf', 60)
-            font_entrada_evento = ImageFont.truetype('C:/Windows/Fonts/arial.ttf', 45)
+            font_name = obtener_fuente('C:/Windows/Fonts/arialbd.ttf', 95)
+            font_empresa = obtener_fuente('C:/Windows/Fonts/arial.ttf', 60)
+            font_dias = obtener_fuente('C:/Windows/Fonts/arial.ttf', 60)
+            font_entrada_evento = obtener_fuente('C:/Windows/Fonts/arial.ttf', 45)
+            if None in (font_name, font_empresa, font_dias, font_entrada_evento):
+                raise OSError("No se pudieron abrir las fuentes Arial de Windows")
         else:
             # Mac/Linux: fuentes alternativas
-            font_path = get_font_path('arial')
+            font_path = ruta_fuente('arial')
             if font_path and os.path.exists(font_path):
-                font_name = ImageFont.truetype(font_path, 95)
-                font_empresa = ImageFont.truetype(font_path, 60)
-                font_dias = ImageFont.truetype(font_path, 60)
-                font_entrada_evento = ImageFont.truetype(font_path, 45)
+                font_name = obtener_fuente(font_path, 95)
+                font_empresa = obtener_fuente(font_path, 60)
+                font_dias = obtener_fuente(font_path, 60)
+                font_entrada_evento = obtener_fuente(font_path, 45)
+                if None in (font_name, font_empresa, font_dias, font_entrada_evento):
+                    raise OSError(f"No se pudo abrir la fuente {font_path}")
             else:
                 # Fallback a fuente por defecto
                 font_name = font_empresa = font_dias = font_entrada_evento = ImageFont.load_default()
@@ -120,6 +175,21 @@ def load_fonts():
         default_font = ImageFont.load_default()
         return default_font, default_font, default_font, default_font
 
+def fuente_pagado(tamano=40):
+    """Fuente del indicador "P" de entrada pagada (primera candidata disponible)."""
+    for ruta in ("arial.ttf", "DejaVuSans-Bold.ttf"):
+        fuente = obtener_fuente(ruta, tamano)
+        if fuente is not None:
+            return fuente
+    return ImageFont.load_default()
+
+def precargar_fuentes():
+    """Abre por adelantado las fuentes de la etiqueta para que el primer escaneo no pague el coste."""
+    inicio = time.perf_counter()
+    load_fonts()
+    fuente_pagado()
+    print(f"🔤 Fuentes precargadas en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
 # =====================================================
 # 🎨 CONFIGURACIÓN DE TEMA PROFESIONAL
 # =====================================================
@@ -178,6 +248,9 @@ DB_CONFIG_EVENTOS = {
 
 PRINTER_IDENTIFIER = 'QL-800'  # Nombre del driver instalado en Windows
 LABEL_TYPE = 'DK-11201'        # 29x90 mm
+BROTHER_QL_MODELO = 'QL-700'                   # Modelo para brother_ql (Mac/Linux)
+BROTHER_QL_DISPOSITIVO = 'usb://0x04f9:0x2042'  # Identificador USB de la QL-700
+BROTHER_QL_ETIQUETA = '62'                      # Rollo continuo de 62 mm
 AUTO_MODE = True               # Cambia a False para modo manual
 LOG_FILE = 'log_impresiones.csv'
 ACCESOS_LOG_FILE = 'log_accesos.csv'  # Nuevo archivo para log de accesos
@@ -185,6 +258,408 @@ ACCESOS_LOG_FILE = 'log_accesos.csv'  # Nuevo archivo para log de accesos
 # Variables globales para eventos seleccionados
 EVENTOS_ACTIVOS = []  # Lista de IDs de eventos activos
 
+# =====================================================
+# 🔌 POOL DE CONEXIONES MYSQL
+# =====================================================
+POOL_TAMANO_MAXIMO = 4          # Conexiones simultáneas máximas por base de datos
+POOL_INACTIVIDAD_PING = 30      # Segundos sin uso tras los que se verifica la conexión con ping
+POOL_ESPERA_MAXIMA = 15         # Segundos máximos esperando una conexión libre
+POOL_TIMEOUT_LECTURA = 30       # Segundos máximos esperando datos del servidor (socket medio abierto)
+POOL_TIMEOUT_ESCRITURA = 30     # Segundos máximos enviando una consulta
+
+# Familias de excepción en las que puede venir una caída de conexión
+_ERRORES_CONEXION = (
+    mysql.connector.errors.OperationalError,
+    mysql.connector.errors.InterfaceError,
+    ConnectionError,
+)
+if PYMYSQL_AVAILABLE:
+    _ERRORES_CONEXION += (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+# Códigos de cliente/servidor que indican conexión perdida (no errores de SQL como 1054)
+CODIGOS_ERROR_CONEXION = {
+    2002,  # CR_CONNECTION_ERROR
+    2003,  # CR_CONN_HOST_ERROR
+    2005,  # CR_UNKNOWN_HOST
+    2006,  # CR_SERVER_GONE_ERROR
+    2013,  # CR_SERVER_LOST
+    2055,  # CR_SERVER_LOST_EXTENDED
+    4031,  # ER_CLIENT_INTERACTION_TIMEOUT
+}
+
+def es_error_conexion(error):
+    """Indica si ``error`` es una caída de la conexión (reintentable) y no un error de la consulta."""
+    if isinstance(error, (ConnectionError, socket.timeout)):
+        return True
+    if not isinstance(error, _ERRORES_CONEXION):
+        return False
+    codigo = getattr(error, 'errno', None)
+    if codigo is None and error.args and isinstance(error.args[0], int):
+        codigo = error.args[0]  # PyMySQL: (código, mensaje)
+    if codigo in CODIGOS_ERROR_CONEXION:
+        return True
+    # InterfaceError sin código (p. ej. PyMySQL (0, '') sobre una conexión cerrada)
+    interfaz = (mysql.connector.errors.InterfaceError,)
+    if PYMYSQL_AVAILABLE:
+        interfaz += (pymysql.err.InterfaceError,)
+    return isinstance(error, interfaz) and not codigo
+
+
+class PoolConexiones:
+    """Pool acotado de conexiones persistentes para una configuración de BD.
+
+    Las conexiones se reutilizan entre escaneos; las que llevan tiempo
+    inactivas se verifican con ping (reconectando si es necesario) y las que
+    fallan durante una consulta se descartan y se reintenta con una nueva.
+    """
+
+    def __init__(self, config, tamano_maximo=POOL_TAMANO_MAXIMO):
+        self.config = config
+        self.tamano_maximo = tamano_maximo
+        self.driver = "PyMySQL" if PYMYSQL_AVAILABLE else "mysql.connector"
+        self._libres = []  # Pila de (conexion, instante_ultimo_uso)
+        self._creadas = 0
+        self._cond = threading.Condition()
+
+    def _conectar(self):
+        """Abre una conexión nueva con el driver disponible."""
+        timeout = self.config.get('connect_timeout', 10)
+        lectura = self.config.get('read_timeout', POOL_TIMEOUT_LECTURA)
+        escritura = self.config.get('write_timeout', POOL_TIMEOUT_ESCRITURA)
+        if PYMYSQL_AVAILABLE:
+            return pymysql.connect(
+                host=self.config['host'],
+                port=int(self.config.get('port', 3306)),
+                user=self.config['user'],
+                password=self.config['password'],
+                database=self.config['database'],
+                connect_timeout=timeout,
+                read_timeout=lectura,
+                write_timeout=escritura,
+                autocommit=True
+            )
+        # Fallback: mysql.connector con charset latin1 (igual que el resto del sistema)
+        parametros = dict(
+            host=self.config['host'],
+            port=int(self.config.get('port', 3306)),
+            user=self.config['user'],
+            password=self.config['password'],
+            database=self.config['database'],
+            charset='latin1',
+            connection_timeout=timeout,
+            autocommit=True
+        )
+        try:
+            return mysql.connector.connect(read_timeout=lectura, write_timeout=escritura, **parametros)
+        except AttributeError:
+            # Versiones antiguas sin read/write_timeout: connection_timeout queda
+            # como timeout del socket para toda la sesión
+            return mysql.connector.connect(**parametros)
+
+    def _esta_viva(self, conn):
+        """Verifica la conexión con ping, reconectando si se había cerrado."""
+        try:
+            if PYMYSQL_AVAILABLE:
+                conn.ping(reconnect=True)
+            else:
+                conn.ping(reconnect=True, attempts=1, delay=0)
+            return True
+        except Exception:
+            return False
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def adquirir(self):
+        """Obtiene una conexión del pool (o abre una nueva si hay hueco)."""
+        fin_espera = time.monotonic() + POOL_ESPERA_MAXIMA
+        while True:
+            conn = None
+            with self._cond:
+                if self._libres:
+                    conn, ultimo_uso = self._libres.pop()
+                elif self._creadas < self.tamano_maximo:
+                    self._creadas += 1
+                else:
+                    restante = fin_espera - time.monotonic()
+                    if restante <= 0:
+                        raise TimeoutError(f"Pool MySQL agotado ({self.tamano_maximo} conexiones en uso)")
+                    self._cond.wait(restante)
+                    continue
+
+            if conn is not None:
+                # Conexión reutilizada: solo se verifica si lleva tiempo inactiva
+                if time.monotonic() - ultimo_uso < POOL_INACTIVIDAD_PING or self._esta_viva(conn):
+                    return conn
+                print(f"🔄 Conexión inactiva caída en {self.config['database']}, descartando...")
+                self.descartar(conn)
+                continue
+
+            try:
+                return self._conectar()
+            except Exception:
+                with self._cond:
+                    self._creadas -= 1
+                    self._cond.notify()
+                raise
+
+    def liberar(self, conn):
+        """Devuelve una conexión sana al pool."""
+        with self._cond:
+            self._libres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def descartar(self, conn):
+        """Cierra una conexión defectuosa y libera su hueco en el pool."""
+        self._cerrar(conn)
+        with self._cond:
+            self._creadas -= 1
+            self._cond.notify()
+
+    def ejecutar(self, operacion):
+        """Ejecuta ``operacion(conn)`` con una conexión del pool.
+
+        Si la conexión estaba caída se descarta y se reintenta una vez con
+        una conexión nueva.
+        """
+        for intento in range(2):
+            conn = self.adquirir()
+            try:
+                resultado = operacion(conn)
+            except Exception as e:
+                if not es_error_conexion(e):
+                    # Error de la consulta (columna desconocida, datos...): la conexión sigue sana
+                    self.liberar(conn)
+                    raise
+                self.descartar(conn)
+                if intento == 0:
+                    print(f"🔄 Conexión perdida con {self.config['database']} ({e}), reintentando...")
+                    continue
+                raise
+            self.liberar(conn)
+            return resultado
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres del pool."""
+        with self._cond:
+            libres, self._libres = self._libres, []
+            self._creadas -= len(libres)
+        for conn, _ in libres:
+            self._cerrar(conn)
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def obtener_pool(config):
+    """Devuelve el pool asociado a una configuración de BD (uno por servidor/usuario/base)."""
+    clave = (config['host'], config.get('port', 3306), config['user'], config['password'], config['database'])
+    with _POOLS_LOCK:
+        pool = _POOLS.get(clave)
+        if pool is None:
+            pool = PoolConexiones(config)
+            _POOLS[clave] = pool
+        return pool
+
+def ejecutar_consulta(config, operacion):
+    """Atajo para ejecutar ``operacion(conn)`` con el pool de ``config``."""
+    return obtener_pool(config).ejecutar(operacion)
+
+@atexit.register
+def cerrar_pools():
+    """Cierra las conexiones persistentes al salir del programa."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    for pool in pools:
+        pool.cerrar()
+
+# =====================================================
+# 🗂️ METADATOS DE ESQUEMA (COLUMNAS POR TABLA)
+# =====================================================
+class MetadatosEsquema:
+    """Caché compartida de las columnas de cada tabla consultada.
+
+    Las columnas se aprenden de ``cursor.description`` de la propia consulta
+    (sin ``DESCRIBE`` adicional). Si una consulta devuelve una estructura
+    distinta a la conocida, la caché de esa tabla se reemplaza y se incrementa
+    ``version`` para que quien dependa del esquema pueda detectarlo.
+    """
+
+    def __init__(self):
+        self._columnas = {}  # (base, tabla) -> tupla de nombres de columna
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def columnas(self, base, tabla, cursor):
+        """Devuelve los nombres de columna de la consulta recién ejecutada sobre ``tabla``."""
+        actuales = tuple(desc[0] for desc in cursor.description)
+        clave = (base, tabla)
+        with self._lock:
+            conocidas = self._columnas.get(clave)
+            if conocidas == actuales:
+                return conocidas
+            if conocidas is not None:
+                self.version += 1
+                print(f"🗂️ Esquema de {base}.{tabla} modificado (versión {self.version})")
+            self._columnas[clave] = actuales
+            return actuales
+
+    def conocidas(self, base, tabla):
+        """Columnas de la tabla vistas en esta sesión (tupla vacía si aún no se consultó)."""
+        with self._lock:
+            return self._columnas.get((base, tabla), ())
+
+    def tiene_columna(self, base, tabla, columna):
+        """Indica si la tabla (ya consultada en esta sesión) contiene ``columna``."""
+        with self._lock:
+            return columna in self._columnas.get((base, tabla), ())
+
+    def fila_a_diccionario(self, base, tabla, cursor, fila):
+        """Convierte una fila (tupla) en diccionario columna → valor."""
+        if fila is None:
+            return None
+        return dict(zip(self.columnas(base, tabla, cursor), fila))
+
+    def filas_a_diccionarios(self, base, tabla, cursor, filas):
+        """Convierte una lista de filas en diccionarios reutilizando las columnas conocidas."""
+        columnas = self.columnas(base, tabla, cursor)
+        return [dict(zip(columnas, fila)) for fila in filas]
+
+    def invalidar(self):
+        """Olvida todas las estructuras conocidas (p. ej. al cambiar de servidor)."""
+        with self._lock:
+            self._columnas.clear()
+            self.version += 1
+
+
+ESQUEMA = MetadatosEsquema()
+
+# =====================================================
+# 📅 CATÁLOGO DE EVENTOS (CACHÉ DE SESIÓN)
+# =====================================================
+EVENTOS_TTL_SEGUNDOS = 300          # Antigüedad máxima antes de volver a consultar
+EVENTOS_REFRESCO_SEGUNDOS = 120     # Intervalo del refresco en segundo plano
+
+class CatalogoEventos:
+    """Caché en memoria de la tabla ``Eventos`` con índice por id.
+
+    La primera consulta (o una vez vencido el TTL) lee la tabla; el resto de
+    llamadas devuelven la copia en memoria. Un hilo en segundo plano la
+    refresca antes de que caduque, de modo que resolver el nombre de un evento
+    durante el escaneo no toca la red. Si la base no responde se siguen
+    sirviendo los últimos datos conocidos.
+    """
+
+    def __init__(self, ttl=EVENTOS_TTL_SEGUNDOS):
+        self.ttl = ttl
+        self._eventos = []
+        self._por_id = {}
+        self._cargado_en = None
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _consultar(self):
+        def _consulta(conn):
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT id, Nombre, fecha, dia FROM Eventos ORDER BY fecha DESC")
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        
+        return [{'id': r[0], 'Nombre': r[1], 'fecha': r[2], 'dia': r[3]}
+                for r in ejecutar_consulta(DB_CONFIG_EVENTOS, _consulta)]
+
+    def refrescar(self):
+        """Vuelve a leer la tabla de eventos y reemplaza la caché. Devuelve la lista."""
+        eventos = self._consultar()
+        with self._lock:
+            self._eventos = eventos
+            self._por_id = {e['id']: e for e in eventos}
+            self._cargado_en = time.monotonic()
+        REPLICA_MYSQL.guardar_eventos(eventos)
+        return eventos
+
+    def vigente(self):
+        """Indica si hay datos cargados dentro del TTL."""
+        with self._lock:
+            return self._cargado_en is not None and time.monotonic() - self._cargado_en < self.ttl
+
+    def eventos(self, forzar=False):
+        """Lista de eventos (más recientes primero); consulta la BD solo si la caché venció."""
+        if forzar or not self.vigente():
+            try:
+                return self.refrescar()
+            except Exception:
+                with self._lock:
+                    if self._cargado_en is not None:
+                        print("⚠️ No se pudo refrescar el catálogo de eventos, usando la copia en memoria")
+                        return self._eventos
+                # Sin conexión desde el arranque: último catálogo guardado en la réplica local
+                eventos = REPLICA_MYSQL.eventos()
+                if not eventos:
+                    raise
+                print("⚠️ No se pudo leer el catálogo de eventos, usando la réplica local")
+                with self._lock:
+                    self._eventos = eventos
+                    self._por_id = {e['id']: e for e in eventos}
+                return eventos
+        with self._lock:
+            return self._eventos
+
+    def por_id(self):
+        """Diccionario id → evento (carga el catálogo si aún no se hizo)."""
+        self.eventos()
+        with self._lock:
+            return self._por_id
+
+    def nombre(self, evento_id):
+        """Nombre del evento ``evento_id`` resuelto en memoria."""
+        try:
+            eventos = self.por_id()
+        except Exception as e:
+            print(f"❌ Error obteniendo catálogo de eventos: {e}")
+            eventos = {}
+        return obtener_nombre_evento(evento_id, eventos)
+
+    def invalidar(self):
+        """Descarta la caché (p. ej. al cambiar de servidor)."""
+        with self._lock:
+            self._eventos = []
+            self._por_id = {}
+            self._cargado_en = None
+
+    def iniciar_refresco(self, intervalo=EVENTOS_REFRESCO_SEGUNDOS):
+        """Arranca el hilo que mantiene el catálogo al día en segundo plano."""
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle_refresco, args=(intervalo,),
+                                      name="catalogo-eventos", daemon=True)
+        self._hilo.start()
+
+    def detener_refresco(self):
+        self._detener.set()
+
+    def _bucle_refresco(self, intervalo):
+        while not self._detener.wait(intervalo):
+            # Solo se refresca un catálogo que ya se usó (en modo CSV no se toca MySQL)
+            with self._lock:
+                en_uso = self._cargado_en is not None
+            if not en_uso:
+                continue
+            try:
+                self.refrescar()
+            except Exception as e:
+                print(f"⚠️ Refresco del catálogo de eventos fallido: {e}")
+
+
+CATALOGO_EVENTOS = CatalogoEventos()
+
 def validar_usuario_evento(usuario_data, eventos_activos):
     """Valida si el usuario pertenece a alguno de los eventos activos."""
     evento_usuario = usuario_data.get('Evento')
@@ -202,102 +677,460 @@ def validar_usuario_evento(usuario_data, eventos_activos):
     else:
         return False, f"Usuario no autorizado para eventos activos. Su evento: {evento_usuario_id}"
 
+# =====================================================
+# 📝 ESCRITOR DE LOGS CSV (EN SEGUNDO PLANO)
+# =====================================================
+LOGS_BUFFER_MAXIMO = 20000      # Filas pendientes como máximo (se descartan las más antiguas)
+LOGS_LOTE = 200                 # Filas que disparan una escritura inmediata
+LOGS_INTERVALO_SEGUNDOS = 1.0   # Escritura periódica de lo pendiente
+
+def ruta_log_respaldo(archivo):
+    """Archivo de respaldo fijo para ``archivo`` (p. ej. log_accesos_respaldo.csv)."""
+    base, extension = os.path.splitext(archivo)
+    return f"{base}_respaldo{extension or '.csv'}"
+
+class EscritorLogs:
+    """Escribe los logs CSV por lotes desde un hilo propio.
+
+    ``escribir()`` solo añade la fila a un buffer circular en memoria; el
+    hilo la vuelca junto con las demás pendientes (una apertura, ``fsync``
+    y cierre por archivo y lote). Si el archivo principal está bloqueado
+    (p. ej. abierto en Excel), las filas van a un único archivo de respaldo
+    estable que se incorpora al principal en cuanto vuelve a estar libre.
+    """
+
+    def __init__(self):
+        self._pendientes = deque(maxlen=LOGS_BUFFER_MAXIMO)
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self._detener = False
+        self._descartadas = 0
+        self._lote_en_curso = 0
+        self._bloqueados = set()    # archivos principales bloqueados en el último intento
+        self._con_respaldo = {}     # archivo -> el respaldo tiene filas por incorporar
+
+    def _asegurar_hilo(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._detener = False
+            self._hilo = threading.Thread(target=self._bucle, name="escritor-logs", daemon=True)
+            self._hilo.start()
+
+    def escribir(self, archivo, fila):
+        """Añade una fila al log ``archivo`` (no bloquea)."""
+        with self._condicion:
+            if len(self._pendientes) == self._pendientes.maxlen:
+                self._descartadas += 1
+            self._pendientes.append((archivo, fila))
+            self._asegurar_hilo()
+            if len(self._pendientes) >= LOGS_LOTE:
+                self._condicion.notify_all()
+
+    def vaciar(self, espera=5):
+        """Espera (con límite) a que todo lo pendiente esté en disco."""
+        limite = time.monotonic() + espera
+        with self._condicion:
+            if self._hilo is None or not self._hilo.is_alive():
+                return
+            self._condicion.notify_all()
+            while self._pendientes or self._lote_en_curso:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._condicion.wait(restante)
+
+    def detener(self, espera=5):
+        """Vuelca lo pendiente y termina el hilo."""
+        with self._condicion:
+            if self._hilo is None or not self._hilo.is_alive():
+                return
+            self._detener = True
+            self._condicion.notify_all()
+        self._hilo.join(timeout=espera)
+
+    def _bucle(self):
+        while True:
+            with self._condicion:
+                if not self._pendientes and not self._detener:
+                    self._condicion.wait(LOGS_INTERVALO_SEGUNDOS)
+                lote = list(self._pendientes)
+                self._pendientes.clear()
+                self._lote_en_curso = len(lote)
+                descartadas, self._descartadas = self._descartadas, 0
+                terminar = self._detener
+            if descartadas:
+                print(f"⚠️ Buffer de logs lleno: {descartadas} fila(s) antiguas descartadas")
+            
+            fallidas = []
+            if lote:
+                por_archivo = OrderedDict()
+                for archivo, fila in lote:
+                    por_archivo.setdefault(archivo, []).append(fila)
+                for archivo, filas in por_archivo.items():
+                    if not self._volcar(archivo, filas):
+                        fallidas.extend((archivo, fila) for fila in filas)
+            
+            with self._condicion:
+                if fallidas:
+                    # Ni principal ni respaldo: se reintenta en la siguiente vuelta
+                    self._pendientes.extendleft(reversed(fallidas))
+                self._lote_en_curso = 0
+                self._condicion.notify_all()
+                if terminar and (not self._pendientes or fallidas):
+                    return
+            if fallidas:
+                time.sleep(LOGS_INTERVALO_SEGUNDOS)
+
+    @staticmethod
+    def _anexar(ruta, filas=None, texto=None):
+        with open(ruta, 'a', newline='', encoding='utf-8') as f:
+            if texto:
+                f.write(texto)
+            if filas:
+                csv.writer(f).writerows(filas)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _retirar_respaldo(respaldo):
+        """Quita el respaldo ya incorporado para que un reinicio no lo incorpore de nuevo.
+
+        Se renombra (atómico) y luego se borra; si no se puede renombrar se
+        trunca. Devuelve ``False`` si el respaldo sigue con sus filas.
+        """
+        incorporado = respaldo + '.incorporado'
+        try:
+            os.replace(respaldo, incorporado)
+        except OSError:
+            try:
+                with open(respaldo, 'w', encoding='utf-8'):
+                    pass
+            except OSError as e:
+                print(f"⚠️ No se pudo vaciar {respaldo}: {e}")
+                return False
+            return True
+        try:
+            os.remove(incorporado)
+        except OSError:
+            pass  # con otro nombre ya no se vuelve a incorporar
+        return True
+
+    def _volcar(self, archivo, filas):
+        respaldo = ruta_log_respaldo(archivo)
+        if archivo not in self._con_respaldo:
+            self._con_respaldo[archivo] = os.path.exists(respaldo)
+        try:
+            texto_respaldo = None
+            if self._con_respaldo[archivo]:
+                with open(respaldo, 'r', encoding='utf-8', newline='') as f:
+                    texto_respaldo = f.read()
+            self._anexar(archivo, filas, texto_respaldo)
+        except PermissionError:
+            if archivo not in self._bloqueados:
+                self._bloqueados.add(archivo)
+                print(f"⚠️ No se pudo escribir el log: archivo '{archivo}' en uso o sin permisos")
+                print(f"💡 Sugerencia: Cierra Excel u otros programas que puedan tener abierto el archivo")
+                print(f"📝 Mientras tanto se guarda en: {respaldo}")
+            try:
+                self._anexar(respaldo, filas)
+                self._con_respaldo[archivo] = True
+                return True
+            except Exception as e2:
+                print(f"❌ Error crítico guardando log: {e2}")
+                return False
+        except Exception as e:
+            print(f"❌ Error inesperado al guardar log '{archivo}': {e}")
+            return False
+        
+        if self._con_respaldo[archivo]:
+            # El respaldo ya está en el principal
+            self._con_respaldo[archivo] = not self._retirar_respaldo(respaldo)
+        if archivo in self._bloqueados:
+            self._bloqueados.discard(archivo)
+            print(f"✅ Log '{archivo}' disponible de nuevo (respaldo incorporado)")
+        return True
+
+
+ESCRITOR_LOGS = EscritorLogs()
+atexit.register(ESCRITOR_LOGS.detener)
+
+# =====================================================
+# 🔎 ÍNDICE DEL LOG DE ACCESOS (VISOR PAGINADO)
+# =====================================================
+LOG_VISOR_FILAS_PAGINA = 200
+COLUMNAS_LOG_ACCESOS = ('FECHA', 'ID_USUARIO', 'NOMBRE', 'EMPRESA', 'EVENTO_USUARIO', 'ESTADO', 'RAZON', 'EVENTOS_ACTIVOS')
+
+class IndiceLogAccesos:
+    """Índice por desplazamiento de bytes de un log CSV de accesos.
+
+    Guarda, por cada fila, dónde empieza en el archivo y los campos por los
+    que se filtra (ID, evento y estado). ``actualizar()`` solo lee lo que se
+    añadió desde la última vez; ``leer_filas()`` lee únicamente las filas de
+    la página que se muestra. Una fila puede ocupar varias líneas si un campo
+    entre comillas (p. ej. la razón) contiene saltos de línea.
+    """
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._desplazamientos = []   # inicio de cada fila (bytes)
+        self._ids = []
+        self._eventos = []
+        self._autorizado = bytearray()
+        self._leido_hasta = 0
+
+    def __len__(self):
+        return len(self._desplazamientos)
+
+    def actualizar(self):
+        """Indexa las filas nuevas del archivo. Devuelve cuántas se añadieron."""
+        with self._lock:
+            try:
+                tamano = os.path.getsize(self.archivo)
+            except OSError:
+                self._reiniciar()
+                return 0
+            if tamano < self._leido_hasta:
+                # Archivo truncado o reemplazado: indexar desde el principio
+                self._reiniciar()
+            if tamano == self._leido_hasta:
+                return 0
+            
+            antes = len(self._desplazamientos)
+            with open(self.archivo, 'rb') as f:
+                f.seek(self._leido_hasta)
+                posicion = self._leido_hasta
+                while True:
+                    registro = self._leer_registro(f)
+                    if not registro.endswith(b'\n'):
+                        break  # fila a medio escribir: se indexa en la próxima actualización
+                    inicio = posicion
+                    posicion += len(registro)
+                    campos = self._parsear(registro)
+                    if not campos or campos[0] == COLUMNAS_LOG_ACCESOS[0]:
+                        continue
+                    self._desplazamientos.append(inicio)
+                    self._ids.append(campos[1] if len(campos) > 1 else '')
+                    self._eventos.append(campos[4] if len(campos) > 4 else '')
+                    self._autorizado.append(1 if len(campos) > 5 and campos[5] == 'AUTORIZADO' else 0)
+                self._leido_hasta = posicion
+            return len(self._desplazamientos) - antes
+
+    @staticmethod
+    def _leer_registro(f):
+        """Lee una fila CSV completa: las comillas sin cerrar continúan en la línea siguiente."""
+        registro = b''
+        while True:
+            linea = f.readline()
+            registro += linea
+            if not linea.endswith(b'\n') or registro.count(b'"') % 2 == 0:
+                return registro
+
+    @staticmethod
+    def _parsear(linea):
+        try:
+            return next(csv.reader([linea.decode('utf-8', errors='replace').rstrip('\r\n')]), [])
+        except csv.Error:
+            return []
+
+    def filtrar(self, estado=None, evento='', id_usuario=''):
+        """Números de fila que cumplen el filtro, de la más reciente a la más antigua.
+
+        ``estado`` es 'AUTORIZADO', 'DENEGADO' o None; ``evento`` se compara
+        exacto y ``id_usuario`` como prefijo.
+        """
+        evento = str(evento).strip()
+        id_usuario = str(id_usuario).strip()
+        with self._lock:
+            total = len(self._desplazamientos)
+            if estado is None and not evento and not id_usuario:
+                return range(total - 1, -1, -1)
+            quiere = None if estado is None else (1 if estado == 'AUTORIZADO' else 0)
+            ids, eventos, autorizado = self._ids, self._eventos, self._autorizado
+            return [i for i in range(total - 1, -1, -1)
+                    if (quiere is None or autorizado[i] == quiere)
+                    and (not evento or eventos[i] == evento)
+                    and (not id_usuario or ids[i].startswith(id_usuario))]
+
+    def leer_filas(self, numeros):
+        """Lee del archivo solo las filas indicadas (en ese orden)."""
+        with self._lock:
+            desplazamientos = [self._desplazamientos[n] for n in numeros]
+        filas = []
+        with open(self.archivo, 'rb') as f:
+            for desplazamiento in desplazamientos:
+                f.seek(desplazamiento)
+                campos = self._parsear(self._leer_registro(f))
+                filas.append(campos + [''] * (len(COLUMNAS_LOG_ACCESOS) - len(campos)))
+        return filas
+
 def log_acceso(datos, autorizado, razon=""):
     """Registra los accesos (autorizados y no autorizados)."""
     try:
-        with open(ACCESOS_LOG_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            
-            # Adaptar campos según el origen (MySQL o CSV)
-            id_usuario = datos.get('idUsuario') or datos.get('cedula', '')
-            nombre = datos.get('Nombrecompleto') or f"{datos.get('nombre', '')} {datos.get('apellidos', '')}".strip()
-            empresa = datos.get('Empresa') or datos.get('empresa', '')
-            evento = datos.get('Evento') or datos.get('entrada', '')
-            
-            writer.writerow([
-                datetime.now().isoformat(),
-                id_usuario,
-                nombre,
-                empresa,
-                evento,
-                "AUTORIZADO" if autorizado else "DENEGADO",
-                razon,
-                ','.join(map(str, EVENTOS_ACTIVOS)) if EVENTOS_ACTIVOS else "CSV_MODE"
-            ])
+        # Adaptar campos según el origen (MySQL o CSV)
+        id_usuario = datos.get('idUsuario') or datos.get('cedula', '')
+        nombre = datos.get('Nombrecompleto') or f"{datos.get('nombre', '')} {datos.get('apellidos', '')}".strip()
+        empresa = datos.get('Empresa') or datos.get('empresa', '')
+        evento = datos.get('Evento') or datos.get('entrada', '')
+        
+        ESCRITOR_LOGS.escribir(ACCESOS_LOG_FILE, [
+            datetime.now().isoformat(),
+            id_usuario,
+            nombre,
+            empresa,
+            evento,
+            "AUTORIZADO" if autorizado else "DENEGADO",
+            razon,
+            ','.join(map(str, EVENTOS_ACTIVOS)) if EVENTOS_ACTIVOS else "CSV_MODE"
+        ])
     except Exception as e:
         print(f"Error al escribir log de acceso: {e}")
 
 def buscar_asistente(id_asistente):
-    """Busca un asistente en la base de datos con conexión robusta."""
+    """Busca un asistente en la réplica local y, si no está, en la base de datos usando el pool de conexiones.
+
+    Con conexión, comida/pirata de la réplica se confirman contra MySQL (otra
+    estación pudo marcarlos después de la descarga).
+    """
     try:
         print(f"🔍 Buscando asistente ID: {id_asistente}...")
         
-        # Intentar con PyMySQL primero
-        try:
-            import pymysql
-            conn = pymysql.connect(
-                host=DB_CONFIG['host'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password'],
-                database=DB_CONFIG['database'],
-                connect_timeout=10
-            )
-            
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM asistentes WHERE idUsuario=%s", (id_asistente,))
-            fila = cursor.fetchone()
-            
-            if fila:
-                cursor.execute("DESCRIBE asistentes")
-                columnas = [desc[0] for desc in cursor.fetchall()]
-                row = {columnas[i]: fila[i] for i in range(min(len(fila), len(columnas)))}
-            else:
-                row = None
-                
-            cursor.close()
-            conn.close()
-            
+        row = REPLICA_MYSQL.buscar(id_asistente)
+        if row:
+            row = REPLICA_MYSQL.confirmar(row)
             if row:
-                print(f"✅ Asistente encontrado con PyMySQL")
-            else:
-                print(f"⚠️ Asistente no encontrado")
-            return row
-            
-        except ImportError:
-            print("📌 PyMySQL no disponible, usando mysql.connector con charset latin1...")
-            # Si no está disponible PyMySQL, usar mysql.connector básico
-            conn = mysql.connector.connect(
-                host=DB_CONFIG['host'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password'],
-                database=DB_CONFIG['database'],
-                charset='latin1'
-            )
-            
+                print("✅ Asistente encontrado en la réplica local")
+                return row
+            # Ya no está en MySQL con ese evento: se busca de nuevo por si cambió de evento
+        
+        def _consulta(conn):
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM asistentes WHERE idUsuario=%s", (id_asistente,))
-            fila = cursor.fetchone()
-            
-            if fila:
-                cursor.execute("DESCRIBE asistentes")
-                columnas = [desc[0] for desc in cursor.fetchall()]
-                row = {columnas[i]: fila[i] for i in range(min(len(fila), len(columnas)))}
-            else:
-                row = None
-                
-            cursor.close()
-            conn.close()
-            
-            if row:
-                print(f"✅ Asistente encontrado con mysql.connector")
-            else:
-                print(f"⚠️ Asistente no encontrado")
-            return row
+            try:
+                cursor.execute("SELECT * FROM asistentes WHERE idUsuario=%s", (id_asistente,))
+                fila = cursor.fetchone()
+
+                # Las columnas salen de cursor.description (sin consulta DESCRIBE extra)
+                return ESQUEMA.fila_a_diccionario(DB_CONFIG['database'], 'asistentes', cursor, fila)
+            finally:
+                cursor.close()
+        
+        pool = obtener_pool(DB_CONFIG)
+        row = pool.ejecutar(_consulta)
+        
+        if row:
+            print(f"✅ Asistente encontrado con {pool.driver}")
+            REPLICA_MYSQL.guardar([row])
+        else:
+            print(f"⚠️ Asistente no encontrado")
+        return row
             
     except Exception as e:
         print(f"❌ Error al buscar asistente: {e}")
         return None
 
+# Columnas que necesitan la tabla de usuarios y las etiquetas en lote
+LISTADO_COLUMNAS = ('idUsuario', 'Nombrecompleto', 'apellidos', 'Empresa', 'entrada',
+                    'Evento', 'comida', 'pirata', 'Dia', 'Pagado')
+LISTADO_PAGINA = 500   # Filas por página leídas del cursor de servidor
+
+def cursor_servidor(conn):
+    """Cursor sin búfer: las filas se leen del servidor a medida que se piden."""
+    if PYMYSQL_AVAILABLE:
+        return conn.cursor(pymysql.cursors.SSCursor)
+    return conn.cursor(buffered=False)
+
+def listar_asistentes(eventos, al_recibir_pagina, pagina=LISTADO_PAGINA):
+    """Lee los asistentes de ``eventos`` ordenados por nombre y los entrega por páginas.
+
+    Solo se piden las columnas de ``LISTADO_COLUMNAS`` que existen en la tabla
+    (la primera vez, sin esquema conocido, se piden todas). Cada página se
+    pasa a ``al_recibir_pagina(filas)`` en cuanto llega; si devuelve ``False``
+    se deja de leer. Devuelve el número de filas entregadas.
+    """
+    base = DB_CONFIG['database']
+    reales = {c.lower(): c for c in ESQUEMA.conocidas(base, 'asistentes')}
+    if reales:
+        seleccion = ", ".join(f"`{reales[c.lower()]}`" for c in LISTADO_COLUMNAS if c.lower() in reales)
+        tabla_esquema = 'asistentes_listado'  # no pisar las columnas completas de 'asistentes'
+    else:
+        seleccion, tabla_esquema = "*", 'asistentes'
+    marcadores = ", ".join(["%s"] * len(eventos))
+    # idUsuario y Evento desempatan: el reintento salta filas por posición y el orden debe ser total
+    consulta = (f"SELECT {seleccion} FROM asistentes WHERE Evento IN ({marcadores}) "
+                f"ORDER BY Nombrecompleto, apellidos, idUsuario, Evento")
+    entregadas = 0
+    
+    def _consulta(conn):
+        nonlocal entregadas
+        cursor = cursor_servidor(conn)
+        leidas = 0  # si el pool reintenta tras perder la conexión, se saltan las ya entregadas
+        try:
+            cursor.execute(consulta, list(eventos))
+            while True:
+                filas = cursor.fetchmany(pagina)
+                if not filas:
+                    return
+                saltar = max(0, entregadas - leidas)
+                leidas += len(filas)
+                if saltar >= len(filas):
+                    continue
+                filas = ESQUEMA.filas_a_diccionarios(base, tabla_esquema, cursor, filas[saltar:])
+                entregadas += len(filas)
+                if al_recibir_pagina(filas) is False:
+                    if not PYMYSQL_AVAILABLE:
+                        conn.consume_results()  # SSCursor de PyMySQL descarta el resto al cerrarse
+                    return
+        finally:
+            cursor.close()
+    
+    ejecutar_consulta(DB_CONFIG, _consulta)
+    return entregadas
+
+# =====================================================
+# 🏢 CACHÉ DE NOMBRES DE EMPRESA (comp4n1)
+# =====================================================
+EMPRESAS_CACHE_MAXIMO = 5000       # Entradas máximas (LRU)
+EMPRESAS_TTL_SEGUNDOS = 1800       # Vigencia de un nombre resuelto
+EMPRESAS_TTL_FALLO = 60            # Vigencia de un ID que no se pudo resolver
+EMPRESAS_LOTE_PRECARGA = 500       # IDs por consulta WHERE id IN (...)
+
+class CacheEmpresas:
+    """Caché LRU con caducidad de id de empresa → nombre."""
+
+    def __init__(self, maximo=EMPRESAS_CACHE_MAXIMO):
+        self.maximo = maximo
+        self._entradas = OrderedDict()  # id -> (nombre, caduca_en)
+        self._lock = threading.Lock()
+
+    def obtener(self, empresa_id):
+        """Devuelve el nombre en caché o ``None`` si no está o caducó."""
+        with self._lock:
+            entrada = self._entradas.get(empresa_id)
+            if entrada is None:
+                return None
+            nombre, caduca_en = entrada
+            if time.monotonic() >= caduca_en:
+                del self._entradas[empresa_id]
+                return None
+            self._entradas.move_to_end(empresa_id)
+            return nombre
+
+    def guardar(self, empresa_id, nombre, ttl=EMPRESAS_TTL_SEGUNDOS):
+        with self._lock:
+            self._entradas[empresa_id] = (nombre, time.monotonic() + ttl)
+            self._entradas.move_to_end(empresa_id)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+CACHE_EMPRESAS = CacheEmpresas()
+
 def obtener_nombre_empresa(empresa_id):
     """Obtiene el nombre de la empresa desde comp4n1 si es un ID numérico."""
     if not empresa_id:
@@ -309,67 +1142,101 @@ def obtener_nombre_empresa(empresa_id):
     except (ValueError, AttributeError):
         return str(empresa_id)
     
+    # Resolución en memoria (precargada al seleccionar eventos)
+    nombre = CACHE_EMPRESAS.obtener(empresa_id_int)
+    if nombre is not None:
+        return nombre
+    
+    nombre = REPLICA_MYSQL.nombre_empresa(empresa_id_int)
+    if nombre is not None:
+        CACHE_EMPRESAS.guardar(empresa_id_int, nombre)
+        return nombre
+    
+    def _consulta(conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT Nombre FROM comp4n1 WHERE id=%s", (empresa_id_int,))
+            return cursor.fetchone()
+        finally:
+            cursor.close()
+    
     # Es numérico, consultar base de datos
     # Probar primero con DB_CONFIG_EVENTOS, luego con DB_CONFIG
     for config_name, config in [("eventos", DB_CONFIG_EVENTOS), ("principal", DB_CONFIG)]:
         try:
-            # Intentar con PyMySQL primero
-            try:
-                import pymysql
-                conn = pymysql.connect(
-                    host=config['host'],
-                    user=config['user'],
-                    password=config['password'],
-                    database=config['database'],
-                    connect_timeout=5
-                )
-                
-                cursor = conn.cursor()
-                cursor.execute("SELECT Nombre FROM comp4n1 WHERE id=%s", (empresa_id_int,))
-                resultado = cursor.fetchone()
-                
-                cursor.close()
-                conn.close()
-                
-                if resultado and resultado[0]:
-                    print(f"✅ Empresa {empresa_id} → {resultado[0]} (desde {config_name})")
-                    return resultado[0]
-                    
-            except ImportError:
-                # Fallback a mysql.connector
-                import mysql.connector
-                conn = mysql.connector.connect(
-                    host=config['host'],
-                    user=config['user'],
-                    password=config['password'],
-                    database=config['database'],
-                    charset='latin1'
-                )
-                
-                cursor = conn.cursor()
-                cursor.execute("SELECT Nombre FROM comp4n1 WHERE id=%s", (empresa_id_int,))
-                resultado = cursor.fetchone()
-                
-                cursor.close()
-                conn.close()
-                
-                if resultado and resultado[0]:
-                    print(f"✅ Empresa {empresa_id} → {resultado[0]} (desde {config_name})")
-                    return resultado[0]
+            resultado = ejecutar_consulta(config, _consulta)
+            
+            if resultado and resultado[0]:
+                print(f"✅ Empresa {empresa_id} → {resultado[0]} (desde {config_name})")
+                CACHE_EMPRESAS.guardar(empresa_id_int, resultado[0])
+                return resultado[0]
                     
         except Exception as e:
             print(f"⚠️ Error obteniendo empresa desde {config_name}: {e}")
             continue
     
-    # Si no se encontró en ninguna BD
+    # Si no se encontró en ninguna BD (se recuerda poco tiempo para no reintentar en cada etiqueta)
     print(f"❌ No se encontró nombre para empresa ID: {empresa_id}")
+    CACHE_EMPRESAS.guardar(empresa_id_int, str(empresa_id), ttl=EMPRESAS_TTL_FALLO)
     return str(empresa_id)
 
+def precargar_nombres_empresas(ids_empresa):
+    """Resuelve en bloque (``WHERE id IN (...)``) los nombres que aún no están en caché.
 
-def obtener_nombre_evento(evento_id, eventos_cargados=None):
-    """Obtiene el nombre del evento desde los eventos cargados en memoria."""
-    if not evento_id:
-        return "Evento no especificado"
+    Devuelve el número de empresas cargadas.
+    """
+    pendientes = set()
+    for empresa_id in ids_empresa:
+        try:
+            empresa_id_int = int(str(empresa_id).strip())
+        except (ValueError, TypeError, AttributeError):
+            continue
+        if CACHE_EMPRESAS.obtener(empresa_id_int) is not None:
+            continue
+        nombre = REPLICA_MYSQL.nombre_empresa(empresa_id_int)
+        if nombre is not None:
+            CACHE_EMPRESAS.guardar(empresa_id_int, nombre)
+        else:
+            pendientes.add(empresa_id_int)
+    if not pendientes:
+        return 0
+    
+    pendientes = sorted(pendientes)
+    cargadas = 0
+    for config_name, config in [("eventos", DB_CONFIG_EVENTOS), ("principal", DB_CONFIG)]:
+        if not pendientes:
+            break
+        try:
+            for inicio in range(0, len(pendientes), EMPRESAS_LOTE_PRECARGA):
+                lote = pendientes[inicio:inicio + EMPRESAS_LOTE_PRECARGA]
+                
+                def _consulta(conn, lote=lote):
+                    cursor = conn.cursor()
+                    try:
+                        marcadores = ", ".join(["%s"] * len(lote))
+                        cursor.execute(f"SELECT id, Nombre FROM comp4n1 WHERE id IN ({marcadores})", lote)
+                        return cursor.fetchall()
+                    finally:
+                        cursor.close()
+                
+                for empresa_id, nombre in ejecutar_consulta(config, _consulta):
+                    if nombre:
+                        CACHE_EMPRESAS.guardar(int(empresa_id), nombre)
+                        cargadas += 1
+            # Lo que no apareció en esta base se intenta en la siguiente
+            pendientes = [e for e in pendientes if CACHE_EMPRESAS.obtener(e) is None]
+        except Exception as e:
+            print(f"⚠️ Error precargando empresas desde {config_name}: {e}")
+            continue
+    
+    print(f"🏢 Precarga de empresas: {cargadas} nombres en caché")
+    return cargadas
+
+
+def obtener_nombre_evento(evento_id, eventos_cargados=None):
+    """Obtiene el nombre del evento desde los eventos cargados en memoria."""
+    if not evento_id:
+        return "Evento no especificado"
     
     try:
         evento_id = int(evento_id)
@@ -382,6 +1249,11 @@ def obtener_nombre_evento(evento_id, eventos_cargados=None):
         # por lo que necesitamos una instancia para obtener los eventos
         return f"Evento ID: {evento_id}"
     
+    # Índice por id (CatalogoEventos.por_id): búsqueda directa
+    if isinstance(eventos_cargados, dict):
+        evento = eventos_cargados.get(evento_id, {})
+        return evento.get('Nombre', f"Evento ID: {evento_id}")
+    
     # Buscar en los eventos cargados
     for evento in eventos_cargados:
         if evento.get('id') == evento_id:
@@ -395,64 +1267,31 @@ def marcar_comida(id_usuario, sistema=None):
         print(f"🍽️ Marcando comida para usuario ID: {id_usuario}...")
         
         # Si se pasa la instancia del sistema, verificar si estamos en modo CSV
-        if sistema and sistema.modo_csv and sistema.datos_csv is not None:
+        if sistema and sistema.modo_csv and sistema.hay_datos_csv():
             return sistema.marcar_comida_csv(id_usuario)
         
+        # Asistente replicado: la marca se aplica en local y se envía a MySQL en segundo plano
+        if REPLICA_MYSQL.marcar(id_usuario, 'comida', 1):
+            print(f"✅ Comida marcada para usuario {id_usuario} ({REPLICA_MYSQL.pendientes()} marca(s) pendientes de enviar)")
+            return True
+        
+        def _actualizar(conn):
+            cursor = conn.cursor()
+            try:
+                cursor.execute("UPDATE asistentes SET comida = 1 WHERE idUsuario = %s", (id_usuario,))
+                conn.commit()
+                return cursor.rowcount
+            finally:
+                cursor.close()
+        
         # Modo MySQL: intentar en ambas bases de datos
         for config_name, config in [("principal", DB_CONFIG), ("eventos", DB_CONFIG_EVENTOS)]:
             try:
-                # Intentar con PyMySQL primero
-                try:
-                    import pymysql
-                    conn = pymysql.connect(
-                        host=config['host'],
-                        user=config['user'],
-                        password=config['password'],
-                        database=config['database'],
-                        connect_timeout=10
-                    )
-                    
-                    cursor = conn.cursor()
-                    cursor.execute("UPDATE asistentes SET comida = 1 WHERE idUsuario = %s", (id_usuario,))
-                    conn.commit()
-                    
-                    if cursor.rowcount > 0:
-                        print(f"✅ Comida marcada exitosamente para usuario {id_usuario} en base {config_name}")
-                        cursor.close()
-                        conn.close()
-                        return True
-                    else:
-                        print(f"🔍 Usuario {id_usuario} no encontrado en base {config_name}")
-                        
-                    cursor.close()
-                    conn.close()
-                    
-                except ImportError:
-                    print(f"📌 PyMySQL no disponible, usando mysql.connector en base {config_name}...")
-                    # Fallback con mysql.connector
-                    import mysql.connector
-                    conn = mysql.connector.connect(
-                        host=config['host'],
-                        user=config['user'],
-                        password=config['password'],
-                        database=config['database'],
-                        charset='latin1'
-                    )
-                    
-                    cursor = conn.cursor()
-                    cursor.execute("UPDATE asistentes SET comida = 1 WHERE idUsuario = %s", (id_usuario,))
-                    conn.commit()
-                    
-                    if cursor.rowcount > 0:
-                        print(f"✅ Comida marcada exitosamente para usuario {id_usuario} en base {config_name}")
-                        cursor.close()
-                        conn.close()
-                        return True
-                    else:
-                        print(f"🔍 Usuario {id_usuario} no encontrado en base {config_name}")
-                        
-                    cursor.close()
-                    conn.close()
+                if ejecutar_consulta(config, _actualizar) > 0:
+                    print(f"✅ Comida marcada exitosamente para usuario {id_usuario} en base {config_name}")
+                    return True
+                else:
+                    print(f"🔍 Usuario {id_usuario} no encontrado en base {config_name}")
                     
             except Exception as e:
                 print(f"❌ Error conectando a base {config_name}: {e}")
@@ -466,27 +1305,111 @@ def marcar_comida(id_usuario, sistema=None):
         print(f"❌ Error al marcar comida para usuario {id_usuario}: {e}")
         return False
 
-def generar_etiqueta(datos, nombre_evento=None, version_impresion=False):
+# =====================================================
+# 🔳 CÓDIGOS QR (MATRICES CACHEADAS)
+# =====================================================
+QR_CACHE_MAXIMO = 10000   # Matrices guardadas (LRU) como mínimo; ~1 KB cada una
+QR_CACHE_MARGEN = 1000    # Hueco sobre los precargados para los IDs que lleguen después
+QR_BORDE = 2              # Módulos de margen blanco
+
+_QR_MATRICES = OrderedDict()  # idUsuario -> (lado en módulos, bytes 0/255 por módulo)
+_QR_LOCK = threading.Lock()
+_qr_capacidad = QR_CACHE_MAXIMO  # crece con la precarga para que no expulse sus propias entradas
+
+def matriz_qr(id_usuario):
+    """Codifica ``id_usuario`` una sola vez y devuelve ``(lado, bytes)`` con 0=negro, 255=blanco."""
+    clave = str(id_usuario)
+    with _QR_LOCK:
+        matriz = _QR_MATRICES.get(clave)
+        if matriz is not None:
+            _QR_MATRICES.move_to_end(clave)
+            return matriz
+    
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        border=QR_BORDE
+    )
+    qr.add_data(clave)
+    qr.make(fit=True)
+    filas = qr.get_matrix()
+    matriz = (len(filas), bytes(0 if modulo else 255 for fila in filas for modulo in fila))
+    
+    with _QR_LOCK:
+        _QR_MATRICES[clave] = matriz
+        while len(_QR_MATRICES) > _qr_capacidad:
+            _QR_MATRICES.popitem(last=False)
+    return matriz
+
+def imagen_qr(id_usuario, tamano_maximo):
+    """Rasteriza el QR con el mayor tamaño de módulo entero que cabe en ``tamano_maximo`` (sin remuestreo)."""
+    lado, modulos = matriz_qr(id_usuario)
+    modulo = max(1, tamano_maximo // lado)
+    img = Image.frombytes('L', (lado, lado), modulos)
+    # NEAREST con factor entero solo replica píxeles: bordes de módulo exactos
+    return img.resize((lado * modulo, lado * modulo), Image.NEAREST)
+
+def precargar_qr(ids_usuario):
+    """Codifica por adelantado los QR de ``ids_usuario`` (se ejecuta en segundo plano).
+
+    La capacidad de la caché se ajusta al número de asistentes precargados.
     """
-    Genera etiqueta con dos versiones:
-    - version_impresion=False: Versión con colores para vista previa
-    - version_impresion=True: Versión original en blanco para impresión
+    global _qr_capacidad
+    ids_usuario = list(ids_usuario)
+    with _QR_LOCK:
+        _qr_capacidad = max(_qr_capacidad, len(ids_usuario) + QR_CACHE_MARGEN)
+    generados = 0
+    for id_usuario in ids_usuario:
+        if id_usuario is None or str(id_usuario).strip() == '':
+            continue
+        matriz_qr(str(id_usuario).strip())
+        generados += 1
+    print(f"🔳 Precarga de QR: {generados} códigos en caché")
+    return generados
+
+# =====================================================
+# 🏷️ MOTOR DE ETIQUETAS (LAYOUT ÚNICO, DOS TEMAS)
+# =====================================================
+ETIQUETA_ANCHO_IMPRESION = 696   # ancho físico (62 mm a 300 dpi)
+ETIQUETA_LARGO = 1200            # largo etiqueta
+# brother_ql recibe directamente la etiqueta de impresión a 1 bit (sin conversión RGB → mono);
+# el driver de Windows sigue recibiendo RGB
+MODO_IMPRESION = 'RGB' if IS_WINDOWS else '1'
+
+def campos_etiqueta(datos):
+    """Campos del asistente que intervienen en la etiqueta (MySQL o CSV)."""
+    return {
+        'nombre': datos.get('Nombrecompleto') or datos.get('nombre', ''),
+        'apellidos': datos.get('Apellidos') or datos.get('apellidos', ''),  # Buscar Apellidos (mayúscula) primero
+        'empresa_id': datos.get('Empresa') or datos.get('empresa', ''),
+        'dias': datos.get('Dia', '1'),  # Valor por defecto para CSV
+        'id_usuario': datos.get('idUsuario') or datos.get('cedula', ''),
+        'tipo_entrada': datos.get('Entrada') or datos.get('entrada', 'Congreso'),  # Buscar Entrada (mayúscula) primero
+        'pagado': datos.get('Pagado') or datos.get('pagado', '0'),  # Campo para verificar si está pagado
+    }
+
+def calcular_layout_etiqueta(datos, nombre_evento=None, empresa=None):
+    """
+    Calcula una sola vez todo lo que comparten la vista previa y la impresión:
+    textos ya resueltos y partidos en líneas, fuentes, colores del tema de
+    vista previa y la imagen del QR. ``rasterizar_etiqueta`` dibuja cada tema
+    a partir de este layout. ``empresa`` permite pasar el nombre ya resuelto.
     """
-    from PIL import Image, ImageDraw, ImageFont
-    import qrcode
+    from PIL import Image, ImageDraw
 
     # Adaptar campos según el origen (MySQL o CSV)
-    nombre = datos.get('Nombrecompleto') or datos.get('nombre', '')
-    apellidos = datos.get('Apellidos') or datos.get('apellidos', '')  # Buscar Apellidos (mayúscula) primero
-    empresa_id = datos.get('Empresa') or datos.get('empresa', '')
-    dias = datos.get('Dia', '1')  # Valor por defecto para CSV
-    id_usuario = datos.get('idUsuario') or datos.get('cedula', '')
-    tipo_entrada = datos.get('Entrada') or datos.get('entrada', 'Congreso')  # Buscar Entrada (mayúscula) primero
-    pagado = datos.get('Pagado') or datos.get('pagado', '0')  # Campo para verificar si está pagado
+    campos = campos_etiqueta(datos)
+    nombre = campos['nombre']
+    apellidos = campos['apellidos']
+    empresa_id = campos['empresa_id']
+    id_usuario = campos['id_usuario']
+    tipo_entrada = campos['tipo_entrada']
+    pagado = campos['pagado']
     
     # Convertir ID de empresa a nombre si es necesario
-    empresa = obtener_nombre_empresa(empresa_id)
-    print(f"🏢 DEBUG Empresa: ID='{empresa_id}' → Nombre='{empresa}'")
+    if empresa is None:
+        empresa = obtener_nombre_empresa(empresa_id)
+        print(f"🏢 DEBUG Empresa: ID='{empresa_id}' → Nombre='{empresa}'")
     
     # Construir nombre completo si viene por separado (CSV)
     if not nombre and datos.get('nombre'):
@@ -507,96 +1430,66 @@ def generar_etiqueta(datos, nombre_evento=None, version_impresion=False):
     # ===============================================
     # 🔤 NORMALIZAR NOMBRES PARA COMPARACIONES
     # ===============================================
-    # Definir al inicio para que estén disponibles en toda la función
     evento_lower = nombre_evento.lower() if nombre_evento else ''
     tipo_lower = tipo_entrada.lower() if tipo_entrada else ''
 
     # ===============================================
-    # 🎨 SISTEMA DE COLORES SOLO PARA VISTA PREVIA
+    # 🎨 COLORES DEL TEMA DE VISTA PREVIA
     # ===============================================
+    # Determinar color de fondo según el tipo de entrada y evento
+    fondo_color = 'white'  # Color por defecto
     
-    if version_impresion:
-        # VERSIÓN IMPRESIÓN: Fondo blanco tradicional
-        fondo_color = 'white'
-        banda_color = None  # Sin banda de color
-    else:
-        # VERSIÓN VISTA PREVIA: Con colores para identificación
-        # Determinar color de fondo según el tipo de entrada y evento
-        fondo_color = 'white'  # Color por defecto
-        
-        if 'expo' in tipo_lower:
-            # REGLA ESPECIAL: TODAS las entradas EXPO → fondo negro
-            fondo_color = "#2C2C2C"  # Gris muy oscuro/negro para EXPO
-        elif 'lpn congress' in evento_lower or 'lpn' in evento_lower:
-            # LPN Congress - Congress normal
-            if 'congress' in tipo_lower:
-                fondo_color = "#FFCB6B"  # Amarillo para Congress
-            else:
-                fondo_color = '#E6F3FF'  # Azul claro para otros LPN
-        elif 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower:
-            # porciFORUM LATAM - Congress normal
-            if 'congress' in tipo_lower:
-                fondo_color = '#FFF0F5'  # Rosa claro para Congress
-            else:
-                fondo_color = '#F8F8FF'  # Blanco fantasma para otros
+    if 'expo' in tipo_lower:
+        # REGLA ESPECIAL: TODAS las entradas EXPO → fondo negro
+        fondo_color = "#2C2C2C"  # Gris muy oscuro/negro para EXPO
+    elif 'lpn congress' in evento_lower or 'lpn' in evento_lower:
+        # LPN Congress - Congress normal
+        if 'congress' in tipo_lower:
+            fondo_color = "#FFCB6B"  # Amarillo para Congress
         else:
-            # Otros eventos - mantener blanco o color neutro
-            fondo_color = '#F8F8FF'  # Ghost White - Blanco con tinte azul muy sutil
-
-    PRINT_WIDTH = 696   # ancho físico (62 mm a 300 dpi)
-    LARGO = 1200        # largo etiqueta
-    W, H = LARGO, PRINT_WIDTH
-    
-    # Crear imagen con el fondo apropiado
-    img = Image.new('RGB', (W, H), fondo_color)
-    draw = ImageDraw.Draw(img)
-
-    # Cargar fuentes según el sistema operativo
-    font_name, font_empresa, font_dias, font_entrada_evento = load_fonts()
+            fondo_color = '#E6F3FF'  # Azul claro para otros LPN
+    elif 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower:
+        # porciFORUM LATAM - Congress normal
+        if 'congress' in tipo_lower:
+            fondo_color = '#FFF0F5'  # Rosa claro para Congress
+        else:
+            fondo_color = '#F8F8FF'  # Blanco fantasma para otros
+    else:
+        # Otros eventos - mantener blanco o color neutro
+        fondo_color = '#F8F8FF'  # Ghost White - Blanco con tinte azul muy sutil
 
-    # ===============================================
-    # 🌈 BANDA DE COLOR SUPERIOR SOLO PARA VISTA PREVIA
-    # ===============================================
-    
-    banda_color = None
-    banda_height = 15  # Altura de la banda en píxeles
-    
-    if not version_impresion:  # Solo en vista previa, no en impresión
-        if 'lpn congress' in evento_lower or 'lpn' in evento_lower:
-            # LPN Congress - Bandas diferenciadas
-            if 'expo' in tipo_lower:
-                banda_color = '#808080'  # Naranja vibrante para Expo
-            elif 'congress' in tipo_lower:
-                banda_color = '#FF6B35'  # Azul Dodger para Congress
-            else:
-                banda_color = "#3DAF3D"  # Verde Lima para otros LPN
-        elif 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower:
-            # porciFORUM LATAM - Color distintivo
-            banda_color = '#1E90FF'  # Crimson - Rojo vibrante
+    # Banda de color superior
+    if 'lpn congress' in evento_lower or 'lpn' in evento_lower:
+        # LPN Congress - Bandas diferenciadas
+        if 'expo' in tipo_lower:
+            banda_color = '#808080'  # Naranja vibrante para Expo
+        elif 'congress' in tipo_lower:
+            banda_color = '#FF6B35'  # Azul Dodger para Congress
         else:
-            # Otros eventos - banda gris sutil
-            banda_color = '#1E90FF'  # Slate Gray
-        
-        # Dibujar banda de color en la parte superior
-        if banda_color:
-            draw.rectangle([0, 0, W, banda_height], fill=banda_color, outline=banda_color)
+            banda_color = "#3DAF3D"  # Verde Lima para otros LPN
+    elif 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower:
+        # porciFORUM LATAM - Color distintivo
+        banda_color = '#1E90FF'  # Crimson - Rojo vibrante
+    else:
+        # Otros eventos - banda gris sutil
+        banda_color = '#1E90FF'  # Slate Gray
 
+    W, H = ETIQUETA_LARGO, ETIQUETA_ANCHO_IMPRESION
     pad = 25
     qr_ancho = int(W * 0.40)
     texto_w = W - qr_ancho - (pad * 3)
-    texto_x = pad
+
+    # Cargar fuentes según el sistema operativo
+    font_name, font_empresa, font_dias, font_entrada_evento = load_fonts()
     
-    # Ajustar posición inicial según si hay banda o no
-    if banda_color:  # Si hay banda (solo en vista previa)
-        y_pos = pad + banda_height + 5
-    else:  # Si no hay banda (impresión)
-        y_pos = pad
+    # Lienzo auxiliar solo para medir texto (las medidas no dependen del tema)
+    medidor = ImageDraw.Draw(Image.new('RGB', (1, 1)))
 
     def wrap(text, font, max_w):
         palabras, lineas, actual = text.split(), [], ""
         for p in palabras:
             prueba = (actual + " " + p).strip()
-            if draw.textlength(prueba, font=font) <= max_w:
+            if medidor.textlength(prueba, font=font) <= max_w:
                 actual = prueba
             else:
                 if actual: lineas.append(actual)
@@ -607,18 +1500,78 @@ def generar_etiqueta(datos, nombre_evento=None, version_impresion=False):
     # INDICADOR DE ENTRADA PAGADA - "P" en recuadro negro
     # Solo mostrar para LPN y porciFORUM LATAM
     es_evento_con_pagado = ('lpn' in evento_lower or 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower)
-    
+    p_font = None
     if str(pagado) == '1' and es_evento_con_pagado:  # Si está pagado Y es evento LPN/porciFORUM
-        # Configuración del recuadro
-        p_font_size = 40
-        try:
-            p_font = ImageFont.truetype("arial.ttf", p_font_size)
-        except:
-            try:
-                p_font = ImageFont.truetype("DejaVuSans-Bold.ttf", p_font_size)
-            except:
-                p_font = ImageFont.load_default()
-        
+        p_font = fuente_pagado(40)
+
+    # TIPO DE ENTRADA - solo para LPN Congress y porciFORUM LATAM
+    es_evento_con_tipos = ('lpn' in evento_lower or 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower)
+    descripcion_pulsera = ""
+    if 'lpn congress' in evento_lower or 'lpn' in evento_lower:
+        if 'expo' in tipo_lower:
+            descripcion_pulsera = " • PULSERA EXPO"
+        elif 'congress' in tipo_lower:
+            descripcion_pulsera = " • PULSERA CONGRESS"
+        else:
+            descripcion_pulsera = " • PULSERA LPN"
+    elif 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower:
+        descripcion_pulsera = " • PULSERA LATAM"
+
+    # QR (más pequeño: 75% del alto disponible), centrado en su hueco a tamaño de módulo entero
+    qr_size = int((H - pad*2) * 0.75)
+    qr_img = imagen_qr(str(id_usuario), qr_size)
+    qr_margen = (qr_size - qr_img.width) // 2
+
+    return {
+        'W': W, 'H': H, 'pad': pad,
+        'texto_x': pad,
+        'fondo_color': fondo_color,
+        'banda_color': banda_color,
+        'banda_height': 15,  # Altura de la banda en píxeles
+        'p_font': p_font,
+        'lineas_nombre': wrap(nombre + " " + apellidos, font_name, texto_w)[:2],
+        'tipo_entrada': tipo_entrada if (tipo_entrada and es_evento_con_tipos) else '',
+        'descripcion_pulsera': descripcion_pulsera,
+        'lineas_evento': wrap(f" - {nombre_evento}", font_entrada_evento, texto_w)[:2],
+        'lineas_empresa': wrap(empresa, font_empresa, texto_w)[:3],
+        'font_name': font_name,
+        'font_empresa': font_empresa,
+        'font_entrada_evento': font_entrada_evento,
+        'qr_img': qr_img,
+        'qr_x': W - qr_ancho + (qr_ancho - qr_size)//2 - pad + qr_margen,
+        'qr_y': (H - qr_size)//2 + qr_margen,
+    }
+
+def rasterizar_etiqueta(layout, version_impresion=False, modo='RGB'):
+    """
+    Dibuja un layout calculado con ``calcular_layout_etiqueta``:
+    - version_impresion=False: Versión con colores para vista previa
+    - version_impresion=True: Versión original en blanco para impresión
+    ``modo='1'`` dibuja la versión de impresión directamente en blanco y negro.
+    """
+    from PIL import Image, ImageDraw
+
+    W, H = layout['W'], layout['H']
+    texto_x = layout['texto_x']
+    font_entrada_evento = layout['font_entrada_evento']
+    
+    # VERSIÓN IMPRESIÓN: fondo blanco y sin banda; VISTA PREVIA: colores del evento
+    fondo_color = 'white' if version_impresion else layout['fondo_color']
+    banda_color = None if version_impresion else layout['banda_color']
+    
+    img = Image.new(modo, (W, H), fondo_color)
+    draw = ImageDraw.Draw(img)
+
+    # Banda de color superior solo para vista previa
+    if banda_color:
+        draw.rectangle([0, 0, W, layout['banda_height']], fill=banda_color, outline=banda_color)
+        y_pos = layout['pad'] + layout['banda_height'] + 5
+    else:
+        y_pos = layout['pad']
+
+    # INDICADOR DE ENTRADA PAGADA
+    p_font = layout['p_font']
+    if p_font is not None:
         # Dimensiones del recuadro - SIN padding extra
         p_texto = "P"
         bbox = draw.textbbox((0, 0), p_texto, font=p_font)
@@ -626,13 +1579,11 @@ def generar_etiqueta(datos, nombre_evento=None, version_impresion=False):
         p_alto = bbox[3] - bbox[1] + 8    # padding vertical reducido
         
         # Posición del recuadro (izquierda, encima del nombre)
-        p_x = texto_x  # Alineado con el texto a la izquierda
+        p_x = texto_x
         p_y = y_pos
         
-        # Dibujar recuadro negro
+        # Dibujar recuadro negro con la "P" en blanco centrada
         draw.rectangle([p_x, p_y, p_x + p_ancho, p_y + p_alto], fill='black', outline='black')
-        
-        # Dibujar "P" en blanco centrada
         texto_x_p = p_x + (p_ancho - (bbox[2] - bbox[0])) // 2
         texto_y_p = p_y + (p_alto - (bbox[3] - bbox[1])) // 2
         draw.text((texto_x_p, texto_y_p), p_texto, font=p_font, fill='white')
@@ -641,306 +1592,2282 @@ def generar_etiqueta(datos, nombre_evento=None, version_impresion=False):
         y_pos += p_alto + 5
 
     # NOMBRE
-    for linea in wrap(nombre + " " + apellidos, font_name, texto_w)[:2]:
-        draw.text((texto_x, y_pos), linea, font=font_name, fill='black')
+    for linea in layout['lineas_nombre']:
+        draw.text((texto_x, y_pos), linea, font=layout['font_name'], fill='black')
         y_pos += 110  # más separación
 
     # TIPO DE ENTRADA - formato según versión
-    # Solo mostrar para LPN Congress y porciFORUM LATAM
-    es_evento_con_tipos = ('lpn' in evento_lower or 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower)
+    tipo_entrada = layout['tipo_entrada']
+    if tipo_entrada:
+        if not version_impresion:
+            # VERSIÓN VISTA PREVIA: Con colores y descripción de pulsera
+            texto_tipo = tipo_entrada + layout['descripcion_pulsera']
+            # Usar el color de la banda como fondo (o negro por defecto)
+            fondo_tipo = banda_color if banda_color else 'black'
+        else:
+            # VERSIÓN IMPRESIÓN: Formato original simple con fondo negro
+            texto_tipo = tipo_entrada
+            fondo_tipo = 'black'
+        
+        bbox_tipo = draw.textbbox((0, 0), texto_tipo, font=font_entrada_evento)
+        texto_ancho = bbox_tipo[2] - bbox_tipo[0]
+        texto_alto = bbox_tipo[3] - bbox_tipo[1]
+        
+        draw.rectangle([texto_x, y_pos, texto_x + texto_ancho + 10, y_pos + texto_alto + 8], 
+                      fill=fondo_tipo, outline=fondo_tipo)
+        draw.text((texto_x + 5, y_pos + 4), texto_tipo, font=font_entrada_evento, fill='white')
+        
+        y_pos += 60  # espaciado reducido para fuente más pequeña
+    # Si no es LPN o porciFORUM LATAM, no mostrar tipo de entrada y no agregar espacio
+
+    # EVENTO
+    for linea in layout['lineas_evento']:
+        draw.text((texto_x, y_pos), linea, font=font_entrada_evento, fill='black')
+        y_pos += 60  # espaciado reducido para fuente más pequeña
+
+    # EMPRESA (ahora después del evento)
+    for linea in layout['lineas_empresa']:
+        draw.text((texto_x, y_pos), linea, font=layout['font_empresa'], fill='black')
+        y_pos += 90  # más separación
+
+    # QR
+    img.paste(layout['qr_img'], (layout['qr_x'], layout['qr_y']))
+
+    return img
+
+def generar_etiquetas(datos, nombre_evento=None, empresa=None):
+    """Genera ``(vista_previa, impresion)`` a partir de un único layout (impresión en ``MODO_IMPRESION``)."""
+    layout = calcular_layout_etiqueta(datos, nombre_evento, empresa)
+    return (rasterizar_etiqueta(layout, version_impresion=False),
+            rasterizar_etiqueta(layout, version_impresion=True, modo=MODO_IMPRESION))
+
+def generar_etiqueta(datos, nombre_evento=None, version_impresion=False):
+    """
+    Genera etiqueta con dos versiones:
+    - version_impresion=False: Versión con colores para vista previa
+    - version_impresion=True: Versión original en blanco para impresión
+    Si se necesitan ambas, usar ``generar_etiquetas`` (calcula el layout una vez).
+    """
+    return rasterizar_etiqueta(calcular_layout_etiqueta(datos, nombre_evento), version_impresion)
+
+# =====================================================
+# 🗃️ CACHÉ DE ETIQUETAS PRE-RENDERIZADAS
+# =====================================================
+ETIQUETAS_VERSION_LAYOUT = 1            # Incrementar al cambiar el diseño: invalida la caché
+ETIQUETAS_CACHE_DIR = 'etiquetas_cache'
+ETIQUETAS_CACHE_MEMORIA = 8             # Pares (vista previa, impresión) decodificados en memoria (~5 MB c/u)
+ETIQUETAS_CACHE_DISCO_MB = 512          # Tamaño máximo del directorio de caché
+ETIQUETAS_PROCESOS = max(1, (os.cpu_count() or 2) - 1)
+
+def contexto_procesos():
+    """Contexto ``spawn`` para los pools de procesos.
+
+    Con ``fork`` (por defecto en Linux) el hijo hereda los locks tal como
+    estén en ese instante; si otro hilo tenía ``_QR_LOCK`` o ``_FUENTES_LOCK``
+    el trabajador se quedaría bloqueado para siempre.
+    """
+    return multiprocessing.get_context('spawn')
+
+def clave_etiqueta(datos, nombre_evento, empresa):
+    """Hash del contenido de la etiqueta: si cambia un dato impreso, cambia la clave.
+
+    ``empresa`` es el nombre ya resuelto (el que se imprime). Si no se pudo
+    resolver y la etiqueta llevaría el ID numérico, devuelve ``None``: esa
+    etiqueta no se guarda en la caché.
+    """
+    campos = campos_etiqueta(datos)
+    empresa_id = str(campos['empresa_id'] or '').strip()
+    if empresa_id.isdigit() and str(empresa).strip() == empresa_id:
+        return None
+    contenido = json.dumps([ETIQUETAS_VERSION_LAYOUT, MODO_IMPRESION, str(nombre_evento), str(empresa)] +
+                           [str(campos[c]) for c in sorted(campos)], ensure_ascii=False)
+    return hashlib.sha1(contenido.encode('utf-8')).hexdigest()
+
+def _renderizar_etiqueta_a_disco(directorio, clave, datos, nombre_evento, empresa):
+    """Trabajo del pool de procesos: renderiza ambas versiones y las guarda como PNG."""
+    preview, impresion = generar_etiquetas(datos, nombre_evento, empresa)
+    for sufijo, img in (('p', preview), ('i', impresion)):
+        ruta = os.path.join(directorio, f"{clave}_{sufijo}.png")
+        temporal = ruta + '.tmp'
+        img.save(temporal, format='PNG')
+        os.replace(temporal, ruta)
+    return clave
+
+class CacheEtiquetas:
+    """Etiquetas ya renderizadas por clave (``clave_etiqueta``).
+
+    Las imágenes viven en disco como PNG (tamaño acotado, se eliminan las
+    más antiguas) y las últimas usadas se mantienen decodificadas en memoria.
+    La clave incluye los datos impresos y la versión del layout, así que un
+    cambio en el asistente simplemente deja de encontrar la entrada antigua.
+    """
+
+    def __init__(self, directorio=ETIQUETAS_CACHE_DIR, max_memoria=ETIQUETAS_CACHE_MEMORIA,
+                 max_disco_mb=ETIQUETAS_CACHE_DISCO_MB):
+        self.directorio = os.path.abspath(directorio)
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco_mb * 1024 * 1024
+        self._memoria = OrderedDict()  # clave -> (vista previa, impresión)
+        self._lock = threading.Lock()
+        self._cancelar = threading.Event()
+
+    def _rutas(self, clave):
+        return (os.path.join(self.directorio, f"{clave}_p.png"),
+                os.path.join(self.directorio, f"{clave}_i.png"))
+
+    def _recordar(self, clave, imagenes):
+        with self._lock:
+            self._memoria[clave] = imagenes
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def obtener(self, clave):
+        """Devuelve ``(vista_previa, impresion)`` o ``None`` si la etiqueta no está en caché."""
+        with self._lock:
+            imagenes = self._memoria.get(clave)
+            if imagenes is not None:
+                self._memoria.move_to_end(clave)
+                return imagenes
+        ruta_p, ruta_i = self._rutas(clave)
+        try:
+            with Image.open(ruta_p) as img_p, Image.open(ruta_i) as img_i:
+                imagenes = (img_p.convert('RGB'), img_i.convert(MODO_IMPRESION))
+        except (OSError, ValueError):
+            return None
+        self._recordar(clave, imagenes)
+        return imagenes
+
+    def guardar(self, clave, preview, impresion):
+        """Guarda en memoria una etiqueta recién renderizada."""
+        self._recordar(clave, (preview, impresion))
+
+    def existe_en_disco(self, clave):
+        return all(os.path.exists(ruta) for ruta in self._rutas(clave))
+
+    def recortar_disco(self):
+        """Elimina los PNG más antiguos hasta respetar el tamaño máximo."""
+        try:
+            archivos = [os.path.join(self.directorio, n) for n in os.listdir(self.directorio) if n.endswith('.png')]
+        except FileNotFoundError:
+            return
+        estados = []
+        for ruta in archivos:
+            try:
+                estados.append((os.path.getmtime(ruta), os.path.getsize(ruta), ruta))
+            except OSError:
+                continue
+        total = sum(tamano for _, tamano, _ in estados)
+        for _, tamano, ruta in sorted(estados):
+            if total <= self.max_disco:
+                break
+            try:
+                os.remove(ruta)
+                total -= tamano
+            except OSError:
+                pass
+
+    def cancelar(self):
+        """Detiene un pre-renderizado en curso."""
+        self._cancelar.set()
+
+    def prerenderizar(self, trabajos, progreso=None, procesos=ETIQUETAS_PROCESOS):
+        """Renderiza a disco en un pool de procesos.
+
+        ``trabajos`` son tuplas ``(clave, datos, nombre_evento, empresa)``; se
+        omiten las claves que ya están en disco. ``progreso(hechos, total)`` se
+        llama tras cada etiqueta. Devuelve el número de etiquetas generadas.
+        """
+        self._cancelar.clear()
+        os.makedirs(self.directorio, exist_ok=True)
+        pendientes = [t for t in trabajos if not self.existe_en_disco(t[0])]
+        total = len(pendientes)
+        hechos = 0
+        if not pendientes:
+            return 0
+        
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto_procesos()) as pool:
+            futuros = [pool.submit(_renderizar_etiqueta_a_disco, self.directorio, *trabajo) for trabajo in pendientes]
+            for futuro in as_completed(futuros):
+                if self._cancelar.is_set():
+                    for f in futuros:
+                        f.cancel()
+                    break
+                try:
+                    futuro.result()
+                    hechos += 1
+                except Exception as e:
+                    print(f"⚠️ Error pre-renderizando etiqueta: {e}")
+                if progreso:
+                    progreso(hechos, total)
+        
+        self.recortar_disco()
+        return hechos
+
+
+CACHE_ETIQUETAS = CacheEtiquetas()
+
+# =====================================================
+# 📦 GENERACIÓN DE ETIQUETAS EN LOTE
+# =====================================================
+LOTE_PROCESOS = ETIQUETAS_PROCESOS
+LOTE_VENTANA_POR_PROCESO = 4     # Etiquetas en vuelo por proceso (acota la memoria)
+LOTE_DPI = (300, 300)            # Resolución de PNG/PDF exportados
+LOTE_PDF_BLOQUE = 100            # Páginas en memoria antes de volcarlas al PDF
+
+def _renderizar_impresion(datos, nombre_evento, empresa):
+    """Trabajo del pool de procesos: versión de impresión de una etiqueta."""
+    return generar_etiquetas(datos, nombre_evento, empresa)[1]
+
+def renderizar_lote_etiquetas(trabajos, procesos=LOTE_PROCESOS, cancelar=None):
+    """Renderiza ``trabajos`` ``(datos, nombre_evento, empresa)`` en un pool de procesos.
+
+    Es un generador que entrega ``(trabajo, imagen)`` en el mismo orden de
+    entrada a medida que terminan, con como mucho ``procesos *
+    LOTE_VENTANA_POR_PROCESO`` etiquetas en vuelo para que un consumidor lento
+    (la impresora) no acumule imágenes en memoria.
+    """
+    ventana = max(1, procesos * LOTE_VENTANA_POR_PROCESO)
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto_procesos()) as pool:
+        pendientes = []
+        trabajos = iter(trabajos)
+        agotado = False
+        while True:
+            while not agotado and len(pendientes) < ventana:
+                trabajo = next(trabajos, None)
+                if trabajo is None:
+                    agotado = True
+                    break
+                pendientes.append((trabajo, pool.submit(_renderizar_impresion, *trabajo)))
+            if not pendientes:
+                return
+            if cancelar is not None and cancelar.is_set():
+                for _, futuro in pendientes:
+                    futuro.cancel()
+                return
+            trabajo, futuro = pendientes.pop(0)
+            yield trabajo, futuro.result()
+
+def volcar_paginas_pdf(ruta, paginas, anexar):
+    """Escribe ``paginas`` en el PDF ``ruta``; con ``anexar`` se añaden al final del archivo existente."""
+    paginas[0].save(ruta, format='PDF', save_all=True, append_images=paginas[1:],
+                    resolution=LOTE_DPI[0], append=anexar)
+
+def nombre_archivo_etiqueta(datos):
+    """Nombre de archivo seguro para la etiqueta de un asistente."""
+    campos = campos_etiqueta(datos)
+    base = f"{campos['id_usuario']}_{campos['nombre']}".strip()
+    return "".join(c if c.isalnum() or c in '-_' else '_' for c in base)[:80] or "etiqueta"
+
+
+
+
+def imprimir_etiqueta(img, impresora_manual=None):
+    """Imprime en Brother QL en TODAS las plataformas"""
+    try:
+        # La impresora se resuelve en el registro (descubierta una vez, sesión reutilizada)
+        return REGISTRO_IMPRESORAS.imprimir([img], impresora_manual)
+            
+    except Exception as e:
+        print(f"❌ Error de impresión: {e}")
+        # Solo como último recurso, guardar archivo
+        print("⚠️ Impresión falló, guardando archivo como backup...")
+        return guardar_etiqueta_archivo(img)
+
+def imprimir_etiqueta_brother_ql(img):
+    """Imprime usando brother_ql en Mac/Linux"""
+    return REGISTRO_IMPRESORAS.imprimir([img], BROTHER_QL_DISPOSITIVO)
+
+def imprimir_etiqueta_windows(img, impresora_manual=None):
+    """Imprime usando win32print (método Windows nativo más confiable).
+    
+    Args:
+        img: Imagen PIL a imprimir
+        impresora_manual: Nombre de impresora seleccionada manualmente (opcional)
+    """
+    return REGISTRO_IMPRESORAS.imprimir([img], impresora_manual)
+
+def es_impresora_brother_ql(nombre):
+    """True si el nombre corresponde a una Brother QL-600/700/800 (Windows o CUPS)."""
+    normalizado = nombre.upper().replace('_', '-').replace(' ', '-')
+    return 'BROTHER' in normalizado and any(m in normalizado for m in ('QL-600', 'QL-700', 'QL-800'))
+
+def buscar_impresoras_brother(silencioso=False):
+    """Nombres de las impresoras Brother QL instaladas en Windows (``silencioso``: sin mensajes)."""
+    import win32print
+    
+    # Flag 6 = PRINTER_ENUM_LOCAL (2) | PRINTER_ENUM_CONNECTIONS (4)
+    if not silencioso:
+        print("🔍 Escaneando impresoras disponibles...")
+    impresoras = []
+    for printer_info in win32print.EnumPrinters(6):  # 6 = LOCAL + NETWORK
+        nombre = printer_info[2]
+        if es_impresora_brother_ql(nombre):
+            impresoras.append(nombre)
+            if not silencioso:
+                print(f"   ✅ Encontrada: {nombre}")
+    return impresoras
+
+class ImpresoraNoDisponible(Exception):
+    """Falta el controlador o la librería de impresión: reintentar no sirve."""
+
+class ImpresionIncompleta(Exception):
+    """Un lote falló después de que parte llegara a la impresora.
+
+    Las ``enviadas`` primeras etiquetas se imprimieron; si ``dudosa``, el resto
+    pudo llegar también (p. ej. un flujo raster cortado a medias) y reenviarlo
+    duplicaría etiquetas. Cualquier otra excepción de ``imprimir_lote``
+    significa que no se envió nada.
+    """
+
+    def __init__(self, mensaje, enviadas=0, dudosa=False):
+        super().__init__(mensaje)
+        self.enviadas = enviadas
+        self.dudosa = dudosa
+
+class SesionImpresora:
+    """Impresora abierta que se reutiliza entre etiquetas.
+
+    Cada backend del registro devuelve una subclase que mantiene abierto su
+    recurso (DC de Windows, dispositivo USB...). Ante un error basta con
+    ``cerrar()`` y la siguiente impresión vuelve a abrirla. ``lock`` serializa
+    el uso de la sesión entre hilos.
+    """
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.lock = threading.Lock()
+
+    def imprimir_lote(self, imgs):
+        raise NotImplementedError
+
+    def imprimir(self, img):
+        """Imprime ``img`` con la impresora de la sesión (la abre si hace falta)."""
+        return self.imprimir_lote([img])
+
+    def cerrar(self):
+        pass
+
+class SesionWindows(SesionImpresora):
+    """Impresora de Windows: conserva su contexto de dispositivo (DC); cada etiqueta es un documento nuevo."""
+
+    def __init__(self, nombre):
+        super().__init__(nombre)
+        self._hdc = None
+        self._resolucion = None
+
+    def _abrir(self):
+        import win32ui
+        
+        hDC = win32ui.CreateDC()
+        hDC.CreatePrinterDC(self.nombre)
+        
+        # Obtener resolución de la impresora
+        self._resolucion = (hDC.GetDeviceCaps(8), hDC.GetDeviceCaps(10))  # HORZRES, VERTRES
+        print(f"Resolución impresora: {self._resolucion[0]}x{self._resolucion[1]} píxeles")
+        self._hdc = hDC
+
+    def _imprimir(self, img):
+        from PIL import ImageWin
+        
+        if self._hdc is None:
+            self._abrir()
+        hDC = self._hdc
+        horz_res, vert_res = self._resolucion
+        
+        # Preparar imagen para impresión
+        dib = ImageWin.Dib(img)
+        
+        # Iniciar documento
+        hDC.StartDoc("Etiqueta QR")
+        hDC.StartPage()
+        
+        # Calcular tamaño manteniendo proporciones
+        img_width, img_height = img.size
+        scale = min(horz_res / img_width, vert_res / img_height)
+        
+        final_width = int(img_width * scale)
+        final_height = int(img_height * scale)
+        
+        # Centrar en el papel
+        x_offset = (horz_res - final_width) // 2
+        y_offset = (vert_res - final_height) // 2
+        
+        # Imprimir manteniendo proporciones
+        dib.draw(hDC.GetHandleOutput(), (x_offset, y_offset, x_offset + final_width, y_offset + final_height))
+        
+        hDC.EndPage()
+        hDC.EndDoc()
+
+    def imprimir_lote(self, imgs):
+        for i, img in enumerate(imgs):
+            try:
+                self._imprimir(img)
+            except ImportError:
+                raise ImpresoraNoDisponible("Instala pywin32: pip install pywin32")
+            except Exception as e:
+                if i:
+                    # Cada etiqueta es un documento: las anteriores ya están impresas
+                    raise ImpresionIncompleta(str(e), enviadas=i) from e
+                raise
+        print(f"✅ ¡Impresión enviada exitosamente! ({len(imgs)} etiqueta(s))")
+        return True
+
+    def cerrar(self):
+        if self._hdc is not None:
+            try:
+                self._hdc.DeleteDC()
+            except Exception:
+                pass
+        self._hdc = None
+        self._resolucion = None
+
+class SesionBrotherQL(SesionImpresora):
+    """Brother QL por USB con brother_ql: el dispositivo queda abierto y cada lote es un único flujo raster."""
+
+    def __init__(self, nombre):
+        super().__init__(nombre)
+        self._backend = None
+
+    def _abrir(self):
+        from brother_ql.backends import backend_factory, guess_backend
+        
+        nombre_backend = guess_backend(self.nombre)
+        clase_backend = backend_factory(nombre_backend)['backend_class']
+        self._backend = clase_backend(self.nombre)
+        print(f"🔌 Impresora Brother QL abierta ({nombre_backend}: {self.nombre})")
+
+    def _convertir(self, imgs):
+        from brother_ql.raster import BrotherQLRaster
+        from brother_ql.conversion import convert
+        
+        if self._backend is None:
+            self._abrir()
+        
+        # Todas las etiquetas en un único flujo raster; las de 1 bit no necesitan umbral ni tramado
+        qlr = BrotherQLRaster(BROTHER_QL_MODELO)
+        return convert(qlr=qlr, images=[img if img.mode == '1' else img.convert('1') for img in imgs],
+                       label=BROTHER_QL_ETIQUETA, rotate='auto', threshold=70.0,
+                       dither=False, compress=False, red=False, dpi_600=False, hq=True, cut=True)
+
+    def imprimir_lote(self, imgs):
+        print("🖨️ Imprimiendo con brother_ql...")
+        try:
+            instrucciones = self._convertir(imgs)
+        except ImportError:
+            raise ImpresoraNoDisponible("brother_ql no instalado. Instalar con: pip install brother_ql")
+        except Exception as e:
+            raise Exception(f"Error imprimiendo con brother_ql: {str(e)}")
+        try:
+            self._backend.write(instrucciones)
+        except Exception as e:
+            # Parte del flujo pudo llegar ya al dispositivo: no se sabe qué etiquetas salieron
+            raise ImpresionIncompleta(f"Error imprimiendo con brother_ql: {str(e)}", dudosa=True) from e
+        print(f"✅ ¡Impresión enviada exitosamente con brother_ql! ({len(imgs)} etiqueta(s))")
+        return True
+
+    def cerrar(self):
+        if self._backend is not None:
+            try:
+                self._backend.dispose()
+            except Exception:
+                pass
+        self._backend = None
+
+class SesionCUPS(SesionImpresora):
+    """Cola CUPS (Mac/Linux): cada lote se envía con ``lp`` como un único trabajo."""
+
+    def imprimir_lote(self, imgs):
+        import tempfile
+        
+        if not shutil.which('lp'):
+            raise ImpresoraNoDisponible("Comando 'lp' no disponible (instala CUPS)")
+        with tempfile.TemporaryDirectory(prefix="etiquetas_") as directorio:
+            archivos = []
+            for i, img in enumerate(imgs):
+                ruta = os.path.join(directorio, f"etiqueta_{i:03d}.png")
+                img.save(ruta, "PNG", dpi=LOTE_DPI)
+                archivos.append(ruta)
+            try:
+                resultado = subprocess.run(['lp', '-d', self.nombre, '-t', 'Etiqueta QR'] + archivos,
+                                           capture_output=True, text=True, timeout=30)
+            except subprocess.TimeoutExpired as e:
+                # lp pudo dejar el trabajo en la cola de CUPS antes de colgarse
+                raise ImpresionIncompleta(f"lp no respondió en {e.timeout} s", dudosa=True) from e
+        if resultado.returncode != 0:
+            raise Exception(f"lp: {resultado.stderr.strip() or resultado.returncode}")
+        print(f"✅ ¡Impresión enviada a CUPS ({self.nombre})! ({len(imgs)} etiqueta(s))")
+        return True
+
+class SesionArchivo(SesionImpresora):
+    """Destino 'archivo': guarda cada etiqueta como PNG en ~/Etiquetas_QR."""
+
+    def imprimir_lote(self, imgs):
+        rutas = []
+        for img in imgs:
+            try:
+                rutas.append(guardar_etiqueta_archivo(img))
+            except Exception as e:
+                if rutas:
+                    raise ImpresionIncompleta(str(e), enviadas=len(rutas)) from e
+                raise
+        return rutas[-1] if rutas else None
+
+class SesionFalsa(SesionImpresora):
+    """Impresora simulada: acumula las etiquetas en memoria (pruebas y demos)."""
+
+    def __init__(self, nombre, fallar=0):
+        super().__init__(nombre)
+        self.impresas = []
+        self.fallar = fallar  # número de envíos que fallarán antes de imprimir
+
+    def imprimir_lote(self, imgs):
+        if self.fallar > 0:
+            self.fallar -= 1
+            raise Exception("Fallo simulado de impresora")
+        self.impresas.extend(imgs)
+        return True
+
+def guardar_etiqueta_archivo(img):
+    """Guarda la etiqueta como archivo para Mac/Linux - SIMULA IMPRESIÓN"""
+    try:
+        # Crear directorio de etiquetas si no existe
+        etiquetas_dir = os.path.join(os.path.expanduser("~"), "Etiquetas_QR")
+        if not os.path.exists(etiquetas_dir):
+            os.makedirs(etiquetas_dir)
+        
+        # Generar nombre único con timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"etiqueta_qr_{timestamp}.png"
+        filepath = os.path.join(etiquetas_dir, filename)
+        
+        # Guardar imagen
+        img.save(filepath, "PNG", dpi=(300, 300))
+        
+        print(f"✅ Etiqueta 'impresa' (guardada) en: {filepath}")
+        
+        # EN MODO AUTO: NO mostrar popup, solo log silencioso
+        # EN MODO MANUAL: Mostrar popup informativo
+        return filepath
+        
+    except Exception as e:
+        print(f"Error guardando etiqueta: {e}")
+        raise Exception(f"Error al imprimir etiqueta: {str(e)}")
+
+# =====================================================
+# 🗂️ REGISTRO DE IMPRESORAS
+# =====================================================
+IMPRESORAS_REFRESCO_SEGUNDOS = 60   # Intervalo del redescubrimiento en segundo plano
+
+class BackendImpresion:
+    """Interfaz de un backend de impresión.
+
+    ``descubrir(silencioso)`` devuelve los nombres de las impresoras que ofrece y
+    ``abrir(nombre)`` una ``SesionImpresora`` sobre una de ellas. Solo las de
+    backends ``predeterminable`` se eligen cuando no hay impresora seleccionada.
+    """
+    nombre = ''
+    predeterminable = True
+
+    def disponible(self):
+        return True
+
+    def descubrir(self, silencioso=False):
+        return []
+
+    def abrir(self, impresora):
+        raise NotImplementedError
+
+class BackendWindows(BackendImpresion):
+    """Impresoras Brother QL instaladas con el driver de Windows (win32print)."""
+    nombre = 'windows'
+
+    def disponible(self):
+        return IS_WINDOWS
+
+    def descubrir(self, silencioso=False):
+        return buscar_impresoras_brother(silencioso)
+
+    def abrir(self, impresora):
+        return SesionWindows(impresora)
+
+class BackendBrotherQL(BackendImpresion):
+    """Brother QL conectadas por USB, manejadas directamente con brother_ql."""
+    nombre = 'brother_ql'
+
+    def disponible(self):
+        return not IS_WINDOWS and BROTHER_QL_AVAILABLE
+
+    def descubrir(self, silencioso=False):
+        try:
+            from brother_ql.backends.helpers import discover
+            encontradas = [d['identifier'] for d in discover(backend_identifier='pyusb')]
+        except Exception as e:
+            # Sin pyusb no hay enumeración: se usa el dispositivo configurado
+            if not silencioso:
+                print(f"⚠️ brother_ql no pudo enumerar USB ({e}), usando {BROTHER_QL_DISPOSITIVO}")
+            encontradas = [BROTHER_QL_DISPOSITIVO]
+        return encontradas
+
+    def abrir(self, impresora):
+        return SesionBrotherQL(impresora)
+
+class BackendCUPS(BackendImpresion):
+    """Colas CUPS de Mac/Linux (``lpstat -p``) que corresponden a una Brother QL."""
+    nombre = 'cups'
+
+    def disponible(self):
+        return not IS_WINDOWS and shutil.which('lpstat') is not None
+
+    def descubrir(self, silencioso=False):
+        resultado = subprocess.run(['lpstat', '-p'], capture_output=True, text=True, timeout=10)
+        impresoras = []
+        for linea in resultado.stdout.splitlines():
+            # "printer Brother_QL-700 is idle.  enabled since ..."
+            partes = linea.split()
+            if len(partes) >= 2 and partes[0] == 'printer' and es_impresora_brother_ql(partes[1]):
+                impresoras.append(partes[1])
+        return impresoras
+
+    def abrir(self, impresora):
+        return SesionCUPS(impresora)
+
+class BackendArchivo(BackendImpresion):
+    """Destino que guarda las etiquetas como PNG; solo se usa si se selecciona."""
+    nombre = 'archivo'
+    predeterminable = False
+    IMPRESORA = "Archivo PNG (~/Etiquetas_QR)"
+
+    def descubrir(self, silencioso=False):
+        return [self.IMPRESORA]
+
+    def abrir(self, impresora):
+        return SesionArchivo(impresora)
+
+class BackendFalso(BackendImpresion):
+    """Impresoras simuladas para pruebas: las sesiones abiertas quedan en ``sesiones``."""
+    nombre = 'falso'
+
+    def __init__(self, impresoras=("Brother QL-700 (simulada)",), fallar=0):
+        self.impresoras = list(impresoras)
+        self.fallar = fallar
+        self.sesiones = {}
+
+    def descubrir(self, silencioso=False):
+        return list(self.impresoras)
+
+    def abrir(self, impresora):
+        sesion = SesionFalsa(impresora, self.fallar)
+        self.sesiones[impresora] = sesion
+        return sesion
+
+class RegistroImpresoras:
+    """Impresoras descubiertas una vez y sesiones abiertas reutilizables.
+
+    ``descubrir()`` recorre los backends (lento: EnumPrinters, lpstat, USB) y
+    un hilo lo repite en segundo plano; ``resolver()`` y ``sesion()`` son
+    búsquedas en diccionarios. Tras un fallo de impresión la sesión se cierra
+    y se adelanta el siguiente redescubrimiento.
+    """
+
+    def __init__(self, backends):
+        self._backends = list(backends)
+        self._impresoras = {}   # nombre -> backend
+        self._orden = []        # nombres en orden de preferencia
+        self._sesiones = {}     # nombre -> SesionImpresora
+        self._lock = threading.RLock()
+        self._descubierto_en = None
+        self._errores = {}      # backend -> último error de descubrimiento (para no repetirlo)
+        self._hilo = None
+        self._detener = threading.Event()
+        self._despertar = threading.Event()
+
+    def registrar_backend(self, backend, primero=False):
+        """Añade un backend (p. ej. ``BackendFalso``) y redescubre."""
+        with self._lock:
+            if primero:
+                self._backends.insert(0, backend)
+            else:
+                self._backends.append(backend)
+        self.descubrir()
+
+    def descubrir(self, silencioso=False):
+        """Enumera las impresoras de todos los backends y actualiza el registro.
+
+        Con ``silencioso`` (refresco en segundo plano) solo se informa cuando
+        cambia el conjunto de impresoras o el error de un backend.
+        """
+        impresoras = {}
+        orden = []
+        with self._lock:
+            backends = list(self._backends)
+        for backend in backends:
+            try:
+                if not backend.disponible():
+                    continue
+                encontradas = backend.descubrir(silencioso)
+            except Exception as e:
+                if not silencioso or self._errores.get(backend.nombre) != str(e):
+                    print(f"⚠️ Error descubriendo impresoras ({backend.nombre}): {e}")
+                self._errores[backend.nombre] = str(e)
+                continue
+            self._errores.pop(backend.nombre, None)
+            for nombre in encontradas:
+                if nombre not in impresoras:
+                    impresoras[nombre] = backend
+                    orden.append(nombre)
+        
+        with self._lock:
+            desaparecidas = [n for n in self._sesiones if n not in impresoras]
+            cerrar = [self._sesiones.pop(n) for n in desaparecidas]
+            nuevas = [n for n in orden if n not in self._impresoras]
+            self._impresoras = impresoras
+            self._orden = orden
+            self._descubierto_en = time.monotonic()
+        for sesion in cerrar:
+            with sesion.lock:
+                sesion.cerrar()
+        if nuevas or desaparecidas:
+            print(f"🖨️ Impresoras disponibles: {', '.join(orden) or 'ninguna'}")
+        return list(orden)
+
+    def _asegurar_descubrimiento(self):
+        with self._lock:
+            descubierto = self._descubierto_en is not None
+        if not descubierto:
+            self.descubrir()
+
+    def impresoras(self):
+        """Nombres de las impresoras conocidas, en orden de preferencia."""
+        self._asegurar_descubrimiento()
+        with self._lock:
+            return list(self._orden)
+
+    def resolver(self, impresora=None):
+        """Nombre de la impresora a usar: la indicada si existe, si no la predeterminada."""
+        self._asegurar_descubrimiento()
+        with self._lock:
+            if impresora in self._impresoras:
+                return impresora
+            for nombre in self._orden:
+                if self._impresoras[nombre].predeterminable:
+                    if impresora:
+                        print(f"⚠️ Impresora '{impresora}' no encontrada, usando {nombre}")
+                    return nombre
+        self.solicitar_descubrimiento()
+        raise ImpresoraNoDisponible("No se encontró ninguna impresora Brother QL. Verifica que esté encendida y conectada.")
+
+    def sesion(self, nombre):
+        """Sesión abierta (o reutilizada) sobre una impresora ya resuelta."""
+        with self._lock:
+            sesion = self._sesiones.get(nombre)
+            if sesion is None:
+                sesion = self._impresoras[nombre].abrir(nombre)
+                self._sesiones[nombre] = sesion
+            return sesion
+
+    def imprimir(self, imgs, impresora=None):
+        """Imprime ``imgs`` en un solo envío. Lanza la excepción del backend si falla."""
+        nombre = self.resolver(impresora)
+        sesion = self.sesion(nombre)
+        with sesion.lock:
+            try:
+                return sesion.imprimir_lote(imgs)
+            except ImpresoraNoDisponible:
+                raise
+            except Exception:
+                # Reabrir en el siguiente intento (p. ej. impresora reconectada)
+                sesion.cerrar()
+                self.solicitar_descubrimiento()
+                raise
+
+    def solicitar_descubrimiento(self):
+        """Adelanta el redescubrimiento del hilo en segundo plano."""
+        self._despertar.set()
+
+    def iniciar_refresco(self, intervalo=IMPRESORAS_REFRESCO_SEGUNDOS):
+        """Descubre en segundo plano y repite cada ``intervalo`` segundos."""
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle_refresco, args=(intervalo,),
+                                      name="registro-impresoras", daemon=True)
+        self._hilo.start()
+
+    def _bucle_refresco(self, intervalo):
+        while not self._detener.is_set():
+            try:
+                self.descubrir(silencioso=True)
+            except Exception as e:
+                print(f"⚠️ Refresco de impresoras fallido: {e}")
+            self._despertar.wait(intervalo)
+            self._despertar.clear()
+
+    def cerrar(self):
+        """Detiene el refresco y libera todas las sesiones abiertas."""
+        self._detener.set()
+        self._despertar.set()
+        with self._lock:
+            sesiones = list(self._sesiones.values())
+            self._sesiones.clear()
+        for sesion in sesiones:
+            with sesion.lock:
+                sesion.cerrar()
+
+
+REGISTRO_IMPRESORAS = RegistroImpresoras([BackendWindows(), BackendBrotherQL(), BackendCUPS(), BackendArchivo()])
+
+# =====================================================
+# 🖨️ COLA DE IMPRESIÓN (SPOOLER)
+# =====================================================
+IMPRESION_REINTENTOS = 3           # Intentos por etiqueta antes de guardarla como archivo
+IMPRESION_ESPERA_REINTENTO = 1.0   # Segundos antes del primer reintento (se duplica)
+IMPRESION_LOTE_MAXIMO = 8          # Trabajos en cola que se envían juntos a la impresora
+
+class ColaImpresion:
+    """Cola de trabajos de impresión atendida por un único hilo.
+
+    Las sesiones abiertas viven en ``REGISTRO_IMPRESORAS``. Si una impresión
+    falla, el registro cierra la sesión y el hilo espera y reintenta (la
+    sesión se reabre, p. ej. tras reconectar la impresora). Solo se reintentan
+    las etiquetas que no llegaron a la impresora (``ImpresionIncompleta``), y
+    agotados los reintentos solo esas se guardan como archivo, igual que
+    ``imprimir_etiqueta``. Cada trabajo informa de su resultado y latencia
+    mediante ``al_terminar``.
+    """
+
+    def __init__(self):
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._contador = 0
+        self._apartado = None  # trabajo de otra impresora retirado al agrupar un lote
+
+    def _asegurar_hilo(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="impresora", daemon=True)
+                self._hilo.start()
+
+    def encolar(self, img, datos=None, impresora=None, al_terminar=None):
+        """Añade una etiqueta a la cola. ``al_terminar(trabajo, ok, segundos, error)`` se llama desde el hilo de impresión."""
+        with self._lock:
+            self._contador += 1
+            trabajo = {
+                'id': self._contador,
+                'img': img,
+                'datos': datos,
+                'impresora': impresora,
+                'al_terminar': al_terminar,
+                'encolado': time.monotonic(),
+            }
+        self._asegurar_hilo()
+        self._cola.put(trabajo)
+        return trabajo['id']
+
+    def pendientes(self):
+        return self._cola.qsize() + (self._apartado is not None)
+
+    def detener(self, espera=10):
+        """Termina los trabajos en cola (con límite de tiempo)."""
+        if self._hilo is None or not self._hilo.is_alive():
+            return
+        self._cola.put(None)
+        self._hilo.join(timeout=espera)
+
+    def _imprimir(self, trabajos):
+        """Imprime un grupo de trabajos de la misma impresora. Devuelve ``(resultado, error)`` por trabajo."""
+        espera = IMPRESION_ESPERA_REINTENTO
+        ultimo_error = None
+        resultados = {}
+        pendientes = list(trabajos)
+        for intento in range(1, IMPRESION_REINTENTOS + 1):
+            ids = ", ".join(f"#{t['id']}" for t in pendientes)
+            try:
+                resultado = REGISTRO_IMPRESORAS.imprimir([t['img'] for t in pendientes], pendientes[0]['impresora'])
+                for t in pendientes:
+                    resultados[t['id']] = (resultado, None)
+                pendientes = []
+                break
+            except ImpresoraNoDisponible as e:
+                ultimo_error = e
+                print(f"⚠️ Impresión {ids}: {e}")
+                break
+            except ImpresionIncompleta as e:
+                ultimo_error = e
+                for t in pendientes[:e.enviadas]:
+                    resultados[t['id']] = (True, None)
+                pendientes = pendientes[e.enviadas:]
+                if e.dudosa:
+                    # Lo enviado a medias no se repite ni se guarda: se informa como error
+                    print(f"⚠️ Impresión {ids}: {e} (pudo llegar a la impresora, no se reenvía)")
+                    for t in pendientes:
+                        resultados[t['id']] = (None, e)
+                    pendientes = []
+                    break
+                print(f"⚠️ Impresión {ids} fallida tras {e.enviadas} etiqueta(s) "
+                      f"(intento {intento}/{IMPRESION_REINTENTOS}): {e}")
+            except Exception as e:
+                ultimo_error = e
+                print(f"⚠️ Impresión {ids} fallida (intento {intento}/{IMPRESION_REINTENTOS}): {e}")
+            if not pendientes:
+                break
+            if intento < IMPRESION_REINTENTOS:
+                time.sleep(espera)
+                espera *= 2
+        
+        if pendientes:
+            # Solo como último recurso, guardar archivo (únicamente lo que nunca se envió)
+            print("⚠️ Impresión falló, guardando archivo como backup...")
+            for t in pendientes:
+                try:
+                    resultados[t['id']] = (guardar_etiqueta_archivo(t['img']), ultimo_error)
+                except Exception as e:
+                    resultados[t['id']] = (None, e)
+        return [resultados[t['id']] for t in trabajos]
+
+    def _tomar_lote(self, primero):
+        """Agrupa con ``primero`` los trabajos ya en cola para la misma impresora."""
+        lote = [primero]
+        fin = False
+        while len(lote) < IMPRESION_LOTE_MAXIMO:
+            try:
+                siguiente = self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if siguiente is None:
+                fin = True
+                break
+            if siguiente['impresora'] != primero['impresora']:
+                # Otra impresora: se atiende en la siguiente vuelta, sin perder el orden
+                self._apartado = siguiente
+                break
+            lote.append(siguiente)
+        return lote, fin
+
+    def _bucle(self):
+        fin = False
+        while True:
+            if self._apartado is not None:
+                trabajo, self._apartado = self._apartado, None
+            elif fin:
+                trabajo = None
+            else:
+                trabajo = self._cola.get()
+            if trabajo is None:
+                return
+            if fin:
+                lote = [trabajo]
+            else:
+                lote, fin = self._tomar_lote(trabajo)
+            try:
+                resultados = self._imprimir(lote)
+            except Exception as e:
+                resultados = [(None, e)] * len(lote)
+                print(f"❌ Error de impresión: {e}")
+            for trabajo, (resultado, error) in zip(lote, resultados):
+                trabajo['resultado'] = resultado
+                segundos = time.monotonic() - trabajo['encolado']
+                ok = error is None and bool(resultado)
+                if trabajo['al_terminar']:
+                    try:
+                        trabajo['al_terminar'](trabajo, ok, segundos, error)
+                    except Exception as e:
+                        print(f"⚠️ Error notificando trabajo de impresión: {e}")
+
+
+COLA_IMPRESION = ColaImpresion()
+
+def verificar_archivo_log_disponible():
+    """Verifica si el archivo de log está disponible para escritura."""
+    try:
+        # Intentar abrir el archivo para escritura y cerrarlo inmediatamente
+        with open(LOG_FILE, 'a', encoding='utf-8') as f:
+            pass
+        return True
+    except PermissionError:
+        return False
+    except Exception:
+        return False
+
+def log_impresion(datos):
+    """Registra la impresión en el archivo de log (la escritura la hace ``ESCRITOR_LOGS``)."""
+    try:
+        ESCRITOR_LOGS.escribir(LOG_FILE, [
+            datetime.now().isoformat(),
+            datos.get('idUsuario'),
+            datos.get('Nombrecompleto'),
+            datos.get('apellidos'),
+            datos.get('Empresa'),
+            datos.get('Evento', ''),
+            datos.get('Dia')
+        ])
+        print(f"✅ Log de impresión registrado para usuario {datos.get('idUsuario')}")
+    except Exception as e:
+        print(f"❌ Error inesperado al guardar log de impresión: {e}")
+
+# =====================================================
+# 🧹 NORMALIZACIÓN DE DATOS CSV (UNA VEZ, AL CARGAR)
+# =====================================================
+COLUMNAS_TEXTO_CSV = ['idUsuario', 'Nombrecompleto', 'Apellidos', 'Empresa', 'Pais', 'Dia', 'Entrada']
+COLUMNAS_BANDERA_CSV = ['Comida', 'Pagado', 'Pirata']     # 0/1 (vacío = 0)
+
+def _columna_texto(serie):
+    """Convierte una columna a texto limpio ('' para vacíos, '12' en lugar de '12.0')."""
+    vacios = serie.isna()
+    if pd.api.types.is_float_dtype(serie):
+        valores = serie[~vacios]
+        if (valores == valores.round()).all():
+            serie = serie.astype('Int64')
+    texto = serie.astype(str).str.strip()
+    texto[vacios] = ''
+    return texto
+
+def normalizar_datos_csv(datos):
+    """Limpia un DataFrame de asistentes antes de importarlo al almacén offline.
+
+    - Texto limpio (strip, sin 'nan') en idUsuario, nombres, empresa, país, día y entrada.
+    - Evento como entero (nulos permitidos); Comida/Pagado/Pirata como 0/1.
+    - Las columnas se buscan sin distinguir mayúsculas, igual que SQLite.
+    """
+    columnas = {str(col).lower(): col for col in datos.columns}
+
+    for col in COLUMNAS_TEXTO_CSV:
+        if col.lower() in columnas:
+            datos[columnas[col.lower()]] = _columna_texto(datos[columnas[col.lower()]])
+
+    if 'evento' in columnas:
+        datos[columnas['evento']] = pd.to_numeric(datos[columnas['evento']], errors='coerce').astype('Int64')
+
+    # Comida siempre existe: marcar_comida_csv la escribe en cada escaneo
+    if 'comida' not in columnas:
+        datos['Comida'] = 0
+        columnas['comida'] = 'Comida'
+    for col in COLUMNAS_BANDERA_CSV:
+        if col.lower() in columnas:
+            real = columnas[col.lower()]
+            datos[real] = pd.to_numeric(datos[real], errors='coerce').fillna(0).astype(int)
+
+    return datos
+
+# =====================================================
+# 🗄️ ALMACÉN OFFLINE (SQLITE)
+# =====================================================
+OFFLINE_DB = 'asistentes_offline.db'
+OFFLINE_CAMBIOS_MAXIMO = 5000   # Marcas recordadas para el refresco incremental de la tabla
+COLUMNAS_BASE_OFFLINE = [
+    ('idUsuario', 'TEXT'), ('Nombrecompleto', 'TEXT'), ('Apellidos', 'TEXT'), ('Dia', 'TEXT'),
+    ('Evento', 'INTEGER'), ('Comida', 'INTEGER'), ('Empresa', 'TEXT'), ('Pagado', 'INTEGER'),
+    ('Pais', 'TEXT'), ('Entrada', 'TEXT'), ('Pirata', 'INTEGER'),
+]
+
+# Columnas de la tabla de usuarios con los nombres y valores por defecto de MySQL,
+# resueltas en la propia consulta (alias → expresión SQL)
+COLUMNAS_USUARIOS_OFFLINE = (
+    ('idUsuario', "TRIM(COALESCE(CAST(idUsuario AS TEXT), ''))"),
+    ('Nombrecompleto', "TRIM(COALESCE(CAST(Nombrecompleto AS TEXT), ''))"),
+    ('apellidos', "TRIM(COALESCE(CAST(Apellidos AS TEXT), ''))"),
+    ('Empresa', "TRIM(COALESCE(CAST(Empresa AS TEXT), ''))"),
+    ('entrada', "TRIM(COALESCE(CAST(Entrada AS TEXT), ''))"),
+    ('Evento', "CAST(Evento AS INTEGER)"),
+    ('comida', "CAST(COALESCE(NULLIF(Comida, ''), 0) AS INTEGER)"),
+    ('pirata', "CAST(COALESCE(NULLIF(Pirata, ''), 0) AS INTEGER)"),
+    ('Dia', "TRIM(COALESCE(CAST(Dia AS TEXT), '1'))"),
+    ('Pagado', "CAST(COALESCE(NULLIF(Pagado, ''), 0) AS INTEGER)"),
+    ('Pais', "TRIM(COALESCE(CAST(Pais AS TEXT), ''))"),
+)
+
+def _sql_nombre(columna):
+    """Identificador SQL entrecomillado (las columnas vienen de la cabecera del CSV)."""
+    return '"' + str(columna).replace('"', '""') + '"'
+
+class AlmacenOffline:
+    """Asistentes del modo CSV en una base SQLite local (WAL, índices por idUsuario y Evento).
+
+    Los CSV se importan de golpe y a partir de ahí búsquedas, marcas y
+    listados son consultas indexadas. El CSV solo se escribe al exportar.
+    Cada fila recuerda su archivo de origen; una marca queda ``_pendiente``
+    hasta exportarse a su ``_destino``, y si la aplicación se cierra sin
+    exportar, la marca se recupera al volver a cargar ese archivo.
+    """
+
+    def __init__(self, ruta=OFFLINE_DB):
+        self.ruta = ruta
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")  # cada marca queda en disco al confirmar
+        base = ", ".join(f"{_sql_nombre(nombre)} {tipo}" for nombre, tipo in COLUMNAS_BASE_OFFLINE)
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS asistentes (
+                _fila INTEGER PRIMARY KEY,
+                _origen TEXT NOT NULL,
+                _activo INTEGER NOT NULL DEFAULT 1,
+                _pendiente INTEGER NOT NULL DEFAULT 0,
+                _destino TEXT,
+                {base}
+            );
+            CREATE INDEX IF NOT EXISTS idx_asistentes_id ON asistentes(idUsuario);
+            CREATE INDEX IF NOT EXISTS idx_asistentes_evento ON asistentes(Evento);
+            CREATE INDEX IF NOT EXISTS idx_asistentes_origen ON asistentes(_origen);
+            CREATE TABLE IF NOT EXISTS columnas_csv (orden INTEGER PRIMARY KEY, nombre TEXT NOT NULL);
+        """)
+        self._columnas = None
+        self._total = 0  # filas cargadas en la sesión (se recalcula al importar/desactivar)
+        # Registro de cambios en memoria: (secuencia, idUsuario) por cada marca.
+        # Importar o desactivar invalida todo (hay que recargar la tabla)
+        self._cambios = deque(maxlen=OFFLINE_CAMBIOS_MAXIMO)
+        self._secuencia = 0
+        self._recarga = 0     # secuencia del último cambio masivo
+        self._descartado = 0  # secuencia de la marca más reciente que ya no cabe en el registro
+        self._iniciar_sesion()
+
+    def _iniciar_sesion(self):
+        """Cada ejecución empieza sin CSV cargados; solo se conservan las marcas sin exportar."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM asistentes WHERE _pendiente = 0")
+            self._conn.execute("UPDATE asistentes SET _activo = 0")
+            self._conn.execute("DELETE FROM columnas_csv")
+            pendientes = self._conn.execute("SELECT COUNT(*) FROM asistentes").fetchone()[0]
+        if pendientes:
+            print(f"♻️ {pendientes} marca(s) sin exportar de la sesión anterior: se recuperan al cargar su CSV")
+
+    def _columnas_tabla(self):
+        """Columnas de la tabla (minúsculas → nombre real: SQLite no distingue mayúsculas)."""
+        if self._columnas is None:
+            self._columnas = {fila[1].lower(): fila[1] for fila in self._conn.execute("PRAGMA table_info(asistentes)")}
+        return self._columnas
+
+    def columnas_csv(self):
+        """Columnas de los CSV cargados, en orden de aparición (formato de exportación)."""
+        with self._lock:
+            return [fila[0] for fila in self._conn.execute("SELECT nombre FROM columnas_csv ORDER BY orden")]
+
+    def importar(self, datos, origen, destino=None):
+        """Carga las filas de ``datos`` (ya normalizado) como procedentes del archivo ``origen``.
+
+        Sustituye lo cargado antes desde ese mismo archivo. Las marcas que
+        quedaron pendientes de exportar a ``destino`` (por defecto ``origen``)
+        se aplican sobre las filas nuevas. Devuelve cuántas se recuperaron.
+        """
+        origen = os.path.abspath(origen)
+        destino = os.path.abspath(destino or origen)
+        columnas = [str(c) for c in datos.columns]
+        valores = datos.astype(object).where(datos.notna(), None)
+        
+        with self._lock, self._conn:
+            existentes = self._columnas_tabla()
+            registradas = {c.lower() for c in self.columnas_csv()}
+            destino_columna = []
+            for columna in columnas:
+                if columna.lower() not in existentes:
+                    self._conn.execute(f"ALTER TABLE asistentes ADD COLUMN {_sql_nombre(columna)} TEXT")
+                    existentes[columna.lower()] = columna
+                if columna.lower() not in registradas:
+                    self._conn.execute("INSERT INTO columnas_csv (nombre) VALUES (?)", (columna,))
+                    registradas.add(columna.lower())
+                destino_columna.append(existentes[columna.lower()])
+            
+            # Marcas pendientes hacia este archivo (p. ej. tras un cierre inesperado)
+            recuperadas = self._conn.execute(
+                "SELECT idUsuario, MAX(Comida) FROM asistentes WHERE _pendiente = 1 AND _destino = ? GROUP BY idUsuario",
+                (destino,)).fetchall()
+            self._conn.execute("DELETE FROM asistentes WHERE _origen = ? OR (_pendiente = 1 AND _destino = ? AND _activo = 0)",
+                               (origen, destino))
+            
+            nombres = ", ".join(_sql_nombre(c) for c in destino_columna)
+            marcadores = ", ".join("?" * len(destino_columna))
+            self._conn.executemany(
+                f"INSERT INTO asistentes (_origen, {nombres}) VALUES (?, {marcadores})",
+                ((origen,) + tuple(fila) for fila in valores.itertuples(index=False, name=None)))
+            
+            self._conn.executemany(
+                "UPDATE asistentes SET Comida = ?, _pendiente = 1, _destino = ? WHERE _origen = ? AND idUsuario = ?",
+                ((comida, destino, origen, id_usuario) for id_usuario, comida in recuperadas))
+            self._recontar()
+            self._registrar_cambio()
+        return len(recuperadas)
+
+    def desactivar(self, origen=None):
+        """Quita de la sesión lo cargado desde ``origen`` (o todo); conserva marcas sin exportar."""
+        with self._lock, self._conn:
+            if origen is None:
+                self._conn.execute("DELETE FROM asistentes WHERE _pendiente = 0")
+                self._conn.execute("UPDATE asistentes SET _activo = 0")
+                self._conn.execute("DELETE FROM columnas_csv")
+            else:
+                origen = os.path.abspath(origen)
+                self._conn.execute("DELETE FROM asistentes WHERE _origen = ? AND _pendiente = 0", (origen,))
+                self._conn.execute("UPDATE asistentes SET _activo = 0 WHERE _origen = ?", (origen,))
+            self._recontar()
+            self._registrar_cambio()
+
+    def _recontar(self):
+        self._total = self._conn.execute("SELECT COUNT(*) FROM asistentes WHERE _activo = 1").fetchone()[0]
+
+    def total(self):
+        """Asistentes cargados en la sesión (sin consultar la base)."""
+        return self._total
+
+    def total_por_origen(self):
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT _origen, COUNT(*) FROM asistentes WHERE _activo = 1 GROUP BY _origen"))
+
+    def eventos(self):
+        """IDs de evento presentes en los datos cargados, ordenados."""
+        with self._lock:
+            return [fila[0] for fila in self._conn.execute(
+                "SELECT DISTINCT Evento FROM asistentes WHERE _activo = 1 AND Evento IS NOT NULL ORDER BY Evento")]
+
+    def _diccionarios(self, cursor):
+        nombres = [d[0] for d in cursor.description]
+        return [dict(zip(nombres, fila)) for fila in cursor.fetchall()]
+
+    def buscar(self, id_usuario):
+        """Primera fila cargada con ese idUsuario (como diccionario) o None."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT * FROM asistentes WHERE idUsuario = ? AND _activo = 1 ORDER BY _fila LIMIT 1",
+                (str(id_usuario).strip(),))
+            filas = self._diccionarios(cursor)
+        return filas[0] if filas else None
+
+    def asistentes(self, eventos=None, columnas=None, orden=None):
+        """Filas cargadas (opcionalmente de ``eventos``) como diccionarios."""
+        seleccion = ", ".join(_sql_nombre(c) for c in columnas) if columnas else "*"
+        sql = f"SELECT {seleccion} FROM asistentes WHERE _activo = 1"
+        parametros = []
+        if eventos is not None:
+            eventos = [int(e) for e in eventos]
+            sql += f" AND Evento IN ({', '.join('?' * len(eventos))})"
+            parametros.extend(eventos)
+        sql += f" ORDER BY {orden or '_fila'}"
+        with self._lock:
+            return self._diccionarios(self._conn.execute(sql, parametros))
+
+    def usuarios(self, eventos, ids=None):
+        """Usuarios de ``eventos`` (opcionalmente solo ``ids``) con la estructura de MySQL, ordenados por nombre.
+
+        Filtro, conversión de tipos, valores por defecto y orden se resuelven
+        en una sola consulta; cada fila solo se empareja con los nombres de
+        columna.
+        """
+        eventos = [int(e) for e in eventos]
+        nombres = tuple(alias for alias, _ in COLUMNAS_USUARIOS_OFFLINE)
+        seleccion = ", ".join(expresion for _, expresion in COLUMNAS_USUARIOS_OFFLINE)
+        sql = f"SELECT {seleccion} FROM asistentes WHERE _activo = 1 AND Evento IN ({', '.join('?' * len(eventos))})"
+        parametros = list(eventos)
+        if ids is not None:
+            ids = [str(i) for i in ids]
+            sql += f" AND idUsuario IN ({', '.join('?' * len(ids))})"
+            parametros.extend(ids)
+        sql += " ORDER BY Nombrecompleto, Apellidos"
+        with self._lock:
+            filas = self._conn.execute(sql, parametros).fetchall()
+        return [dict(zip(nombres, fila)) for fila in filas]
+
+    def marcar(self, id_usuario, campo, valor, destino=None):
+        """Actualiza ``campo`` del usuario y deja la marca pendiente de exportar a ``destino`` (o a su origen)."""
+        columna = self._columnas_tabla().get(campo.lower())
+        if columna is None:
+            raise KeyError(campo)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE asistentes SET {_sql_nombre(columna)} = ?, _pendiente = 1, _destino = COALESCE(?, _origen) "
+                f"WHERE idUsuario = ? AND _activo = 1",
+                (valor, os.path.abspath(destino) if destino else None, str(id_usuario).strip()))
+            if cursor.rowcount:
+                self._registrar_cambio(str(id_usuario).strip())
+            return cursor.rowcount
+
+    def _registrar_cambio(self, id_usuario=None):
+        """Anota una marca de ``id_usuario`` (o, sin id, un cambio masivo) en el registro de cambios."""
+        self._secuencia += 1
+        if id_usuario is None:
+            self._recarga = self._secuencia
+            return
+        if len(self._cambios) == self._cambios.maxlen:
+            self._descartado = self._cambios[0][0]
+        self._cambios.append((self._secuencia, id_usuario))
+
+    def secuencia(self):
+        """Posición actual del registro de cambios (punto de partida de ``cambios_desde``)."""
+        with self._lock:
+            return self._secuencia
+
+    def cambios_desde(self, secuencia):
+        """``(secuencia actual, ids marcados desde secuencia)``; ids ``None`` si hay que recargar todo."""
+        with self._lock:
+            if self._recarga > secuencia or self._descartado > secuencia:
+                return self._secuencia, None
+            ids = set()
+            for orden, id_usuario in reversed(self._cambios):
+                if orden <= secuencia:
+                    break
+                ids.add(id_usuario)
+            return self._secuencia, ids
+
+    def pendientes(self):
+        """Marcas de esta sesión aún no exportadas a CSV."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM asistentes WHERE _activo = 1 AND _pendiente = 1").fetchone()[0]
+
+    def exportar(self, ruta, encoding='utf-8', sep=';'):
+        """Escribe los asistentes cargados en ``ruta`` (vía temporal) con las columnas originales.
+
+        Solo las marcas destinadas a ``ruta`` dejan de estar pendientes: una
+        copia a otro archivo no sustituye a la exportación a su CSV destino.
+        """
+        columnas = self.columnas_csv()
+        reales = [self._columnas_tabla()[c.lower()] for c in columnas]
+        temporal = ruta + '.tmp'
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(_sql_nombre(c) for c in reales)} FROM asistentes WHERE _activo = 1 ORDER BY _fila")
+            with open(temporal, 'w', newline='', encoding=encoding) as f:
+                writer = csv.writer(f, delimiter=sep)
+                writer.writerow(columnas)
+                total = 0
+                while True:
+                    filas = cursor.fetchmany(5000)
+                    if not filas:
+                        break
+                    writer.writerows(['' if v is None else v for v in fila] for fila in filas)
+                    total += len(filas)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, ruta)
+            with self._conn:
+                self._conn.execute("UPDATE asistentes SET _pendiente = 0 WHERE _activo = 1 AND _pendiente = 1 AND _destino = ?",
+                                   (os.path.abspath(ruta),))
+        return total
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+# =====================================================
+# 🛰️ RÉPLICA LOCAL DE MYSQL (OFFLINE-FIRST)
+# =====================================================
+REPLICA_DB = 'replica_mysql.db'
+REPLICA_REINTENTO_SEGUNDOS = 15   # Espera entre intentos de envío de marcas pendientes
+REPLICA_LOTE_ENVIO = 50           # Marcas enviadas por pasada del hilo de reenvío
+REPLICA_VIGENCIA_SEGUNDOS = 60    # Un evento descargado hace menos de esto no se vuelve a pedir
+
+class ReplicaMySQL:
+    """Copia local (SQLite) de ``asistentes``, ``Eventos`` y ``comp4n1`` para el modo MySQL.
+
+    Al seleccionar eventos se descargan de una vez sus asistentes; a partir de
+    ahí las búsquedas del escaneo se resuelven en local y solo los IDs que no
+    están en la réplica van a MySQL (y quedan guardados). Con conexión, las
+    banderas comida/pirata se confirman con MySQL antes de aceptar un escaneo;
+    sin ella la réplica es la referencia. Las marcas de comida se aplican a la
+    réplica y entran en una cola persistente que un hilo envía a MySQL en
+    orden, reintentando mientras no haya conexión; las que MySQL rechaza por
+    otro motivo se apartan en ``marcas_fallidas`` para no bloquear la cola.
+    """
+
+    def __init__(self, ruta=REPLICA_DB):
+        self.ruta = ruta
+        self._lock = threading.RLock()
+        self._sincronizando = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._descargados = {}  # evento -> instante de la última descarga
+        self._sin_conexion_hasta = 0.0  # tras un fallo de conexión la réplica manda durante un rato
+        self._conexion = None   # se abre en el primer uso (importar el módulo no toca el disco)
+
+    @property
+    def _conn(self):
+        with self._lock:
+            if self._conexion is None:
+                self._conexion = self._abrir()
+            return self._conexion
+
+    def _abrir(self):
+        conn = sqlite3.connect(self.ruta, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")  # una marca encolada no se pierde al cortar la luz
+        # Réplicas antiguas usaban solo idUsuario como clave (un asistente en varios eventos se pisaba)
+        clave = [fila[1] for fila in sorted(conn.execute("PRAGMA table_info(asistentes)").fetchall(),
+                                             key=lambda f: f[5]) if fila[5]]
+        if clave == ['idUsuario']:
+            conn.execute("ALTER TABLE asistentes RENAME TO asistentes_v1")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS asistentes (
+                idUsuario TEXT NOT NULL,
+                Evento INTEGER NOT NULL,
+                datos TEXT NOT NULL,
+                PRIMARY KEY (idUsuario, Evento)
+            );
+            CREATE INDEX IF NOT EXISTS idx_replica_evento ON asistentes(Evento);
+            CREATE TABLE IF NOT EXISTS eventos (id INTEGER PRIMARY KEY, datos TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS empresas (id INTEGER PRIMARY KEY, nombre TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS marcas_pendientes (
+                orden INTEGER PRIMARY KEY AUTOINCREMENT,
+                idUsuario TEXT NOT NULL,
+                campo TEXT NOT NULL,
+                valor INTEGER NOT NULL,
+                fecha TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS marcas_fallidas (
+                orden INTEGER PRIMARY KEY,
+                idUsuario TEXT NOT NULL,
+                campo TEXT NOT NULL,
+                valor INTEGER NOT NULL,
+                fecha TEXT NOT NULL,
+                error TEXT NOT NULL
+            );
+        """)
+        if clave == ['idUsuario']:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO asistentes (idUsuario, Evento, datos) "
+                             "SELECT idUsuario, COALESCE(Evento, 0), datos FROM asistentes_v1")
+                conn.execute("DROP TABLE asistentes_v1")
+        return conn
+
+    @staticmethod
+    def _serializar(fila):
+        # Fechas y decimales de MySQL se guardan como texto
+        return json.dumps(fila, default=str, ensure_ascii=False)
+
+    @staticmethod
+    def _evento(fila):
+        try:
+            return int(fila.get('Evento'))
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def _clave(fila, campo):
+        """Nombre real de ``campo`` en la fila (las columnas de MySQL no siempre respetan mayúsculas)."""
+        for clave in fila:
+            if clave.lower() == campo.lower():
+                return clave
+        return campo
+
+    def guardar(self, filas):
+        """Inserta o reemplaza asistentes (diccionarios tal como salen de MySQL)."""
+        with self._lock, self._conn:
+            return self._insertar(filas)
+
+    def _insertar(self, filas):
+        # Un asistente puede estar en varios eventos: una fila por (idUsuario, Evento); sin evento → 0
+        registros = [(str(f.get('idUsuario')).strip(), self._evento(f), self._serializar(f))
+                     for f in filas if f and f.get('idUsuario') is not None]
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO asistentes (idUsuario, Evento, datos) VALUES (?, ?, ?)", registros)
+        self._aplicar_pendientes()
+        return len(registros)
+
+    def _aplicar_pendientes(self):
+        """Vuelve a aplicar sobre la réplica las marcas que MySQL aún no tiene."""
+        for id_usuario, campo, valor in self._conn.execute(
+                "SELECT idUsuario, campo, valor FROM marcas_pendientes ORDER BY orden").fetchall():
+            self._actualizar_local(id_usuario, campo, valor)
+
+    def _actualizar_local(self, id_usuario, campo, valor, evento=None):
+        """Aplica la marca a las filas del asistente (todas, como el UPDATE de MySQL, o solo las de ``evento``)."""
+        sql = "SELECT Evento, datos FROM asistentes WHERE idUsuario = ?"
+        parametros = [id_usuario]
+        if evento is not None:
+            sql += " AND Evento = ?"
+            parametros.append(evento)
+        filas = self._conn.execute(sql, parametros).fetchall()
+        for evento_fila, texto in filas:
+            datos = json.loads(texto)
+            datos[self._clave(datos, campo)] = valor
+            self._conn.execute("UPDATE asistentes SET datos = ? WHERE idUsuario = ? AND Evento = ?",
+                               (self._serializar(datos), id_usuario, evento_fila))
+        return bool(filas)
+
+    def buscar(self, id_usuario):
+        """Asistente desde la réplica o ``None`` si no se ha descargado (primero su fila de un evento activo)."""
+        eventos = [self._evento({'Evento': e}) for e in EVENTOS_ACTIVOS]
+        orden = f"Evento IN ({', '.join('?' * len(eventos))}) DESC, " if eventos else ""
+        with self._lock:
+            fila = self._conn.execute(
+                f"SELECT datos FROM asistentes WHERE idUsuario = ? ORDER BY {orden}Evento LIMIT 1",
+                [str(id_usuario).strip()] + eventos).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def confirmar(self, fila):
+        """Actualiza comida/pirata de ``fila`` con la fila de MySQL (búsqueda por clave primaria).
+
+        Sin conexión, o durante ``REPLICA_REINTENTO_SEGUNDOS`` tras un fallo de
+        conexión, se devuelve la fila de la réplica tal cual. Las marcas locales
+        aún no enviadas prevalecen sobre lo que diga MySQL. Si MySQL responde
+        pero ya no tiene la fila (baja o cambio de evento), se quita de la
+        réplica y devuelve ``None``.
+        """
+        campos = [c for c in fila if c.lower() in ('comida', 'pirata')]
+        if not campos or time.monotonic() < self._sin_conexion_hasta:
+            return fila
+        id_usuario = str(fila.get('idUsuario')).strip()
+        evento = fila.get('Evento')
+        
+        def _consulta(conn):
+            cursor = conn.cursor()
+            try:
+                columnas = ", ".join(f"`{c}`" for c in campos)
+                if evento is None:
+                    cursor.execute(f"SELECT {columnas} FROM asistentes WHERE idUsuario = %s", (id_usuario,))
+                else:
+                    cursor.execute(f"SELECT {columnas} FROM asistentes WHERE idUsuario = %s AND Evento = %s",
+                                   (id_usuario, evento))
+                return cursor.fetchone()
+            finally:
+                cursor.close()
+        
+        try:
+            valores = ejecutar_consulta(DB_CONFIG, _consulta)
+        except Exception as e:
+            if es_error_conexion(e):
+                self._sin_conexion_hasta = time.monotonic() + REPLICA_REINTENTO_SEGUNDOS
+                print(f"⚠️ Sin conexión para confirmar {id_usuario}; se usa la réplica local")
+            else:
+                print(f"⚠️ No se pudo confirmar {id_usuario} con MySQL ({e}); se usa la réplica local")
+            return fila
+        if valores is None:
+            print(f"🗑️ {id_usuario} ya no está en MySQL (evento {evento}); se quita de la réplica")
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM asistentes WHERE idUsuario = ? AND Evento = ?",
+                                   (id_usuario, self._evento(fila)))
+            return None
+        
+        fila = dict(fila)
+        with self._lock, self._conn:
+            pendientes = {c.lower() for (c,) in self._conn.execute(
+                "SELECT campo FROM marcas_pendientes WHERE idUsuario = ?", (id_usuario,))}
+            for campo, valor in zip(campos, valores):
+                if campo.lower() in pendientes or fila.get(campo) == valor:
+                    continue
+                fila[campo] = valor
+                self._actualizar_local(id_usuario, campo, valor, self._evento(fila))
+        return fila
+
+    def asistentes(self, eventos):
+        """Asistentes replicados de ``eventos`` (espera a que termine una descarga en curso)."""
+        marcadores = ", ".join("?" * len(eventos))
+        with self._sincronizando, self._lock:
+            filas = self._conn.execute(
+                f"SELECT datos FROM asistentes WHERE Evento IN ({marcadores})", list(eventos)).fetchall()
+        return [json.loads(f[0]) for f in filas]
+
+    def sincronizar(self, eventos):
+        """Descarga de golpe los asistentes de ``eventos`` y los nombres de sus empresas.
+
+        Los eventos descargados hace poco no se repiten (la precarga y el
+        pre-renderizado lo piden a la vez). Sin conexión se conserva la réplica
+        anterior. Devuelve los asistentes disponibles.
+        """
+        eventos = list(eventos)
+        with self._sincronizando:
+            ahora = time.monotonic()
+            faltan = [e for e in eventos
+                      if ahora - self._descargados.get(e, float('-inf')) >= REPLICA_VIGENCIA_SEGUNDOS]
+            if faltan:
+                try:
+                    self._descargar(faltan)
+                    for evento in faltan:
+                        self._descargados[evento] = ahora
+                except Exception as e:
+                    print(f"⚠️ No se pudo descargar la réplica ({e}); se usa la copia local")
+        
+        filas = self.asistentes(eventos)
+        self.precargar_empresas({campos_etiqueta(f)['empresa_id'] for f in filas})
+        return filas
+
+    def _descargar(self, eventos):
+        def _consulta(conn):
+            cursor = conn.cursor()
+            try:
+                marcadores = ", ".join(["%s"] * len(eventos))
+                cursor.execute(f"SELECT * FROM asistentes WHERE Evento IN ({marcadores})", eventos)
+                return ESQUEMA.filas_a_diccionarios(DB_CONFIG['database'], 'asistentes', cursor, cursor.fetchall())
+            finally:
+                cursor.close()
+        
+        filas = ejecutar_consulta(DB_CONFIG, _consulta)
+        marcadores = ", ".join("?" * len(eventos))
+        with self._lock, self._conn:
+            # Los eventos se reemplazan completos (desaparecen las bajas) en una sola transacción
+            self._conn.execute(f"DELETE FROM asistentes WHERE Evento IN ({marcadores})", eventos)
+            self._insertar(filas)
+        print(f"🛰️ Réplica local: {len(filas)} asistentes de {len(eventos)} evento(s) descargados")
+
+    def precargar_empresas(self, ids_empresa):
+        """Resuelve los nombres de empresa (MySQL si hay conexión) y los deja también en la réplica."""
+        precargar_nombres_empresas(ids_empresa)
+        nombres = []
+        for empresa_id in ids_empresa:
+            try:
+                empresa_id = int(str(empresa_id).strip())
+            except (ValueError, TypeError, AttributeError):
+                continue
+            nombre = CACHE_EMPRESAS.obtener(empresa_id)
+            if nombre is not None and nombre != str(empresa_id):
+                nombres.append((empresa_id, nombre))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO empresas (id, nombre) VALUES (?, ?)", nombres)
+
+    def nombre_empresa(self, empresa_id):
+        with self._lock:
+            fila = self._conn.execute("SELECT nombre FROM empresas WHERE id = ?", (empresa_id,)).fetchone()
+        return fila[0] if fila else None
+
+    def guardar_eventos(self, eventos):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM eventos")
+            self._conn.executemany("INSERT INTO eventos (id, datos) VALUES (?, ?)",
+                                   [(e['id'], self._serializar(e)) for e in eventos])
+
+    def eventos(self):
+        """Último catálogo de eventos guardado (más recientes primero)."""
+        with self._lock:
+            filas = self._conn.execute("SELECT datos FROM eventos").fetchall()
+        eventos = [json.loads(f[0]) for f in filas]
+        eventos.sort(key=lambda e: str(e.get('fecha') or ''), reverse=True)
+        return eventos
+
+    def marcar(self, id_usuario, campo, valor):
+        """Aplica la marca en local y la encola para MySQL. ``False`` si el ID no está replicado."""
+        id_usuario = str(id_usuario).strip()
+        with self._lock, self._conn:
+            if not self._actualizar_local(id_usuario, campo, valor):
+                return False
+            self._conn.execute(
+                "INSERT INTO marcas_pendientes (idUsuario, campo, valor, fecha) VALUES (?, ?, ?, ?)",
+                (id_usuario, campo, valor, datetime.now().isoformat(timespec='seconds')))
+        self.iniciar()
+        self._despertar.set()
+        return True
+
+    def pendientes(self):
+        """Marcas aplicadas en local que MySQL aún no ha recibido."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM marcas_pendientes").fetchone()[0]
+
+    def fallidas(self):
+        """Marcas que MySQL rechazó por un error que no es de conexión (apartadas, no se reintentan)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM marcas_fallidas").fetchone()[0]
+
+    def marcas_pendientes(self):
+        """Lista ``(idUsuario, campo, valor)`` de las marcas sin enviar, en orden."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT idUsuario, campo, valor FROM marcas_pendientes ORDER BY orden").fetchall()
+
+    def despertar(self):
+        """Reintenta el envío ya (p. ej. al recuperar la conexión)."""
+        self._despertar.set()
+
+    def iniciar(self):
+        """Arranca el hilo que envía las marcas pendientes a MySQL."""
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="replica-mysql", daemon=True)
+        self._hilo.start()
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._despertar.clear()
+            try:
+                while self._enviar_lote():
+                    pass
+            except Exception as e:
+                print(f"⚠️ Marcas pendientes sin enviar ({self.pendientes()}): {e}")
+            self._despertar.wait(REPLICA_REINTENTO_SEGUNDOS)
+
+    def _enviar_lote(self):
+        """Envía en orden hasta ``REPLICA_LOTE_ENVIO`` marcas. Devuelve ``True`` si quedan más."""
+        with self._lock:
+            marcas = self._conn.execute(
+                "SELECT orden, idUsuario, campo, valor FROM marcas_pendientes ORDER BY orden LIMIT ?",
+                (REPLICA_LOTE_ENVIO,)).fetchall()
+        for orden, id_usuario, campo, valor in marcas:
+            if self._detener.is_set():
+                return False
+            def _actualizar(conn, campo=campo, valor=valor, id_usuario=id_usuario):
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f"UPDATE asistentes SET `{campo}` = %s WHERE idUsuario = %s", (valor, id_usuario))
+                    conn.commit()
+                    return cursor.rowcount
+                finally:
+                    cursor.close()
+            
+            # Igual que la marca directa: base principal y, si no está ahí, la de eventos.
+            # Un error de conexión corta la pasada y la marca se reintenta después
+            try:
+                for config_name, config in [("principal", DB_CONFIG), ("eventos", DB_CONFIG_EVENTOS)]:
+                    if ejecutar_consulta(config, _actualizar) > 0:
+                        print(f"✅ Marca {campo} de {id_usuario} enviada a base {config_name}")
+                        break
+                else:
+                    print(f"🔍 Marca {campo} de {id_usuario} sin cambios en MySQL (ya aplicada o usuario inexistente)")
+            except Exception as e:
+                if es_error_conexion(e):
+                    raise
+                # Reintentar un error de SQL no sirve y dejaría la cola bloqueada: se aparta la marca
+                print(f"❌ Marca {campo}={valor} de {id_usuario} rechazada por MySQL, apartada en marcas_fallidas: {e}")
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        "INSERT INTO marcas_fallidas (orden, idUsuario, campo, valor, fecha, error) "
+                        "SELECT orden, idUsuario, campo, valor, fecha, ? FROM marcas_pendientes WHERE orden = ?",
+                        (str(e), orden))
+                    self._conn.execute("DELETE FROM marcas_pendientes WHERE orden = ?", (orden,))
+                continue
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM marcas_pendientes WHERE orden = ?", (orden,))
+        return len(marcas) == REPLICA_LOTE_ENVIO
+
+    def cerrar(self, espera=5):
+        """Detiene el reenvío y cierra la base local (lo no enviado sigue en la cola)."""
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(espera)
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+
+REPLICA_MYSQL = ReplicaMySQL()
+
+# =====================================================
+# 📋 TABLA DE USUARIOS VIRTUALIZADA
+# =====================================================
+TABLA_COLUMNAS = ('ID', 'Nombre', 'Apellidos', 'Empresa', 'Entrada', 'Evento', 'Pulsera', 'Mochila')
+TABLA_ALTO_FILA = 20        # Alto de fila por defecto de ttk.Treeview (si el estilo no lo indica)
+TABLA_BUSQUEDA_ESPERA_MS = 150   # Pausa de tecleo antes de aplicar el filtro
+TABLA_AUTOREFRESCO_MS = 5000     # Intervalo del refresco automático de estados (pantalla de supervisión)
+COLUMNAS_ESTADO = ('comida', 'pirata')
+# Columnas de última modificación preferidas; solo se usan si MySQL las actualiza sola (ON UPDATE)
+COLUMNAS_MARCA_TIEMPO = ('updated_at', 'fecha_modificacion', 'ultima_modificacion', 'modificado', 'timestamp')
+COLUMNA_MARCA_TIEMPO = None   # Forzar la columna de última modificación (None = detectar en information_schema)
+
+def valores_fila_usuario(usuario, eventos_dict):
+    """Valores de las columnas ``TABLA_COLUMNAS`` para un usuario."""
+    pulsera_texto = "✅ SÍ" if usuario.get('comida', 0) == 1 else "❌ NO"
+    # Mochila: pirata = 1 (no mochila), pirata = 0 (sí mochila)
+    mochila_texto = "❌ NO" if usuario.get('pirata', 0) == 1 else "✅ SÍ"
+    evento_id = usuario.get('Evento', '')
+    evento = eventos_dict.get(evento_id)
+    evento_nombre = evento['Nombre'] if evento else "No encontrado"
+    return (
+        str(usuario.get('idUsuario', '')),
+        str(usuario.get('Nombrecompleto', '')),
+        str(usuario.get('apellidos', '')),
+        str(usuario.get('Empresa', '')),
+        str(usuario.get('entrada', '')),
+        f"{evento_id} - {evento_nombre}",
+        pulsera_texto,
+        mochila_texto,
+    )
+
+def normalizar_busqueda(texto):
+    """Minúsculas sin acentos ni espacios repetidos ("José  PÉREZ" → "jose perez")."""
+    descompuesto = unicodedata.normalize('NFKD', str(texto).lower())
+    sin_acentos = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_acentos.split())
+
+class IndiceBusquedaNombres:
+    """Índice de trigramas y prefijos sobre "nombre apellidos" de un conjunto de asistentes.
+
+    Se construye una vez por conjunto. Una consulta de 3 o más caracteres
+    interseca las listas de sus trigramas (empezando por la más corta) y
+    confirma la subcadena solo en esos candidatos; una de 1-2 caracteres
+    busca nombres con alguna palabra que empiece así. Devuelve posiciones
+    en el orden original.
+    """
+
+    def __init__(self, textos):
+        self.textos = []
+        self._trigramas = {}  # trigrama -> set de posiciones
+        self._prefijos = {}   # 1-2 primeras letras de una palabra -> set de posiciones
+        self.agregar(textos)
+
+    def agregar(self, textos):
+        """Indexa ``textos`` a continuación de los ya indexados (carga por páginas)."""
+        inicio = len(self.textos)
+        self.textos.extend(normalizar_busqueda(t) for t in textos)
+        for posicion in range(inicio, len(self.textos)):
+            texto = self.textos[posicion]
+            for i in range(len(texto) - 2):
+                self._trigramas.setdefault(texto[i:i + 3], set()).add(posicion)
+            for palabra in texto.split():
+                self._prefijos.setdefault(palabra[:1], set()).add(posicion)
+                if len(palabra) > 1:
+                    self._prefijos.setdefault(palabra[:2], set()).add(posicion)
+
+    def buscar(self, consulta):
+        """Posiciones (ordenadas) cuyo texto coincide con ``consulta``; ``None`` si la consulta está vacía."""
+        consulta = normalizar_busqueda(consulta)
+        if not consulta:
+            return None
+        if len(consulta) < 3:
+            if ' ' in consulta:  # "a b": subcadena corta con espacio, sin índice útil
+                return [p for p, t in enumerate(self.textos) if consulta in t]
+            return sorted(self._prefijos.get(consulta, ()))
+        
+        listas = []
+        for i in range(len(consulta) - 2):
+            lista = self._trigramas.get(consulta[i:i + 3])
+            if not lista:
+                return []
+            listas.append(lista)
+        listas.sort(key=len)
+        candidatos = set(listas[0])
+        for lista in listas[1:]:
+            candidatos &= lista
+            if not candidatos:
+                return []
+        return sorted(p for p in candidatos if consulta in self.textos[p])
+
+
+class ModeloTablaUsuarios:
+    """Lista virtual sobre un ``ttk.Treeview``: solo existen en el widget las filas visibles.
+
+    El modelo guarda todos los usuarios y el filtro vigente (lista de iids en
+    orden); el Treeview contiene únicamente la ventana que cabe en pantalla y
+    la barra de desplazamiento se gobierna desde aquí. Cada fila usa como iid
+    el ``idUsuario`` con prefijo (y el evento como sufijo si se repite), de modo que al
+    desplazarse se insertan/borran solo las filas que entran/salen y al
+    actualizar se cambian únicamente las celdas distintas. La selección es la
+    de las filas materializadas.
+    """
+
+    @staticmethod
+    def _iid(id_usuario, evento=None):
+        # Con prefijo: un idUsuario vacío no puede chocar con la raíz '' del Treeview
+        iid = f"u{id_usuario}"
+        return iid if evento is None else f"{iid}#{evento}"
+
+    def __init__(self, tree, scrollbar, usuarios, eventos_dict):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.inicio = 0
+        self.visibles = []
+        self.texto_filtro = ''
+        self._pintadas = {}  # iid -> valores mostrados ahora en el Treeview
+        self._textos = None
+        self._cargar(usuarios, eventos_dict)
+        self.visibles = list(self._orden)
+        
+        scrollbar.configure(command=self.yview)
+        for secuencia in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            tree.bind(secuencia, self._rueda)
+        tree.bind('<Up>', lambda e: self._tecla(-1))
+        tree.bind('<Down>', lambda e: self._tecla(1))
+        tree.bind('<Prior>', lambda e: self.desplazar(-self.filas_ventana()) or 'break')
+        tree.bind('<Next>', lambda e: self.desplazar(self.filas_ventana()) or 'break')
+        tree.bind('<Configure>', lambda e: self.renderizar())
+
+    def _cargar(self, usuarios, eventos_dict):
+        self.eventos_dict = eventos_dict
+        self._por_iid = {}
+        self._orden = []
+        self._agregar(usuarios)
+        # El índice de búsqueda se construye en la primera búsqueda y solo se
+        # rehace si cambian los nombres
+        textos = [self._texto(iid) for iid in self._orden]
+        if self._textos != textos:
+            self._textos = textos
+            self._indice = None
+
+    def _agregar(self, usuarios):
+        """Registra ``usuarios`` y devuelve los iids nuevos (quedan al final del orden)."""
+        nuevos = []
+        for usuario in usuarios:
+            id_usuario = str(usuario.get('idUsuario', ''))
+            iid = self._iid(id_usuario)
+            anterior = self._por_iid.get(iid)
+            if anterior is not None and anterior.get('Evento') != usuario.get('Evento'):
+                iid = self._iid(id_usuario, usuario.get('Evento', ''))
+            if iid not in self._por_iid:
+                self._orden.append(iid)
+                nuevos.append(iid)
+            self._por_iid[iid] = usuario
+        self.usuarios = [self._por_iid[iid] for iid in self._orden]
+        return nuevos
+
+    def _texto(self, iid):
+        usuario = self._por_iid[iid]
+        return f"{usuario.get('Nombrecompleto', '')} {usuario.get('apellidos', '')}"
+
+    def anexar(self, usuarios):
+        """Añade una página de usuarios al final conservando filtro y posición."""
+        nuevos = self._agregar(usuarios)
+        if len(nuevos) != len(usuarios):
+            # Alguna fila ya estaba (p. ej. tras actualizar a mitad de carga): reindexar
+            self._textos = [self._texto(iid) for iid in self._orden]
+            self._indice = None
+        else:
+            textos = [self._texto(iid) for iid in nuevos]
+            self._textos.extend(textos)
+            if self._indice is not None:
+                self._indice.agregar(textos)
+        self._aplicar_filtro()
+        self.renderizar()
+
+    def usuario(self, iid):
+        return self._por_iid.get(iid)
+
+    def usuarios_visibles(self):
+        """Usuarios que pasan el filtro actual, en orden (no solo los materializados)."""
+        return [self._por_iid[iid] for iid in self.visibles]
+
+    def seleccionados(self):
+        return [self._por_iid[iid] for iid in self.tree.selection() if iid in self._por_iid]
+
+    def filas_ventana(self):
+        """Filas que caben en el alto actual del Treeview."""
+        try:
+            alto_fila = int(ttk.Style().lookup('Treeview', 'rowheight') or TABLA_ALTO_FILA)
+        except (tk.TclError, ValueError):
+            alto_fila = TABLA_ALTO_FILA
+        alto = self.tree.winfo_height()
+        if alto <= 1:  # aún sin dibujar: usar la altura configurada
+            return int(self.tree.cget('height'))
+        # Se descuenta el encabezado; nunca se materializa más de lo que cabe para
+        # que el Treeview no se desplace por su cuenta
+        return max(1, alto // alto_fila - 1)
+
+    def filtrar(self, texto):
+        """Aplica el filtro por nombre/apellidos (vía índice) y vuelve al principio de la lista."""
+        self.texto_filtro = texto
+        self._aplicar_filtro()
+        self.inicio = 0
+        self.renderizar()
+        return len(self.visibles)
+
+    def actualizar(self, usuarios, eventos_dict):
+        """Sustituye los datos conservando filtro y posición. Devuelve las filas cuyo contenido cambió."""
+        anteriores = {iid: valores_fila_usuario(u, self.eventos_dict) for iid, u in self._por_iid.items()}
+        self._cargar(usuarios, eventos_dict)
+        cambiadas = sum(1 for iid, u in self._por_iid.items()
+                        if anteriores.get(iid) != valores_fila_usuario(u, eventos_dict))
+        self._aplicar_filtro()
+        self.renderizar()
+        return cambiadas
+
+    def _aplicar_filtro(self):
+        if not normalizar_busqueda(self.texto_filtro):
+            self.visibles = list(self._orden)
+            return
+        if self._indice is None:
+            self._indice = IndiceBusquedaNombres(self._textos)
+        posiciones = self._indice.buscar(self.texto_filtro)
+        if posiciones is None:
+            self.visibles = list(self._orden)
+        else:
+            self.visibles = [self._orden[p] for p in posiciones]
+
+    def parchear(self, cambios):
+        """Aplica estados nuevos (diccionarios con ``idUsuario`` y los campos a cambiar).
+
+        Solo se tocan los usuarios cargados cuyo valor difiere; las celdas se
+        actualizan al redibujar. Devuelve cuántas filas cambiaron.
+        """
+        modificadas = 0
+        for cambio in cambios:
+            id_usuario = str(cambio.get('idUsuario', '')).strip()
+            evento = cambio.get('Evento')
+            for iid in (self._iid(id_usuario), self._iid(id_usuario, evento)):
+                usuario = self._por_iid.get(iid)
+                if usuario is None or (evento is not None and usuario.get('Evento') != evento):
+                    continue
+                nuevos = {campo: valor for campo, valor in cambio.items()
+                          if campo not in ('idUsuario', 'Evento') and usuario.get(campo) != valor}
+                if nuevos:
+                    usuario.update(nuevos)
+                    modificadas += 1
+        if modificadas:
+            self.renderizar()
+        return modificadas
+
+    def desplazar(self, filas):
+        self.inicio += filas
+        self.renderizar()
+
+    def yview(self, *args):
+        """Comando de la barra de desplazamiento (``moveto`` fracción / ``scroll`` n unidades|páginas)."""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self.inicio = int(float(args[1]) * len(self.visibles))
+            self.renderizar()
+        elif args[0] == 'scroll':
+            paso = int(args[1])
+            self.desplazar(paso * self.filas_ventana() if args[2] == 'pages' else paso)
+
+    def _rueda(self, event):
+        if getattr(event, 'num', None) == 4:
+            paso = -3
+        elif getattr(event, 'num', None) == 5:
+            paso = 3
+        else:
+            paso = -3 if event.delta > 0 else 3
+        self.desplazar(paso)
+        return 'break'
+
+    def _tecla(self, paso):
+        """Flechas: en el borde de la ventana se desplaza la lista en lugar de quedarse parado."""
+        hijos = self.tree.get_children()
+        if not hijos:
+            return None
+        borde = hijos[0] if paso < 0 else hijos[-1]
+        if self.tree.focus() != borde:
+            return None  # movimiento normal dentro de la ventana
+        posicion = self.inicio + hijos.index(borde) + paso
+        if 0 <= posicion < len(self.visibles):
+            self.desplazar(paso)
+            destino = self.visibles[posicion]
+            if self.tree.exists(destino):
+                self.tree.focus(destino)
+                self.tree.selection_set(destino)
+        return 'break'
+
+    def renderizar(self):
+        """Materializa la ventana actual con el mínimo de operaciones sobre el Treeview."""
+        total = len(self.visibles)
+        filas = self.filas_ventana()
+        self.inicio = max(0, min(self.inicio, total - filas))
+        objetivo = self.visibles[self.inicio:self.inicio + filas]
+        
+        deseadas = set(objetivo)
+        sobrantes = [iid for iid in self.tree.get_children() if iid not in deseadas]
+        if sobrantes:
+            self.tree.delete(*sobrantes)
+            for iid in sobrantes:
+                self._pintadas.pop(iid, None)
+        
+        for indice, iid in enumerate(objetivo):
+            valores = valores_fila_usuario(self._por_iid[iid], self.eventos_dict)
+            pintados = self._pintadas.get(iid)
+            if pintados is None:
+                self.tree.insert('', indice, iid=iid, values=valores)
+            else:
+                if self.tree.index(iid) != indice:
+                    self.tree.move(iid, '', indice)
+                # Solo las celdas distintas (normalmente Pulsera/Mochila)
+                for columna, antes, ahora in zip(TABLA_COLUMNAS, pintados, valores):
+                    if antes != ahora:
+                        self.tree.set(iid, columna, ahora)
+            self._pintadas[iid] = valores
+        
+        if total:
+            self.scrollbar.set(self.inicio / total, min(1.0, (self.inicio + filas) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+
+def estadisticas_usuarios(usuarios, modo_texto):
+    """Texto de la barra de estadísticas de la tabla de usuarios."""
+    total_usuarios = len(usuarios)
+    con_pulsera = len([u for u in usuarios if u.get('comida', 0) == 1])
+    sin_pulsera = total_usuarios - con_pulsera
     
-    if tipo_entrada and es_evento_con_tipos:
-        if not version_impresion:
-            # VERSIÓN VISTA PREVIA: Con colores y descripción de pulsera
-            # Agregar descripción del tipo de pulsera
-            descripcion_pulsera = ""
-            if 'lpn congress' in evento_lower or 'lpn' in evento_lower:
-                if 'expo' in tipo_lower:
-                    descripcion_pulsera = " • PULSERA EXPO"
-                elif 'congress' in tipo_lower:
-                    descripcion_pulsera = " • PULSERA CONGRESS"
-                else:
-                    descripcion_pulsera = " • PULSERA LPN"
-            elif 'porciforum latam' in evento_lower or 'porciforum mexico' in evento_lower:
-                descripcion_pulsera = " • PULSERA LATAM"
-            
-            texto_completo = tipo_entrada + descripcion_pulsera
-            
-            # Calcular dimensiones del texto
-            bbox_tipo = draw.textbbox((0, 0), texto_completo, font=font_entrada_evento)
-            texto_ancho = bbox_tipo[2] - bbox_tipo[0]
-            texto_alto = bbox_tipo[3] - bbox_tipo[1]
-            
-            # Usar el color de la banda como fondo (o negro por defecto)
-            fondo_tipo = banda_color if banda_color else 'black'
-            
-            # Dibujar rectángulo con color de fondo que coincide con la banda
-            draw.rectangle([texto_x, y_pos, texto_x + texto_ancho + 10, y_pos + texto_alto + 8], 
-                          fill=fondo_tipo, outline=fondo_tipo)
-            
-            # Dibujar el texto en blanco encima del fondo colorido
-            draw.text((texto_x + 5, y_pos + 4), texto_completo, font=font_entrada_evento, fill='white')
+    # Calcular mochilas usando la misma lógica compleja de prioridades
+    con_mochila = 0
+    for u in usuarios:
+        # Obtener tipo de entrada
+        entrada = u.get('entrada', '').upper()
+        pirata = u.get('pirata', 0)
+        
+        # 1ª PRIORIDAD: Si es entrada EXPO → NUNCA mochila
+        if 'EXPO' in entrada:
+            mochila = False
+        # 2ª PRIORIDAD: Si pirata=1 → NO mochila
+        elif pirata == 1:
+            mochila = False
+        # 3ª PRIORIDAD: Si pirata=0 y NO es EXPO → SÍ mochila  
+        elif pirata == 0:
+            mochila = True
         else:
-            # VERSIÓN IMPRESIÓN: Formato original simple con fondo negro
-            # Calcular dimensiones del texto
-            bbox_tipo = draw.textbbox((0, 0), tipo_entrada, font=font_entrada_evento)
-            texto_ancho = bbox_tipo[2] - bbox_tipo[0]
-            texto_alto = bbox_tipo[3] - bbox_tipo[1]
+            mochila = False
             
-            # Dibujar rectángulo negro de fondo
-            draw.rectangle([texto_x, y_pos, texto_x + texto_ancho + 10, y_pos + texto_alto + 8], 
-                          fill='black', outline='black')
+        if mochila:
+            con_mochila += 1
             
-            # Dibujar el texto en blanco encima del fondo negro
-            draw.text((texto_x + 5, y_pos + 4), tipo_entrada, font=font_entrada_evento, fill='white')
-        
-        y_pos += 60  # espaciado reducido para fuente más pequeña
-    # Si no es LPN o porciFORUM LATAM, no mostrar tipo de entrada y no agregar espacio
+    sin_mochila = total_usuarios - con_mochila
+    return f"📊 Total: {total_usuarios} usuarios | ✅ Con pulsera: {con_pulsera} | ❌ Sin pulsera: {sin_pulsera} | 🎒 Con mochila: {con_mochila} | ❌ Sin mochila: {sin_mochila} | Fuente: {modo_texto}"
 
-    # EVENTO
-    for linea in wrap(f" - {nombre_evento}", font_entrada_evento, texto_w)[:2]:
-        draw.text((texto_x, y_pos), linea, font=font_entrada_evento, fill='black')
-        y_pos += 60  # espaciado reducido para fuente más pequeña
+class FuenteCambios:
+    """Origen de cambios de estado (comida/pirata) para el refresco incremental de la tabla.
 
-    # EMPRESA (ahora después del evento)
-    for linea in wrap(empresa, font_empresa, texto_w)[:3]:
-        draw.text((texto_x, y_pos), linea, font=font_empresa, fill='black')
-        y_pos += 90  # más separación
+    ``preparar()`` fija el punto de partida antes de cargar la tabla y
+    ``cambios()`` devuelve las filas modificadas desde la última llamada
+    (diccionarios para ``ModeloTablaUsuarios.parchear``) o ``None`` si hay que
+    recargar todo.
+    """
 
-    # QR (más pequeño: 75% del alto disponible)
-    qr_size = int((H - pad*2) * 0.75)
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10, border=2
-    )
-    qr.add_data(str(id_usuario))
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white").resize((qr_size, qr_size))
+    def __init__(self, eventos):
+        self.eventos = list(eventos)
+        self.en_curso = threading.Lock()  # evita dos consultas solapadas
 
-    qr_x = W - qr_ancho + (qr_ancho - qr_size)//2 - pad
-    qr_y = (H - qr_size)//2
-    img.paste(qr_img, (qr_x, qr_y))
+    def preparar(self):
+        pass
 
-    return img
+    def cambios(self):
+        raise NotImplementedError
 
 
+class FuenteCambiosCSV(FuenteCambios):
+    """Cambios del modo CSV leídos del registro de marcas del almacén offline."""
 
-def imprimir_etiqueta(img, impresora_manual=None):
-    """Imprime en Brother QL en TODAS las plataformas"""
-    try:
-        # Intentar impresión Brother QL en cualquier sistema operativo
-        if IS_WINDOWS:
-            # Windows: usar win32print
-            return imprimir_etiqueta_windows(img, impresora_manual)
-        else:
-            # Mac/Linux: usar brother_ql directamente
-            return imprimir_etiqueta_brother_ql(img)
-            
-    except Exception as e:
-        print(f"❌ Error de impresión: {e}")
-        # Solo como último recurso, guardar archivo
-        print("⚠️ Impresión falló, guardando archivo como backup...")
-        return guardar_etiqueta_archivo(img)
+    def __init__(self, almacen, eventos):
+        super().__init__(eventos)
+        self.almacen = almacen
+        self._secuencia = almacen.secuencia()
 
-def imprimir_etiqueta_brother_ql(img):
-    """Imprime usando brother_ql en Mac/Linux"""
-    try:
-        print("🖨️ Imprimiendo con brother_ql...")
-        
-        # Intentar usar brother_ql
-        from brother_ql import BrotherQLRaster, create_label
-        from brother_ql.backends import backend_factory, guess_backend
-        
-        # Detectar impresora Brother QL
-        backend = guess_backend("usb://")
-        if not backend:
-            # Intentar con otros backends
-            for backend_name in ['pyusb', 'linux_kernel']:
-                try:
-                    backend = backend_factory(backend_name)
-                    break
-                except:
-                    continue
-        
-        if not backend:
-            raise Exception("No se encontró impresora Brother QL conectada")
-        
-        # Crear raster
-        qlr = BrotherQLRaster('QL-700')  # o QL-600, QL-800
-        
-        # Convertir imagen a formato Brother QL
-        instructions = create_label(qlr, img, '62')  # etiqueta de 62mm
-        
-        # Enviar a impresora
-        backend.write(instructions)
-        backend.dispose()
-        
-        print("✅ ¡Impresión enviada exitosamente con brother_ql!")
-        return True
-        
-    except ImportError:
-        raise Exception("brother_ql no instalado. Instalar con: pip install brother_ql")
-    except Exception as e:
-        raise Exception(f"Error imprimiendo con brother_ql: {str(e)}")
+    def preparar(self):
+        self._secuencia = self.almacen.secuencia()
 
-def imprimir_etiqueta_windows(img, impresora_manual=None):
-    """Imprime usando win32print (método Windows nativo más confiable).
-    
-    Args:
-        img: Imagen PIL a imprimir
-        impresora_manual: Nombre de impresora seleccionada manualmente (opcional)
+    def cambios(self):
+        self._secuencia, ids = self.almacen.cambios_desde(self._secuencia)
+        if ids is None:
+            return None
+        return self.almacen.usuarios(self.eventos, ids=ids) if ids else []
+
+
+_COLUMNA_TIEMPO_VERIFICADA = {}   # (base, versión de ESQUEMA) -> columna con ON UPDATE o None
+
+def columna_marca_tiempo(config):
+    """Columna de ``asistentes`` que MySQL actualiza en cada UPDATE (``ON UPDATE CURRENT_TIMESTAMP``).
+
+    Un nombre como ``updated_at`` no basta: si la columna no se actualiza sola,
+    el refresco incremental perdería cambios. Se comprueba ``EXTRA`` en
+    ``information_schema.COLUMNS`` (o se usa ``COLUMNA_MARCA_TIEMPO``); sin
+    columna verificada devuelve ``None`` y se usa la proyección completa.
     """
+    if COLUMNA_MARCA_TIEMPO:
+        return COLUMNA_MARCA_TIEMPO
+    clave = (config['database'], ESQUEMA.version)
+    if clave in _COLUMNA_TIEMPO_VERIFICADA:
+        return _COLUMNA_TIEMPO_VERIFICADA[clave]
+    
+    def _consulta(conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COLUMN_NAME, EXTRA FROM information_schema.COLUMNS "
+                           "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'asistentes'", (config['database'],))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+    
     try:
-        import win32print
-        import win32ui
-        from PIL import ImageWin
-        import tempfile
-        import os
-        
-        # 🔄 REFRESCAR lista de impresoras cada vez (evita caché)
-        # Flag 6 = PRINTER_ENUM_LOCAL (2) | PRINTER_ENUM_CONNECTIONS (4)
-        # Esto fuerza a Windows a refrescar la lista completa de impresoras
-        print("🔍 Escaneando impresoras disponibles...")
-        impresoras = []
-        for printer_info in win32print.EnumPrinters(6):  # 6 = LOCAL + NETWORK
-            nombre = printer_info[2]
-            if 'Brother' in nombre and ('QL-600' in nombre or 'QL-700' in nombre or 'QL-800' in nombre):
-                impresoras.append(nombre)
-                print(f"   ✅ Encontrada: {nombre}")
-        
-        if not impresoras:
-            raise Exception("No se encontró ninguna impresora Brother QL instalada en Windows. Instala el driver oficial.")
-        
-        # Usar impresora manual si se especificó, sino la primera encontrada
-        if impresora_manual and impresora_manual in impresoras:
-            nombre_impresora = impresora_manual
-            print(f"🎯 Usando impresora seleccionada: {nombre_impresora}")
-        else:
-            nombre_impresora = impresoras[0]
-            print(f"✅ Usando impresora por defecto: {nombre_impresora}")
-        
-        # 📤 Crear NUEVO contexto de impresión (evita caché de DC)
-        hDC = win32ui.CreateDC()
-        hDC.CreatePrinterDC(nombre_impresora)
-        
-        # Obtener resolución de la impresora
-        horz_res = hDC.GetDeviceCaps(8)  # HORZRES 
-        vert_res = hDC.GetDeviceCaps(10) # VERTRES 
-        print(f"Resolución impresora: {horz_res}x{vert_res} píxeles")
-        
-        # Preparar imagen para impresión
-        dib = ImageWin.Dib(img)
-        
-        # Iniciar documento
-        hDC.StartDoc("Etiqueta QR")
-        hDC.StartPage()
-        
-        # Calcular tamaño manteniendo proporciones
-        img_width, img_height = img.size
-        scale_x = horz_res / img_width
-        scale_y = vert_res / img_height
-        scale = min(scale_x, scale_y)
-        
-        final_width = int(img_width * scale)
-        final_height = int(img_height * scale)
-        
-        # Centrar en el papel
-        x_offset = (horz_res - final_width) // 2
-        y_offset = (vert_res - final_height) // 2
-        
-        # Imprimir manteniendo proporciones
-        dib.draw(hDC.GetHandleOutput(), (x_offset, y_offset, x_offset + final_width, y_offset + final_height))
-        
-        hDC.EndPage()
-        hDC.EndDoc()
-        hDC.DeleteDC()  # ✨ Liberar contexto (evita caché)
-        
-        print("✅ ¡Impresión enviada exitosamente!")
-        return True
-        
-    except ImportError:
-        raise Exception("Instala pywin32: pip install pywin32")
+        columnas = ejecutar_consulta(config, _consulta)
     except Exception as e:
-        print(f"❌ Error en impresión: {e}")
-        raise Exception(f"Error al imprimir: {str(e)}")
+        if es_error_conexion(e):
+            raise
+        print(f"⚠️ No se pudo leer information_schema ({e}); refresco por proyección completa")
+        columnas = []
+    automaticas = {nombre.lower(): nombre for nombre, extra in columnas
+                   if 'on update' in str(extra or '').lower()}
+    columna = next((automaticas[c] for c in COLUMNAS_MARCA_TIEMPO if c in automaticas),
+                   next(iter(automaticas.values()), None))
+    _COLUMNA_TIEMPO_VERIFICADA[clave] = columna
+    return columna
 
-def guardar_etiqueta_archivo(img):
-    """Guarda la etiqueta como archivo para Mac/Linux - SIMULA IMPRESIÓN"""
-    try:
-        # Crear directorio de etiquetas si no existe
-        etiquetas_dir = os.path.join(os.path.expanduser("~"), "Etiquetas_QR")
-        if not os.path.exists(etiquetas_dir):
-            os.makedirs(etiquetas_dir)
-        
-        # Generar nombre único con timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"etiqueta_qr_{timestamp}.png"
-        filepath = os.path.join(etiquetas_dir, filename)
-        
-        # Guardar imagen
-        img.save(filepath, "PNG", dpi=(300, 300))
-        
-        print(f"✅ Etiqueta 'impresa' (guardada) en: {filepath}")
+
+class FuenteCambiosMySQL(FuenteCambios):
+    """Cambios del modo MySQL.
+
+    Si ``asistentes`` tiene una columna de última modificación que MySQL
+    actualiza sola (``columna_marca_tiempo``) se piden solo las filas con
+    marca igual o posterior a la más alta vista; si no, se lee la proyección
+    mínima ``idUsuario, Evento, comida, pirata`` y el modelo descarta lo que
+    no cambió. Las marcas de este puesto aún sin enviar se superponen encima.
+    """
+
+    def __init__(self, eventos):
+        super().__init__(eventos)
+        self.columna_tiempo = None
+        self.marca = None
+
+    def _columnas(self):
+        """Columnas de estado y si la columna de tiempo elegida sigue en la tabla."""
+        base = DB_CONFIG['database']
+        reales = {c.lower(): c for c in ESQUEMA.conocidas(base, 'asistentes')}
+        if not reales:
+            return list(COLUMNAS_ESTADO), True
+        estados = [reales[c] for c in COLUMNAS_ESTADO if c in reales]
+        vigente = self.columna_tiempo is None or self.columna_tiempo.lower() in reales
+        return estados, vigente
+
+    def preparar(self):
+        self.columna_tiempo = columna_marca_tiempo(DB_CONFIG)
+        self.marca = None
+        if self.columna_tiempo is None:
+            return
+        marcadores = ", ".join(["%s"] * len(self.eventos))
         
-        # EN MODO AUTO: NO mostrar popup, solo log silencioso
-        # EN MODO MANUAL: Mostrar popup informativo
-        return filepath
+        def _consulta(conn):
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"SELECT MAX(`{self.columna_tiempo}`) FROM asistentes WHERE Evento IN ({marcadores})",
+                               self.eventos)
+                return cursor.fetchone()[0]
+            finally:
+                cursor.close()
         
-    except Exception as e:
-        print(f"Error guardando etiqueta: {e}")
-        raise Exception(f"Error al imprimir etiqueta: {str(e)}")
+        self.marca = ejecutar_consulta(DB_CONFIG, _consulta)
+        print(f"🕒 Refresco incremental por {self.columna_tiempo} desde {self.marca}")
 
-def verificar_archivo_log_disponible():
-    """Verifica si el archivo de log está disponible para escritura."""
-    try:
-        # Intentar abrir el archivo para escritura y cerrarlo inmediatamente
-        with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            pass
-        return True
-    except PermissionError:
-        return False
-    except Exception:
-        return False
+    def cambios(self):
+        estados, vigente = self._columnas()
+        if not vigente:
+            return None  # la columna de tiempo ya no está: recargar (preparar vuelve a elegirla)
+        tiempo = self.columna_tiempo
+        seleccion = ", ".join(f"`{c}`" for c in ['idUsuario', 'Evento'] + estados + ([tiempo] if tiempo else []))
+        marcadores = ", ".join(["%s"] * len(self.eventos))
+        consulta = f"SELECT {seleccion} FROM asistentes WHERE Evento IN ({marcadores})"
+        parametros = list(self.eventos)
+        if tiempo and self.marca is not None:
+            # >= por la resolución de la marca: reaplicar una fila ya vista no cambia nada
+            consulta += f" AND `{tiempo}` >= %s"
+            parametros.append(self.marca)
+        
+        def _consulta(conn):
+            cursor = cursor_servidor(conn)
+            try:
+                cursor.execute(consulta, parametros)
+                return [dict(zip([d[0] for d in cursor.description], fila)) for fila in cursor.fetchall()]
+            finally:
+                cursor.close()
+        
+        filas = ejecutar_consulta(DB_CONFIG, _consulta)
+        por_id = {}
+        for fila in filas:
+            if tiempo:
+                momento = fila.pop(tiempo)
+                if momento is not None and (self.marca is None or momento > self.marca):
+                    self.marca = momento
+            por_id[(str(fila['idUsuario']), fila['Evento'])] = fila
+        
+        # Marcas de este puesto aún sin enviar: MySQL todavía no las refleja
+        pendientes = {}
+        for id_usuario, campo, valor in REPLICA_MYSQL.marcas_pendientes():
+            pendientes.setdefault(id_usuario, {})[campo] = valor
+        for clave, fila in por_id.items():
+            fila.update(pendientes.pop(clave[0], {}))
+        cambios = list(por_id.values())
+        cambios.extend(dict(campos, idUsuario=id_usuario) for id_usuario, campos in pendientes.items())
+        return cambios
 
-def log_impresion(datos):
-    """Registra la impresión en el archivo de log con manejo de errores mejorado."""
-    try:
-        with open(LOG_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                datetime.now().isoformat(),
-                datos.get('idUsuario'),
-                datos.get('Nombrecompleto'),
-                datos.get('apellidos'),
-                datos.get('Empresa'),
-                datos.get('Evento', ''),
-                datos.get('Dia')
-            ])
-        print(f"✅ Log de impresión guardado para usuario {datos.get('idUsuario')}")
-    except PermissionError:
-        print(f"⚠️ No se pudo escribir el log de impresión: archivo '{LOG_FILE}' en uso o sin permisos")
-        print(f"💡 Sugerencia: Cierra Excel u otros programas que puedan tener abierto el archivo")
-        # Intentar crear un archivo alternativo con timestamp
-        try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            log_alternativo = f"log_impresiones_backup_{timestamp}.csv"
-            with open(log_alternativo, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    datetime.now().isoformat(),
-                    datos.get('idUsuario'),
-                    datos.get('Nombrecompleto'),
-                    datos.get('apellidos'),
-                    datos.get('Empresa'),
-                    datos.get('Evento', ''),
-                    datos.get('Dia')
-                ])
-            print(f"✅ Log guardado en archivo alternativo: {log_alternativo}")
-        except Exception as e2:
-            print(f"❌ Error crítico guardando log: {e2}")
-    except Exception as e:
-        print(f"❌ Error inesperado al guardar log de impresión: {e}")
+# =====================================================
+# ⚡ PIPELINE ASÍNCRONO DE ESCANEO
+# =====================================================
+ESCANEO_COLA_MAXIMA = 64      # Escaneos que se pueden acumular mientras el hilo trabaja
+ESCANEO_SONDEO_UI_MS = 30     # Frecuencia con la que el hilo principal aplica resultados
 
 # =====================================================
 # 🏢 CLASE PRINCIPAL - INTERFAZ PROFESIONAL
@@ -951,14 +3878,19 @@ class SistemaEtiquetasProfesional(tk.Tk):
         self.configurar_ventana_principal()
         self.configurar_tema()
         self.auto_mode = tk.BooleanVar(value=AUTO_MODE)
+        self.prerender_mode = tk.BooleanVar(value=False)  # Pre-renderizar etiquetas de los eventos activos
+        self.prerender_activo = False
         self.datos_actual = None
         self.img_etiqueta = None
         self.log_actividad = []  # Lista para guardar toda la actividad
+        self.indice_log_accesos = IndiceLogAccesos(ACCESOS_LOG_FILE)  # Visor paginado del historial
         
         # Variables para manejo de CSV - SISTEMA MULTI-EVENTO MEJORADO
         self.modo_csv = False
-        self.datos_csv = None  # DataFrame maestro que contiene todos los eventos
+        self.almacen_csv = AlmacenOffline()  # SQLite local con los asistentes de todos los CSV cargados
+        self.destino_csv = None  # CSV al que se exportan las marcas (se resuelve en la primera marca)
         self.eventos_csv = None
+        self.nombres_eventos_csv = {}  # id de evento (int) → nombre, construido al cargar eventos CSV
         self.archivo_csv_actual = None
         self.archivo_eventos_csv = None
         self.mapeo_columnas = {}
@@ -984,6 +3916,27 @@ class SistemaEtiquetasProfesional(tk.Tk):
         # Estado de conexión
         self.estado_conexion = False
         self.verificar_conexiones_inicial()
+        
+        # Al cerrar se exportan las marcas CSV pendientes y se detienen los hilos
+        self.protocol("WM_DELETE_WINDOW", self.al_cerrar)
+        
+        # Pipeline de escaneo: la cola de entrada la consume un hilo dedicado y
+        # los resultados vuelven al hilo de Tk a través de cola_ui + after()
+        self.cola_escaneos = queue.Queue(maxsize=ESCANEO_COLA_MAXIMA)
+        self.cola_ui = queue.Queue()
+        self.hilo_escaneos = threading.Thread(target=self.trabajador_escaneos, name="escaneos", daemon=True)
+        self.hilo_escaneos.start()
+        self.after(ESCANEO_SONDEO_UI_MS, self.procesar_cola_ui)
+        
+        # Mantener el catálogo de eventos al día sin bloquear los escaneos
+        CATALOGO_EVENTOS.iniciar_refresco()
+        
+        # Descubrir impresoras en segundo plano (el primer escaneo ya las encuentra resueltas)
+        REGISTRO_IMPRESORAS.iniciar_refresco()
+        REPLICA_MYSQL.iniciar()  # marcas de sesiones anteriores aún sin enviar
+        
+        # Abrir las fuentes de la etiqueta antes del primer escaneo
+        threading.Thread(target=precargar_fuentes, name="precarga-fuentes", daemon=True).start()
 
     def configurar_ventana_principal(self):
         """Configura la ventana principal con estilo profesional."""
@@ -1266,6 +4219,12 @@ class SistemaEtiquetasProfesional(tk.Tk):
                                            state='disabled')
         self.btn_actualizar_csv.pack(side='left', padx=(0, 10))
         
+        self.btn_exportar_csv = ttk.Button(fila2,
+                                         text="💾 Exportar CSV", 
+                                         command=self.exportar_csv,
+                                         state='disabled')
+        self.btn_exportar_csv.pack(side='left', padx=(0, 10))
+        
         self.btn_descargar_csv = ttk.Button(fila2,
                                           text="🗑️ Descargar CSV", 
                                           command=self.descargar_csv,
@@ -1306,6 +4265,12 @@ class SistemaEtiquetasProfesional(tk.Tk):
                                          variable=self.auto_mode)
         self.auto_check.pack(side='left')
         
+        self.prerender_check = ttk.Checkbutton(controles,
+                                              text="⚡ Pre-renderizar etiquetas",
+                                              variable=self.prerender_mode,
+                                              command=self.on_toggle_prerender)
+        self.prerender_check.pack(side='left', padx=(15, 0))
+        
         # Búsqueda manual
         manual_frame = ttk.Frame(controles)
         manual_frame.pack(side='right')
@@ -1477,15 +4442,14 @@ class SistemaEtiquetasProfesional(tk.Tk):
         self.btn_print.pack(side='left', padx=(0, 10))
         self.btn_print['state'] = 'disabled'
         
-        # Botón para seleccionar impresora (solo Windows)
-        if IS_WINDOWS:
-            self.btn_seleccionar_impresora = ttk.Button(control_frame,
-                                                       text="🖨️ Seleccionar Impresora",
-                                                       command=self.seleccionar_impresora)
-            self.btn_seleccionar_impresora.pack(side='left', padx=(0, 10))
-            
-            # Variable para almacenar la impresora seleccionada
-            self.impresora_seleccionada = None
+        # Botón para seleccionar impresora
+        self.btn_seleccionar_impresora = ttk.Button(control_frame,
+                                                   text="🖨️ Seleccionar Impresora",
+                                                   command=self.seleccionar_impresora)
+        self.btn_seleccionar_impresora.pack(side='left', padx=(0, 10))
+        
+        # Variable para almacenar la impresora seleccionada
+        self.impresora_seleccionada = None
         
         # Información adicional
         info_frame = ttk.Frame(control_frame)
@@ -1593,6 +4557,8 @@ class SistemaEtiquetasProfesional(tk.Tk):
             # Actualizar solo si cambió el estado
             if tiene_internet != self.tiene_internet:
                 self.tiene_internet = tiene_internet
+                if tiene_internet:
+                    REPLICA_MYSQL.despertar()  # enviar ya las marcas acumuladas sin conexión
                 # Usar una bandera para actualizar desde el hilo principal
                 self.estado_internet_cambio = True
             
@@ -1624,28 +4590,26 @@ class SistemaEtiquetasProfesional(tk.Tk):
         self.after(10000, self.verificar_internet_periodico)
     
     def verificar_conexiones_inicial(self):
-        """Verifica las conexiones iniciales y actualiza el estado."""
+        """Verifica las conexiones iniciales y deja los pools precalentados."""
+        def _ping(conn):
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+        
         try:
-            # Configuración específica para evitar problemas de localización
-            config_principal = DB_CONFIG.copy()
-            config_principal['raise_on_warnings'] = False
-            
-            config_eventos = DB_CONFIG_EVENTOS.copy()
-            config_eventos['raise_on_warnings'] = False
-            
-            # Verificar conexión principal
-            with mysql.connector.connect(**config_principal) as conn:
-                if conn.is_connected():
-                    self.estado_conexion = True
-                    print("✅ Conexión principal establecida")
-                    
+            # Verificar conexión principal (la conexión queda abierta en el pool)
+            ejecutar_consulta(DB_CONFIG, _ping)
+            self.estado_conexion = True
+            print("✅ Conexión principal establecida")
+            
             # Verificar conexión de eventos
-            with mysql.connector.connect(**config_eventos) as conn:
-                if conn.is_connected():
-                    print("✅ Conexión de eventos establecida")
-                    return
+            ejecutar_consulta(DB_CONFIG_EVENTOS, _ping)
+            print("✅ Conexión de eventos establecida")
                     
-        except mysql.connector.Error as e:
+        except _ERRORES_CONEXION as e:
             self.log_message(f"Error de conexión MySQL: {str(e)}", "ERROR")
         except Exception as e:
             self.log_message(f"Error de conexión: {str(e)}", "ERROR")
@@ -1667,70 +4631,18 @@ class SistemaEtiquetasProfesional(tk.Tk):
             msg = f"ACCESO DENEGADO - ID: {id_usuario} | Razón: {razon}"
             self.registrar_actividad("ERROR", msg, datos)
         
-    def obtener_eventos_seguro(self):
-        """Obtiene eventos con conexión robusta."""
+    def obtener_eventos_seguro(self, forzar=False):
+        """Obtiene los eventos desde el catálogo en memoria (consulta la BD solo si venció)."""
         try:
-            self.log_message("Cargando eventos desde base de datos...", "INFO")
+            consultar = forzar or not CATALOGO_EVENTOS.vigente()
+            if consultar:
+                self.log_message("Cargando eventos desde base de datos...", "INFO")
             
-            # Estrategia principal: PyMySQL
-            try:
-                import pymysql
-                conn = pymysql.connect(
-                    host=DB_CONFIG_EVENTOS['host'],
-                    user=DB_CONFIG_EVENTOS['user'],
-                    password=DB_CONFIG_EVENTOS['password'],
-                    database=DB_CONFIG_EVENTOS['database'],
-                    connect_timeout=10
-                )
-                
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, Nombre, fecha, dia FROM Eventos ORDER BY fecha DESC")
-                resultados = cursor.fetchall()
-                
-                eventos = []
-                for r in resultados:
-                    eventos.append({
-                        'id': r[0],
-                        'Nombre': r[1],
-                        'fecha': r[2],
-                        'dia': r[3]
-                    })
-                
-                cursor.close()
-                conn.close()
-                
-                self.log_message(f"{len(eventos)} eventos cargados con PyMySQL", "SUCCESS")
-                return eventos
-                
-            except ImportError:
-                self.log_message("📌 PyMySQL no disponible, usando mysql.connector...", "INFO")
-                # Fallback: mysql.connector con charset latin1
-                conn = mysql.connector.connect(
-                    host=DB_CONFIG_EVENTOS['host'],
-                    user=DB_CONFIG_EVENTOS['user'], 
-                    password=DB_CONFIG_EVENTOS['password'],
-                    database=DB_CONFIG_EVENTOS['database'],
-                    charset='latin1'
-                )
-                
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, Nombre, fecha, dia FROM Eventos ORDER BY fecha DESC")
-                resultados = cursor.fetchall()
-                
-                eventos = []
-                for r in resultados:
-                    eventos.append({
-                        'id': r[0],
-                        'Nombre': r[1],
-                        'fecha': r[2], 
-                        'dia': r[3]
-                    })
-                
-                cursor.close()
-                conn.close()
-                
-                self.log_message(f"{len(eventos)} eventos cargados con mysql.connector", "SUCCESS")
-                return eventos
+            eventos = CATALOGO_EVENTOS.eventos(forzar=forzar)
+            
+            if consultar:
+                self.log_message(f"{len(eventos)} eventos cargados con {obtener_pool(DB_CONFIG_EVENTOS).driver}", "SUCCESS")
+            return eventos
                 
         except Exception as e:
             self.log_message(f"Error al cargar eventos: {str(e)}", "ERROR")
@@ -1756,7 +4668,8 @@ class SistemaEtiquetasProfesional(tk.Tk):
             titulo_ventana = "🔹 Seleccionar Eventos Activos (MODO OFFLINE - CSV)"
             mensaje_error = "No se pudieron cargar los eventos desde el archivo CSV.\n\nVerifique que el archivo 'Eventos_Etiquetas.csv' esté presente y tenga la estructura correcta."
         else:
-            eventos = self.obtener_eventos_seguro()
+            # Selección explícita: refrescar el catálogo para ver eventos nuevos
+            eventos = self.obtener_eventos_seguro(forzar=True)
             titulo_ventana = "🔹 Seleccionar Eventos Activos (MODO ONLINE - MySQL)"
             mensaje_error = "No se pudieron cargar los eventos desde la base de datos.\n\n" + \
                           "Posibles causas:\n" + \
@@ -1819,6 +4732,8 @@ class SistemaEtiquetasProfesional(tk.Tk):
             global EVENTOS_ACTIVOS
             EVENTOS_ACTIVOS = [evento_id for evento_id, var in vars_eventos.items() if var.get()]
             self.actualizar_eventos_display()
+            self.precargar_datos_eventos()
+            self.prerenderizar_etiquetas_eventos()
             modo_texto = "CSV" if self.modo_csv else "MySQL"
             messagebox.showinfo("Éxito", f"Se han activado {len(EVENTOS_ACTIVOS)} eventos en modo {modo_texto}")
             ventana.destroy()
@@ -1846,13 +4761,13 @@ class SistemaEtiquetasProfesional(tk.Tk):
                 texto += f"   👥 Registros: {info['filas']}\n"
                 texto += f"   🕒 Cargado: {fecha_carga}\n\n"
             
-            total_registros = len(self.datos_csv) if hasattr(self, 'datos_csv') and self.datos_csv is not None else 0
+            total_registros = self.almacen_csv.total()
             texto += f"📊 Total registros combinados: {total_registros}\n"
             texto += f"💾 Trabajando completamente OFFLINE"
             
-        elif self.modo_csv and hasattr(self, 'datos_csv') and self.datos_csv is not None:
+        elif self.modo_csv and self.hay_datos_csv():
             # Modo CSV con datos cargados pero sin eventos_cargados (sistema anterior)
-            total_registros = len(self.datos_csv)
+            total_registros = self.almacen_csv.total()
             archivo_nombre = os.path.basename(self.archivo_csv_actual) if self.archivo_csv_actual else "archivo.csv"
             
             texto = f"� MODO OFFLINE (CSV) - Sistema Tradicional:\n\n"
@@ -1913,7 +4828,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
     def verificar_y_actualizar_eventos(self):
         """Verifica si hay eventos CSV cargados y actualiza el display."""
         print(f"🔍 Verificando eventos: modo_csv={self.modo_csv}, eventos_cargados={len(self.eventos_cargados)}")
-        print(f"🔍 datos_csv exists: {hasattr(self, 'datos_csv') and self.datos_csv is not None}")
+        print(f"🔍 Datos CSV cargados: {self.almacen_csv.total()} registros")
         
         # Si estamos en modo CSV y hay eventos cargados, actualizar display
         if self.modo_csv and self.eventos_cargados:
@@ -1921,7 +4836,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
             self.actualizar_eventos_display()
         # Si no hay eventos CSV pero hay datos CSV cargados, podría ser que se cargó un CSV
         # pero no se registró en eventos_cargados (caso legacy)
-        elif self.modo_csv and hasattr(self, 'datos_csv') and self.datos_csv is not None:
+        elif self.modo_csv and self.hay_datos_csv():
             print(f"🔄 Datos CSV detectados sin eventos_cargados, actualizando display")
             self.actualizar_eventos_display()
         # NUEVO: Forzar actualización si hay archivo CSV actual
@@ -1938,7 +4853,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
         
         # Si todavía muestra "NO HAY EVENTOS ACTIVOS" pero hay CSV cargado, actualizar
         if "NO HAY EVENTOS ACTIVOS SELECCIONADOS" in texto_actual:
-            if (self.modo_csv and hasattr(self, 'datos_csv') and self.datos_csv is not None) or \
+            if (self.modo_csv and self.hay_datos_csv()) or \
                (hasattr(self, 'archivo_csv_actual') and self.archivo_csv_actual):
                 print("🔄 Detectado CSV cargado, forzando actualización del display")
                 self.actualizar_eventos_display()
@@ -1950,9 +4865,9 @@ class SistemaEtiquetasProfesional(tk.Tk):
         # Verificar todas las condiciones posibles de CSV cargado
         csv_cargado = False
         
-        if self.modo_csv and hasattr(self, 'datos_csv') and self.datos_csv is not None:
+        if self.modo_csv and self.hay_datos_csv():
             csv_cargado = True
-            print("✅ CSV detectado vía datos_csv")
+            print("✅ CSV detectado vía almacén offline")
         
         if hasattr(self, 'archivo_csv_actual') and self.archivo_csv_actual:
             csv_cargado = True
@@ -2220,25 +5135,26 @@ class SistemaEtiquetasProfesional(tk.Tk):
             # 🎯 PROCESAR DATOS DEL CSV
             # ===============================================
             
-            # Limpiar y preparar datos
-            datos['idUsuario'] = datos['idUsuario'].astype(str).str.strip()
-            if 'Nombrecompleto' in datos.columns:
-                datos['Nombrecompleto'] = datos['Nombrecompleto'].astype(str).str.strip()
-            if 'Apellidos' in datos.columns:
-                datos['Apellidos'] = datos['Apellidos'].astype(str).str.strip()
+            # Limpiar textos y banderas antes de importar al almacén offline
+            datos = normalizar_datos_csv(datos)
+            
+            # Exportar marcas pendientes antes de que cambie el archivo destino
+            self.exportar_pendientes_csv()
+            self.destino_csv = None
             
             # ===============================================
             # 🎯 INTEGRAR CON SISTEMA MULTI-EVENTO
             # ===============================================
             
-            # Si es el primer CSV, inicializar master CSV
+            # Importar al almacén offline (recupera marcas sin exportar de este archivo)
+            recuperadas = self.almacen_csv.importar(datos, archivo)
+            if recuperadas:
+                self.log_message(f"♻️ {recuperadas} marca(s) recuperadas de {os.path.basename(archivo)}", "WARNING")
+            
             if not self.csv_maestro_inicializado:
-                self.datos_csv = datos.copy()
                 self.csv_maestro_inicializado = True
                 self.log_message("🎯 CSV maestro inicializado", "INFO")
             else:
-                # Agregar datos al CSV maestro (sin duplicar headers)
-                self.datos_csv = pd.concat([self.datos_csv, datos], ignore_index=True)
                 self.log_message(f"📝 Datos agregados al CSV maestro", "INFO")
             
             # Registrar el evento como cargado
@@ -2255,18 +5171,16 @@ class SistemaEtiquetasProfesional(tk.Tk):
             EVENTOS_ACTIVOS.clear()
             
             # OBTENER eventos reales del CSV cargado
-            if self.datos_csv is not None:
+            if self.hay_datos_csv():
                 try:
-                    eventos_reales = sorted(self.datos_csv['Evento'].unique())
                     # Agregar todos los eventos reales encontrados en el CSV
-                    for evento_id in eventos_reales:
-                        if pd.notna(evento_id):
-                            EVENTOS_ACTIVOS.append(int(evento_id))
+                    for evento_id in self.almacen_csv.eventos():
+                        EVENTOS_ACTIVOS.append(int(evento_id))
                     print(f"✅ EVENTOS REALES CARGADOS: {EVENTOS_ACTIVOS}")
                 except Exception as e:
                     print(f"❌ Error obteniendo eventos del CSV: {e}")
                     # Fallback: usar primer evento disponible si hay datos
-                    if len(self.datos_csv) > 0:
+                    if self.almacen_csv.total() > 0:
                         EVENTOS_ACTIVOS.append(999)  # Solo como fallback
                         print(f"🔧 FALLBACK: Evento 999 agregado como backup")
             else:
@@ -2275,6 +5189,8 @@ class SistemaEtiquetasProfesional(tk.Tk):
             
             # FORZAR actualización del display
             self.after(100, self.actualizar_eventos_display)
+            self.precargar_datos_eventos()
+            self.prerenderizar_etiquetas_eventos()
             
             # Actualizar modo CSV y variables necesarias
             self.modo_csv = True
@@ -2295,6 +5211,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
             
             # Activar botones relevantes
             self.btn_actualizar_csv.config(state='normal')
+            self.btn_exportar_csv.config(state='normal')
             self.btn_descargar_csv.config(state='normal')
             self.btn_cambiar_mysql.config(state='normal')
             self.btn_gestionar_eventos.config(state='normal')
@@ -2303,7 +5220,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
             self.entry_buscar.delete(0, tk.END)
             
             # Mostrar resumen
-            total_filas = len(self.datos_csv)
+            total_filas = self.almacen_csv.total()
             eventos_count = len(self.eventos_cargados)
             
             self.log_message(
@@ -2411,7 +5328,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
         stats_frame.pack(fill='x', pady=(0, 15))
         
         total_eventos = len(self.eventos_cargados)
-        total_registros = len(self.datos_csv) if hasattr(self, 'datos_csv') and self.datos_csv is not None else 0
+        total_registros = self.almacen_csv.total()
         
         ttk.Label(stats_frame, 
                  text=f"🎭 Total de eventos: {total_eventos}",
@@ -2483,17 +5400,20 @@ class SistemaEtiquetasProfesional(tk.Tk):
                     evento_data = self.eventos_cargados[evento_nombre]
                     if hasattr(evento_data, 'get') and 'Evento' in evento_data:
                         evento_id_a_eliminar = evento_data['Evento']
-                    elif self.datos_csv is not None:
+                    elif self.hay_datos_csv():
                         # Buscar en los datos CSV
-                        eventos_unicos = self.datos_csv['Evento'].unique()
-                        for eid in eventos_unicos:
+                        for eid in self.almacen_csv.eventos():
                             nombre_ev = self.obtener_nombre_evento_csv(eid)
                             if nombre_ev == evento_nombre:
                                 evento_id_a_eliminar = eid
                                 break
                 
-                # Eliminar del diccionario
+                # Eliminar del diccionario y quitar sus filas del almacén offline
+                archivo_evento = self.eventos_cargados[evento_nombre]['archivo']
+                self.exportar_pendientes_csv()
                 del self.eventos_cargados[evento_nombre]
+                if not any(info['archivo'] == archivo_evento for info in self.eventos_cargados.values()):
+                    self.almacen_csv.desactivar(archivo_evento)
                 
                 # Eliminar de eventos activos si está presente
                 if evento_id_a_eliminar and evento_id_a_eliminar in EVENTOS_ACTIVOS:
@@ -2505,7 +5425,8 @@ class SistemaEtiquetasProfesional(tk.Tk):
                     self.reconstruir_csv_maestro()
                 else:
                     # Si no quedan eventos, limpiar todo
-                    self.datos_csv = None
+                    self.destino_csv = None
+                    self.almacen_csv.desactivar()
                     self.csv_maestro_inicializado = False
                     self.usar_csv = False
                     self.modo_csv = False
@@ -2573,33 +5494,22 @@ class SistemaEtiquetasProfesional(tk.Tk):
             self.log_message("❌ No hay eventos cargados para reconstruir CSV maestro", "ERROR")
             return False
         
-        # Recargar todos los CSVs
-        datos_combinados = []
+        # El almacén offline ya tiene todos los eventos (con sus marcas): basta con exportarlo
         eventos_nombres = []
         total_registros_por_evento = {}
         
         self.log_message("🔄 Iniciando reconstrucción de CSV maestro...", "INFO")
         
+        por_origen = self.almacen_csv.total_por_origen()
         for evento, info in self.eventos_cargados.items():
-            try:
-                # Recargar cada CSV
-                datos_evento = pd.read_csv(info['archivo'])
-                datos_combinados.append(datos_evento)
-                eventos_nombres.append(evento.replace(' ', '_'))  # Reemplazar espacios para nombre de archivo
-                total_registros_por_evento[evento] = len(datos_evento)
-                self.log_message(f"📄 Recargado: {evento} ({len(datos_evento)} registros)", "INFO")
-            except Exception as e:
-                self.log_message(f"❌ Error recargando {evento}: {str(e)}", "ERROR")
-                continue
+            eventos_nombres.append(evento.replace(' ', '_'))  # Reemplazar espacios para nombre de archivo
+            total_registros_por_evento[evento] = por_origen.get(os.path.abspath(info['archivo']), 0)
         
-        if not datos_combinados:
+        total_registros = self.almacen_csv.total()
+        if not total_registros:
             self.log_message("❌ No se pudieron cargar datos de ningún evento", "ERROR")
             return False
         
-        # Combinar todos los DataFrames
-        self.datos_csv = pd.concat(datos_combinados, ignore_index=True)
-        total_registros = len(self.datos_csv)
-        
         # Crear nombre del archivo maestro con fecha y hora
         from datetime import datetime
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -2611,10 +5521,11 @@ class SistemaEtiquetasProfesional(tk.Tk):
         
         try:
             # Guardar el archivo maestro con el mismo formato que los CSVs originales
-            self.datos_csv.to_csv(nombre_archivo_maestro, index=False, encoding='utf-8-sig', sep=';')
+            self.almacen_csv.exportar(nombre_archivo_maestro, encoding='utf-8-sig')
             
             # Actualizar referencia al archivo actual
             self.archivo_csv_actual = os.path.abspath(nombre_archivo_maestro)
+            self.destino_csv = None
             
             # Log detallado del resultado
             self.log_message(f"✅ CSV maestro creado exitosamente!", "SUCCESS")
@@ -2654,10 +5565,12 @@ class SistemaEtiquetasProfesional(tk.Tk):
             messagebox.showerror("Error", "El archivo CSV original no existe.\nSeleccione un nuevo archivo.")
             return
         
+        # Exportar marcas pendientes antes de releer el archivo
+        self.exportar_pendientes_csv()
+        
         # Recargar el mismo archivo
         archivo_temp = self.archivo_csv_actual
         self.archivo_csv_actual = None
-        self.datos_csv = None
         
         # Simular carga del mismo archivo
         self.archivo_csv_actual = archivo_temp
@@ -2687,12 +5600,15 @@ class SistemaEtiquetasProfesional(tk.Tk):
                 messagebox.showerror("Error", "No se pudo recargar el archivo CSV o no tiene la estructura correcta.")
                 return
             
-            # Limpiar datos
-            datos['idUsuario'] = datos['idUsuario'].astype(str).str.strip()
-            if 'Nombrecompleto' in datos.columns:
-                datos['Nombrecompleto'] = datos['Nombrecompleto'].astype(str).str.strip()
+            # Limpiar textos y banderas antes de importar al almacén offline
+            datos = normalizar_datos_csv(datos)
             
-            self.datos_csv = datos
+            # El archivo recargado sustituye a todo lo cargado (recupera marcas sin exportar)
+            self.destino_csv = None
+            self.almacen_csv.desactivar()
+            recuperadas = self.almacen_csv.importar(datos, archivo)
+            if recuperadas:
+                self.log_message(f"♻️ {recuperadas} marca(s) recuperadas de {os.path.basename(archivo)}", "WARNING")
             total_registros = len(datos)
             nombre_archivo = os.path.basename(archivo)
             
@@ -2741,8 +5657,9 @@ class SistemaEtiquetasProfesional(tk.Tk):
                 print(f"❌ No se pudo cargar {archivo_eventos}")
                 return
             
-            # Limpiar y procesar datos de eventos
-            eventos['id'] = eventos['id'].astype(str).str.strip()
+            # Limpiar y procesar datos de eventos (id como entero, descartando filas sin id)
+            eventos['id'] = pd.to_numeric(eventos['id'], errors='coerce').astype('Int32')
+            eventos = eventos[eventos['id'].notna()].reset_index(drop=True)
             eventos['Nombre'] = eventos['Nombre'].astype(str).str.strip()
             
             # Agregar campos opcionales con valores por defecto si no existen
@@ -2751,8 +5668,9 @@ class SistemaEtiquetasProfesional(tk.Tk):
             if 'dia' not in eventos.columns:
                 eventos['dia'] = '1'  # Día por defecto
             
-            # Guardar eventos CSV
+            # Guardar eventos CSV y diccionario id → nombre para búsquedas directas
             self.eventos_csv = eventos
+            self.nombres_eventos_csv = dict(zip(eventos['id'].astype(int), eventos['Nombre']))
             self.archivo_eventos_csv = archivo_eventos
             
             print(f"📊 Eventos CSV cargados: {len(eventos)} eventos disponibles")
@@ -2790,91 +5708,69 @@ class SistemaEtiquetasProfesional(tk.Tk):
             return f"Evento {evento_id}"
         
         try:
-            # Buscar el evento por ID
-            mask = self.eventos_csv['id'].astype(str).str.strip() == str(evento_id).strip()
-            resultado = self.eventos_csv[mask]
-            
-            if not resultado.empty:
-                return resultado.iloc[0]['Nombre']
-            else:
-                return f"Evento {evento_id}"
+            # Buscar el evento por ID en el diccionario construido al cargar
+            return self.nombres_eventos_csv.get(int(str(evento_id).strip()), f"Evento {evento_id}")
                 
+        except ValueError:
+            return f"Evento {evento_id}"
         except Exception as e:
             print(f"Error al obtener nombre de evento CSV: {e}")
             return f"Evento {evento_id}"
 
     def obtener_nombre_evento_mysql(self, evento_id):
-        """Obtiene el nombre de un evento desde MySQL."""
+        """Obtiene el nombre de un evento desde el catálogo de eventos MySQL en memoria."""
         try:
-            eventos = self.obtener_eventos_seguro()
-            return obtener_nombre_evento(evento_id, eventos)
+            return CATALOGO_EVENTOS.nombre(evento_id)
         except Exception as e:
             print(f"Error al obtener nombre de evento MySQL: {e}")
             return f"Evento {evento_id}"
             print(f"❌ Error obteniendo nombre de evento CSV: {e}")
             return f"Evento {evento_id}"
 
+    def hay_datos_csv(self):
+        """True si hay asistentes cargados desde CSV en el almacén offline."""
+        return self.almacen_csv.total() > 0
+
     def buscar_usuario_csv(self, id_usuario):
         """Busca un usuario en los datos CSV cargados usando la estructura de la BD."""
-        if not self.modo_csv or self.datos_csv is None:
+        if not self.modo_csv or not self.hay_datos_csv():
             return None
         
         try:
-            # Buscar en el DataFrame usando idUsuario (igual que en MySQL)
-            mask = self.datos_csv['idUsuario'].astype(str).str.strip() == str(id_usuario).strip()
-            resultado = self.datos_csv[mask]
+            # Consulta indexada por idUsuario en el almacén offline
+            fila = self.almacen_csv.buscar(id_usuario)
             
-            if resultado.empty:
+            if not fila:
                 return None
             
-            # Obtener el primer resultado
-            fila = resultado.iloc[0]
-            
             # Crear diccionario con estructura idéntica a MySQL
             usuario = {}
             
             # Campos principales (siempre presentes)
-            usuario['idUsuario'] = str(fila.get('idUsuario', '')).strip()
-            usuario['Nombrecompleto'] = str(fila.get('Nombrecompleto', '')).strip()
+            usuario['idUsuario'] = str(fila.get('idUsuario') or '').strip()
+            usuario['Nombrecompleto'] = str(fila.get('Nombrecompleto') or '').strip()
             
-            # Campos opcionales (pueden no estar en el CSV)
+            # Campos opcionales (NULL = la columna no venía en el CSV)
             campos_opcionales = ['Apellidos', 'Dia', 'Evento', 'Comida', 'Empresa', 'Pagado', 'Pais', 'Entrada', 'Pirata']
             
             for campo in campos_opcionales:
+                valor = fila.get(campo)
                 if campo == 'Comida':
-                    # Lógica especial para Comida: buscar tanto mayúscula como minúscula
-                    valor = fila.get('Comida', fila.get('comida', None))
-                    if valor is not None and not pd.isna(valor):
-                        usuario['comida'] = str(valor).strip()  # Usar 'comida' minúscula para consistencia interna
-                    else:
-                        usuario['comida'] = '0'  # Por defecto no ha sido escaneado
+                    # 'comida'/'Comida' del CSV comparten columna en el almacén (SQLite no distingue mayúsculas)
+                    usuario['comida'] = str(valor).strip() if valor is not None else '0'  # Usar 'comida' minúscula para consistencia interna
                 elif campo == 'Pirata':
-                    # Lógica especial para Pirata: buscar tanto mayúscula como minúscula
-                    valor = fila.get('Pirata', fila.get('pirata', None))
-                    if valor is not None and not pd.isna(valor):
-                        usuario['pirata'] = str(valor).strip()  # Usar 'pirata' minúscula para consistencia interna
-                    else:
-                        usuario['pirata'] = '0'  # Por defecto sí debe recibir mochila
-                elif campo in fila:
-                    valor = fila[campo]
-                    # Limpiar valores None o NaN
-                    if pd.isna(valor):
-                        usuario[campo] = ''
-                    else:
-                        valor_limpio = str(valor).strip()
-                        usuario[campo] = valor_limpio
+                    # Igual que Comida: una sola columna Pirata en el almacén
+                    usuario['pirata'] = str(valor).strip() if valor is not None else '0'  # Por defecto sí debe recibir mochila
+                elif valor is not None:
+                    usuario[campo] = str(valor).strip()
                 else:
                     # Valores por defecto para campos faltantes
                     if campo == 'Dia':
                         usuario[campo] = '1'
                     elif campo == 'Evento':
                         usuario[campo] = '0'
-                    elif campo == 'Comida':
-                        usuario[campo] = '0'
                     elif campo == 'Pagado':
                         usuario[campo] = '1'
-                    elif campo == 'Entrada':
-                        usuario[campo] = ''
                     else:
                         usuario[campo] = ''
             
@@ -2890,59 +5786,107 @@ class SistemaEtiquetasProfesional(tk.Tk):
             print(f"❌ Error buscando usuario en CSV: {e}")
             return None
 
+    def obtener_destino_csv(self):
+        """Devuelve el CSV al que se exportan las marcas, resolviéndolo una sola vez.
+
+        Si hay un CSV maestro inicializado se usa el CSV_MAESTRO_*.csv más
+        reciente; si no, el archivo CSV actual. El resultado se guarda en
+        ``self.destino_csv`` hasta que cambien los datos cargados.
+        """
+        if self.destino_csv is not None:
+            return self.destino_csv
+        
+        archivo_a_usar = self.archivo_csv_actual
+        archivo_tipo = "individual"
+        
+        # Si hay un archivo maestro inicializado, usarlo preferentemente
+        if hasattr(self, 'csv_maestro_inicializado') and self.csv_maestro_inicializado:
+            import glob
+            archivos_maestros = glob.glob("CSV_MAESTRO_*.csv")
+            if archivos_maestros:
+                # Usar el más reciente
+                archivo_a_usar = max(archivos_maestros, key=os.path.getmtime)
+                archivo_tipo = "maestro"
+                # Actualizar la referencia para futuras operaciones
+                self.archivo_csv_actual = os.path.abspath(archivo_a_usar)
+        
+        if not archivo_a_usar:
+            return None
+        
+        print(f"📁 Marcas CSV destinadas al archivo {archivo_tipo}: {os.path.basename(archivo_a_usar)}")
+        self.destino_csv = os.path.abspath(archivo_a_usar)
+        return self.destino_csv
+
+    def exportar_pendientes_csv(self):
+        """Exporta los datos cargados a su CSV destino si hay marcas sin exportar."""
+        if self.destino_csv is None or not self.hay_datos_csv():
+            return
+        try:
+            pendientes = self.almacen_csv.pendientes()
+            if not pendientes:
+                return
+            self.almacen_csv.exportar(self.destino_csv)
+            print(f"💾 {pendientes} marca(s) exportadas → {os.path.basename(self.destino_csv)}")
+        except Exception as e:
+            # Las marcas siguen a salvo en el almacén offline hasta el próximo intento
+            print(f"❌ Error exportando marcas CSV: {e}")
+
+    def exportar_csv(self):
+        """Exporta a un archivo CSV (formato CSV_MAESTRO_*) los asistentes cargados con sus marcas."""
+        if not self.hay_datos_csv():
+            messagebox.showinfo("Información", "No hay ningún archivo CSV cargado actualmente.")
+            return
+        
+        destino = self.obtener_destino_csv()
+        ruta = filedialog.asksaveasfilename(
+            title="Exportar CSV",
+            defaultextension=".csv",
+            initialfile=os.path.basename(destino) if destino else "asistentes.csv",
+            initialdir=os.path.dirname(destino) if destino else None,
+            filetypes=[("Archivos CSV", "*.csv"), ("Todos los archivos", "*.*")])
+        if not ruta:
+            return
+        
+        try:
+            total = self.almacen_csv.exportar(ruta, encoding='utf-8-sig')
+            self.log_message(f"💾 CSV exportado: {os.path.basename(ruta)} ({total} registros)", "SUCCESS")
+            messagebox.showinfo("CSV Exportado",
+                f"✅ Datos exportados exitosamente!\n\n"
+                f"📄 Archivo: {os.path.basename(ruta)}\n"
+                f"👥 Registros: {total}")
+        except Exception as e:
+            self.log_message(f"❌ Error exportando CSV: {str(e)}", "ERROR")
+            messagebox.showerror("Error", f"No se pudo exportar el CSV:\n{str(e)}")
+
+    def al_cerrar(self):
+        """Cierra la aplicación exportando antes las marcas pendientes a disco."""
+        self.detener_pipeline_escaneo()
+        CATALOGO_EVENTOS.detener_refresco()
+        CACHE_ETIQUETAS.cancelar()
+        COLA_IMPRESION.detener()
+        REGISTRO_IMPRESORAS.cerrar()
+        ESCRITOR_LOGS.detener()
+        REPLICA_MYSQL.cerrar()
+        self.exportar_pendientes_csv()
+        self.almacen_csv.cerrar()
+        self.destroy()
+
     def marcar_comida_csv(self, id_usuario):
-        """Marca comida = 1 en el CSV cargado y lo guarda."""
+        """Marca comida = 1 en el almacén offline (se exporta al CSV destino bajo demanda)."""
         try:
             print(f"🍽️ Marcando comida en CSV para usuario ID: {id_usuario}...")
             
-            if not self.modo_csv or self.datos_csv is None:
+            if not self.modo_csv or not self.hay_datos_csv():
                 print("❌ No hay datos CSV cargados")
                 return False
             
-            # Verificar si hay un archivo maestro activo
-            archivo_a_usar = self.archivo_csv_actual
-            archivo_tipo = "individual"
-            
-            # Si hay un archivo maestro inicializado, usarlo preferentemente
-            if hasattr(self, 'csv_maestro_inicializado') and self.csv_maestro_inicializado:
-                # Buscar archivo maestro más reciente
-                import glob
-                archivos_maestros = glob.glob("CSV_MAESTRO_*.csv")
-                if archivos_maestros:
-                    # Usar el más reciente
-                    archivo_maestro_reciente = max(archivos_maestros, key=os.path.getmtime)
-                    archivo_a_usar = archivo_maestro_reciente
-                    archivo_tipo = "maestro"
-                    print(f"🎯 Usando archivo maestro: {os.path.basename(archivo_maestro_reciente)}")
-                    
-                    # Actualizar la referencia para futuras operaciones
-                    self.archivo_csv_actual = os.path.abspath(archivo_maestro_reciente)
-            
-            # Mostrar qué archivo se va a actualizar
-            archivo_nombre = os.path.basename(archivo_a_usar) if archivo_a_usar else "archivo desconocido"
-            print(f"📁 Actualizando archivo {archivo_tipo}: {archivo_nombre}")
-            
-            # Buscar el usuario en el DataFrame
-            mask = self.datos_csv['idUsuario'].astype(str).str.strip() == str(id_usuario).strip()
-            indices = self.datos_csv.index[mask]
-            
-            if len(indices) == 0:
+            # Un UPDATE indexado y confirmado (WAL + fsync) por marca; sin destino
+            # resuelto la marca queda asociada a su propio archivo de origen
+            if self.almacen_csv.marcar(id_usuario, 'Comida', 1, self.obtener_destino_csv()) == 0:
                 print(f"⚠️ Usuario {id_usuario} no encontrado en CSV")
                 return False
-            
-            # Marcar comida = 1 para el usuario
-            self.datos_csv.loc[indices, 'Comida'] = 1
-            
-            # Guardar el CSV actualizado
-            try:
-                self.datos_csv.to_csv(archivo_a_usar, sep=';', encoding='utf-8', index=False)
-                print(f"✅ Comida marcada y CSV actualizado para usuario {id_usuario}")
-                print(f"📄 Archivo guardado: {archivo_nombre}")
-                print(f"🎯 Tipo de archivo usado: {archivo_tipo}")
-                return True
-            except Exception as e:
-                print(f"❌ Error guardando CSV: {e}")
-                return False
+            print(f"✅ Comida marcada para usuario {id_usuario} ({self.almacen_csv.pendientes()} marca(s) pendientes de exportar)")
+            return True
                 
         except Exception as e:
             print(f"❌ Error marcando comida en CSV: {e}")
@@ -2954,7 +5898,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
             nombre_archivo = os.path.basename(self.archivo_csv_actual) if self.archivo_csv_actual else "archivo.csv"
             # Contar eventos cargados
             num_eventos = len(self.eventos_cargados) if self.eventos_cargados else 1
-            total_registros = len(self.datos_csv) if hasattr(self, 'datos_csv') and self.datos_csv is not None else 0
+            total_registros = self.almacen_csv.total()
             
             self.estado_label.config(
                 text=f"� MODO OFFLINE - CSV: {nombre_archivo} ({num_eventos} evento(s), {total_registros} registros)",
@@ -2999,8 +5943,12 @@ class SistemaEtiquetasProfesional(tk.Tk):
             return
         
         try:
+            # Exportar marcas pendientes antes de soltar los datos
+            self.exportar_pendientes_csv()
+            self.destino_csv = None
+            
             # Limpiar datos CSV
-            self.datos_csv = None
+            self.almacen_csv.desactivar()
             self.eventos_csv = None
             self.archivo_csv_actual = None
             self.archivo_eventos_csv = None
@@ -3008,6 +5956,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
             
             # Desactivar botones CSV
             self.btn_actualizar_csv.config(state='disabled')
+            self.btn_exportar_csv.config(state='disabled')
             self.btn_descargar_csv.config(state='disabled')
             self.btn_cambiar_mysql.config(state='disabled')
             
@@ -3096,7 +6045,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
 
     def volver_a_csv(self):
         """Vuelve al modo CSV usando los datos previamente cargados."""
-        if self.datos_csv is None:
+        if not self.hay_datos_csv():
             messagebox.showwarning("Advertencia", "No hay datos CSV disponibles. Carga un archivo CSV primero.")
             return
         
@@ -3109,6 +6058,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
             
             # Actualizar botones
             self.btn_actualizar_csv.config(state='normal')
+            self.btn_exportar_csv.config(state='normal')
             self.btn_descargar_csv.config(state='normal')
             self.btn_cambiar_mysql.config(state='normal')
             if hasattr(self, 'btn_volver_csv'):
@@ -3118,7 +6068,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
             self.actualizar_eventos_display()
             
             nombre_archivo = os.path.basename(self.archivo_csv_actual) if self.archivo_csv_actual else "archivo.csv"
-            total_registros = len(self.datos_csv)
+            total_registros = self.almacen_csv.total()
             
             messagebox.showinfo("Modo Cambiado", 
                 f"✅ Cambiado a modo CSV exitosamente!\n\n"
@@ -3137,7 +6087,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
         # Crear ventana de log
         ventana_log = tk.Toplevel(self)
         ventana_log.title("📋 Log de Accesos y Actividad del Sistema")
-        ventana_log.geometry("900x700")
+        ventana_log.geometry("1100x750")
         ventana_log.configure(bg=ColoresTema.WHITE)
         ventana_log.resizable(True, True)
         
@@ -3155,9 +6105,10 @@ class SistemaEtiquetasProfesional(tk.Tk):
                           style='Title.TLabel')
         titulo.pack(pady=(0, 15))
         
-        # Área de texto con scroll
+        # Actividad de la sesión actual (más reciente primero)
+        ttk.Label(main_frame, text="⚡ Actividad de la sesión actual").pack(anchor='w')
         text_frame = ttk.Frame(main_frame)
-        text_frame.pack(fill='both', expand=True)
+        text_frame.pack(fill='x', pady=(5, 15))
         
         text_area = tk.Text(text_frame,
                            font=('Consolas', 10),
@@ -3165,49 +6116,120 @@ class SistemaEtiquetasProfesional(tk.Tk):
                            fg=ColoresTema.WHITE,
                            relief='solid',
                            borderwidth=2,
+                           height=8,
                            wrap='word')
         
         scrollbar = ttk.Scrollbar(text_frame, orient='vertical', command=text_area.yview)
         text_area.configure(yscrollcommand=scrollbar.set)
         
-        # Mostrar actividad de la sesión actual
-        contenido = []
-        
-        # Agregar actividad de la sesión actual (más reciente primero)
         if self.log_actividad:
-            contenido.append("=== ACTIVIDAD DE LA SESIÓN ACTUAL ===")
             for entrada in reversed(self.log_actividad):
-                contenido.append(entrada)
-            contenido.append("")
-        
-        # Leer también el archivo de accesos si existe
-        try:
-            with open(ACCESOS_LOG_FILE, 'r', encoding='utf-8') as f:
-                contenido_archivo = f.read()
-                if contenido_archivo.strip():
-                    contenido.append("=== HISTORIAL DE ACCESOS (ARCHIVO CSV) ===")
-                    contenido.append("FECHA,ID_USUARIO,NOMBRE,EMPRESA,EVENTO_USUARIO,ESTADO,RAZON,EVENTOS_ACTIVOS")
-                    for linea in contenido_archivo.strip().split('\n'):
-                        if linea.strip():
-                            contenido.append(linea)
-        except FileNotFoundError:
-            contenido.append("=== HISTORIAL DE ACCESOS ===")
-            contenido.append("No hay registros de accesos guardados aún.")
-        except Exception as e:
-            contenido.append(f"Error leyendo archivo de accesos: {e}")
-        
-        # Mostrar todo el contenido
-        if contenido:
-            for linea in contenido:
-                text_area.insert('end', linea + '\n')
+                text_area.insert('end', entrada + '\n')
         else:
             text_area.insert('end', 'No hay actividad registrada.\n')
-        
         text_area.configure(state='disabled')
-        
         text_area.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
         
+        # Historial de accesos: índice del archivo + páginas (solo se leen las filas visibles)
+        ttk.Label(main_frame, text="📋 Historial de accesos (más recientes primero)").pack(anchor='w')
+        
+        filtros_frame = ttk.Frame(main_frame)
+        filtros_frame.pack(fill='x', pady=(5, 5))
+        
+        ttk.Label(filtros_frame, text="Estado:").pack(side='left')
+        estado_var = tk.StringVar(value='TODOS')
+        combo_estado = ttk.Combobox(filtros_frame, textvariable=estado_var, state='readonly', width=12,
+                                    values=('TODOS', 'AUTORIZADO', 'DENEGADO'))
+        combo_estado.pack(side='left', padx=(5, 15))
+        
+        ttk.Label(filtros_frame, text="Evento:").pack(side='left')
+        evento_var = tk.StringVar()
+        ttk.Entry(filtros_frame, textvariable=evento_var, width=8).pack(side='left', padx=(5, 15))
+        
+        ttk.Label(filtros_frame, text="ID:").pack(side='left')
+        id_var = tk.StringVar()
+        ttk.Entry(filtros_frame, textvariable=id_var, width=14).pack(side='left', padx=(5, 15))
+        
+        tabla_frame = ttk.Frame(main_frame)
+        tabla_frame.pack(fill='both', expand=True)
+        
+        columnas = COLUMNAS_LOG_ACCESOS[:7]
+        anchos = (150, 90, 180, 150, 70, 100, 220)
+        tree = ttk.Treeview(tabla_frame, columns=columnas, show='headings', height=15)
+        for columna, ancho in zip(columnas, anchos):
+            tree.heading(columna, text=columna)
+            tree.column(columna, width=ancho, minwidth=50)
+        tree.tag_configure('denegado', foreground=ColoresTema.DANGER)
+        
+        scroll_tabla = ttk.Scrollbar(tabla_frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scroll_tabla.set)
+        tree.pack(side='left', fill='both', expand=True)
+        scroll_tabla.pack(side='right', fill='y')
+        
+        paginacion_frame = ttk.Frame(main_frame)
+        paginacion_frame.pack(fill='x', pady=(5, 0))
+        
+        estado_vista = {'pagina': 0, 'filas': range(0)}
+        etiqueta_pagina = ttk.Label(paginacion_frame, text="Indexando historial...")
+        
+        def mostrar_pagina():
+            filas = estado_vista['filas']
+            paginas = max(1, -(-len(filas) // LOG_VISOR_FILAS_PAGINA))
+            estado_vista['pagina'] = min(max(estado_vista['pagina'], 0), paginas - 1)
+            inicio = estado_vista['pagina'] * LOG_VISOR_FILAS_PAGINA
+            
+            tree.delete(*tree.get_children())
+            try:
+                visibles = indice.leer_filas(filas[inicio:inicio + LOG_VISOR_FILAS_PAGINA])
+            except Exception as e:
+                etiqueta_pagina.configure(text=f"Error leyendo archivo de accesos: {e}")
+                return
+            for fila in visibles:
+                tree.insert('', 'end', values=fila[:7], tags=('denegado',) if fila[5] == 'DENEGADO' else ())
+            etiqueta_pagina.configure(
+                text=f"Página {estado_vista['pagina'] + 1} de {paginas} • {len(filas)} de {len(indice)} registros")
+        
+        def aplicar_filtro(*_):
+            estado = estado_var.get()
+            estado_vista['filas'] = indice.filtrar(None if estado == 'TODOS' else estado,
+                                                   evento_var.get(), id_var.get())
+            estado_vista['pagina'] = 0
+            mostrar_pagina()
+        
+        def ir_a(pagina):
+            estado_vista['pagina'] = pagina
+            mostrar_pagina()
+        
+        ttk.Button(paginacion_frame, text="⏮", width=3, command=lambda: ir_a(0)).pack(side='left')
+        ttk.Button(paginacion_frame, text="◀", width=3,
+                   command=lambda: ir_a(estado_vista['pagina'] - 1)).pack(side='left', padx=(2, 0))
+        etiqueta_pagina.pack(side='left', padx=10)
+        ttk.Button(paginacion_frame, text="▶", width=3,
+                   command=lambda: ir_a(estado_vista['pagina'] + 1)).pack(side='left')
+        ttk.Button(paginacion_frame, text="⏭", width=3,
+                   command=lambda: ir_a(len(estado_vista['filas']))).pack(side='left', padx=(2, 0))
+        
+        def indexar():
+            # Lo pendiente del escritor de logs va primero a disco; luego solo se indexa lo nuevo
+            ESCRITOR_LOGS.vaciar()
+            try:
+                nuevas = indice.actualizar()
+                print(f"📋 Índice de accesos: {len(indice)} registros ({nuevas} nuevos)")
+            except Exception as e:
+                print(f"⚠️ Error indexando log de accesos: {e}")
+            self.en_ui(lambda: ventana_log.winfo_exists() and aplicar_filtro())
+        
+        ttk.Button(paginacion_frame, text="🔄 Actualizar",
+                   command=lambda: threading.Thread(target=indexar, daemon=True).start()).pack(side='right')
+        
+        combo_estado.bind('<<ComboboxSelected>>', aplicar_filtro)
+        for variable in (evento_var, id_var):
+            variable.trace_add('write', aplicar_filtro)
+        
+        indice = self.indice_log_accesos
+        threading.Thread(target=indexar, name="indice-log-accesos", daemon=True).start()
+        
         # Botón cerrar
         btn_cerrar = ttk.Button(main_frame,
                                text="✖ Cerrar",
@@ -3238,7 +6260,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
             return
         
         # Verificar datos disponibles en CSV
-        if self.modo_csv and self.datos_csv is None:
+        if self.modo_csv and not self.hay_datos_csv():
             messagebox.showwarning('Sin datos CSV', 
                 'No hay datos CSV cargados.\n\n'
                 'Por favor carga un archivo CSV primero usando el botón "📄 Cargar CSV".')
@@ -3260,23 +6282,25 @@ class SistemaEtiquetasProfesional(tk.Tk):
             messagebox.showerror('Error', error_msg)
             return
         
-        # Obtener usuarios de los eventos activos
+        # Obtener usuarios de los eventos activos (en MySQL llegan por páginas
+        # con la ventana ya abierta: ver cargar_tabla_usuarios_mysql)
         print(f"🔍 Obteniendo usuarios para eventos: {EVENTOS_ACTIVOS}")
-        usuarios = self.obtener_usuarios_eventos_activos()
-        
-        if not usuarios:
-            if self.modo_csv:
+        if self.modo_csv:
+            usuarios = self.obtener_usuarios_eventos_activos()
+            
+            if not usuarios:
                 mensaje = (f'📊 No se encontraron usuarios para los eventos seleccionados en CSV.\n\n'
                           f'🎯 Eventos buscados: {EVENTOS_ACTIVOS}\n'
                           f'💡 Verifica que el CSV contenga usuarios para estos eventos.\n'
                           f'📋 Columna "Evento" debe coincidir con los IDs seleccionados.')
-            else:
-                mensaje = 'No se encontraron usuarios para los eventos seleccionados.'
+                messagebox.showinfo('Sin resultados', mensaje)
+                return
             
-            messagebox.showinfo('Sin resultados', mensaje)
-            return
-        
-        print(f"✅ Encontrados {len(usuarios)} usuarios para mostrar en tabla")
+            print(f"✅ Encontrados {len(usuarios)} usuarios para mostrar en tabla")
+            fuente = FuenteCambiosCSV(self.almacen_csv, EVENTOS_ACTIVOS)
+        else:
+            usuarios = []
+            fuente = FuenteCambiosMySQL(EVENTOS_ACTIVOS)
         
         # Crear ventana de tabla
         ventana_tabla = tk.Toplevel(self)
@@ -3324,7 +6348,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
         
         # Botón de limpiar búsqueda
         clear_btn = ttk.Button(search_frame, text="🗑️ Limpiar", 
-                              command=lambda: self.limpiar_busqueda_tabla(search_var, tree, usuarios, eventos_dict))
+                              command=lambda: self.limpiar_busqueda_tabla(search_var, modelo))
         clear_btn.pack(side='left', padx=(0, 10))
         
         # Frame para la tabla
@@ -3332,8 +6356,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
         tabla_frame.pack(fill='both', expand=True)
         
         # Crear Treeview con scrollbars
-        columns = ('ID', 'Nombre', 'Apellidos', 'Empresa', 'Entrada', 'Evento', 'Pulsera', 'Mochila')
-        tree = ttk.Treeview(tabla_frame, columns=columns, show='headings', height=20)
+        tree = ttk.Treeview(tabla_frame, columns=TABLA_COLUMNAS, show='headings', height=20)
         
         # Configurar columnas
         tree.heading('ID', text='ID Usuario')
@@ -3355,12 +6378,6 @@ class SistemaEtiquetasProfesional(tk.Tk):
         tree.column('Pulsera', width=120, minwidth=100)
         tree.column('Mochila', width=100, minwidth=80)
         
-        # Configurar búsqueda en tiempo real
-        def buscar_en_tabla(*args):
-            self.filtrar_tabla_usuarios(search_var.get(), tree, usuarios, eventos_dict)
-        
-        search_var.trace('w', buscar_en_tabla)
-        
         # Configurar doble clic para imprimir etiqueta
         def on_double_click(event):
             selection = tree.selection()
@@ -3371,34 +6388,27 @@ class SistemaEtiquetasProfesional(tk.Tk):
         
         tree.bind('<Double-1>', on_double_click)
         
-        # Scrollbars
-        v_scrollbar = ttk.Scrollbar(tabla_frame, orient='vertical', command=tree.yview)
+        # Scrollbars: la vertical la gobierna el modelo virtual (el Treeview solo
+        # contiene las filas visibles)
+        v_scrollbar = ttk.Scrollbar(tabla_frame, orient='vertical')
         h_scrollbar = ttk.Scrollbar(tabla_frame, orient='horizontal', command=tree.xview)
-        tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        tree.configure(xscrollcommand=h_scrollbar.set)
         
-        # Insertar datos (usar eventos_dict para evitar consultas repetidas)
-        for usuario in usuarios:
-            pulsera_texto = "✅ SÍ" if usuario.get('comida', 0) == 1 else "❌ NO"
-            # Mochila: pirata = 1 (no mochila), pirata = 0 (sí mochila)
-            mochila_texto = "❌ NO" if usuario.get('pirata', 0) == 1 else "✅ SÍ"
-            evento_id = usuario.get('Evento', '')
-            
-            # Obtener nombre del evento desde el diccionario ya cargado
-            if evento_id in eventos_dict:
-                evento_nombre = eventos_dict[evento_id]['Nombre']
-            else:
-                evento_nombre = "No encontrado"
-            
-            tree.insert('', 'end', values=(
-                usuario.get('idUsuario', ''),
-                usuario.get('Nombrecompleto', ''),
-                usuario.get('apellidos', ''),
-                usuario.get('Empresa', ''),
-                usuario.get('entrada', ''),
-                f"{evento_id} - {evento_nombre}",
-                pulsera_texto,
-                mochila_texto
-            ))
+        # Modelo con todos los usuarios (usa eventos_dict para evitar consultas repetidas)
+        modelo = ModeloTablaUsuarios(tree, v_scrollbar, usuarios, eventos_dict)
+        modelo.renderizar()
+        
+        # Búsqueda en tiempo real con espera: al teclear rápido solo se filtra
+        # cuando el usuario hace una pausa
+        busqueda_pendiente = [None]
+        
+        def buscar_en_tabla(*args):
+            if busqueda_pendiente[0] is not None:
+                ventana_tabla.after_cancel(busqueda_pendiente[0])
+            busqueda_pendiente[0] = ventana_tabla.after(
+                TABLA_BUSQUEDA_ESPERA_MS, lambda: self.filtrar_tabla_usuarios(search_var.get(), modelo))
+        
+        search_var.trace('w', buscar_en_tabla)
         
         # Pack elementos
         tree.pack(side='left', fill='both', expand=True)
@@ -3410,37 +6420,8 @@ class SistemaEtiquetasProfesional(tk.Tk):
         stats_frame.pack(fill='x', pady=(15, 0))
         
         # Estadísticas
-        total_usuarios = len(usuarios)
-        con_pulsera = len([u for u in usuarios if u.get('comida', 0) == 1])
-        sin_pulsera = total_usuarios - con_pulsera
-        
-        # Calcular mochilas usando la misma lógica compleja de prioridades
-        con_mochila = 0
-        for u in usuarios:
-            # Obtener tipo de entrada
-            entrada = u.get('entrada', '').upper()
-            pirata = u.get('pirata', 0)
-            
-            # 1ª PRIORIDAD: Si es entrada EXPO → NUNCA mochila
-            if 'EXPO' in entrada:
-                mochila = False
-            # 2ª PRIORIDAD: Si pirata=1 → NO mochila
-            elif pirata == 1:
-                mochila = False
-            # 3ª PRIORIDAD: Si pirata=0 y NO es EXPO → SÍ mochila  
-            elif pirata == 0:
-                mochila = True
-            else:
-                mochila = False
-                
-            if mochila:
-                con_mochila += 1
-                
-        sin_mochila = total_usuarios - con_mochila
-        
         modo_texto = "📊 CSV" if self.modo_csv else "🌐 MySQL"
-        stats_text = f"📊 Total: {total_usuarios} usuarios | ✅ Con pulsera: {con_pulsera} | ❌ Sin pulsera: {sin_pulsera} | 🎒 Con mochila: {con_mochila} | ❌ Sin mochila: {sin_mochila} | Fuente: {modo_texto}"
-        stats_label = ttk.Label(stats_frame, text=stats_text, font=('Arial', 11, 'bold'))
+        stats_label = ttk.Label(stats_frame, text=estadisticas_usuarios(usuarios, modo_texto), font=('Arial', 11, 'bold'))
         stats_label.pack(side='left')
         
         # Frame para botones
@@ -3454,13 +6435,34 @@ class SistemaEtiquetasProfesional(tk.Tk):
                                  style='Success.TButton')
         btn_imprimir.pack(side='left', padx=(0, 10))
         
-        # Botón actualizar
+        # Botón lote: imprimir o exportar las filas seleccionadas (o todas las visibles)
+        btn_lote = ttk.Button(buttons_frame,
+                             text="📦 Lote de Etiquetas",
+                             command=lambda: self.mostrar_dialogo_lote(modelo, ventana_tabla),
+                             style='Info.TButton')
+        btn_lote.pack(side='left', padx=(0, 10))
+        
+        # Botón actualizar: solo las filas cuyo estado cambió
         btn_actualizar = ttk.Button(buttons_frame,
                                    text="🔄 Actualizar",
-                                   command=lambda: self.actualizar_tabla_usuarios_optimizada(tree),
+                                   command=lambda: self.refrescar_estados_tabla(modelo, fuente, stats_label, modo_texto),
                                    style='Info.TButton')
         btn_actualizar.pack(side='left', padx=(0, 10))
         
+        # Refresco automático (pantalla de supervisión)
+        auto_refresco = tk.BooleanVar(value=False)
+        ttk.Checkbutton(buttons_frame, text="⏱️ Auto", variable=auto_refresco).pack(side='left', padx=(0, 10))
+        refresco_programado = [None]
+        
+        def refrescar_automatico():
+            if auto_refresco.get():
+                self.refrescar_estados_tabla(modelo, fuente, stats_label, modo_texto)
+            refresco_programado[0] = ventana_tabla.after(TABLA_AUTOREFRESCO_MS, refrescar_automatico)
+        
+        refresco_programado[0] = ventana_tabla.after(TABLA_AUTOREFRESCO_MS, refrescar_automatico)
+        ventana_tabla.bind('<Destroy>', lambda e: ventana_tabla.after_cancel(refresco_programado[0])
+                           if e.widget is ventana_tabla else None, add='+')
+        
         # Botón cerrar
         btn_cerrar = ttk.Button(buttons_frame,
                                text="✖ Cerrar",
@@ -3476,165 +6478,376 @@ class SistemaEtiquetasProfesional(tk.Tk):
         instrucciones_label = ttk.Label(instrucciones_frame, text=instrucciones_text, 
                                        font=('Arial', 9), foreground='gray')
         instrucciones_label.pack()
+        
+        if not self.modo_csv:
+            self.cargar_tabla_usuarios_mysql(ventana_tabla, modelo, fuente, stats_label, modo_texto)
+
+    def cargar_tabla_usuarios_mysql(self, ventana, modelo, fuente, stats_label, modo_texto):
+        """Rellena la tabla desde MySQL por páginas: se ve en cuanto llega la primera."""
+        eventos = list(fuente.eventos)  # los mismos que sigue el refresco incremental
+        cancelada = threading.Event()
+        ventana.bind('<Destroy>', lambda e: cancelada.set() if e.widget is ventana else None, add='+')
+        stats_label.config(text="⏳ Cargando usuarios desde MySQL...")
+        
+        def _anexar(filas):
+            if cancelada.is_set():
+                return
+            modelo.anexar(filas)
+            stats_label.config(text=f"⏳ Cargando usuarios desde MySQL... {len(modelo.usuarios)}")
+        
+        def _pagina(filas):
+            self.en_ui(_anexar, filas)
+            return not cancelada.is_set()
+        
+        def _terminar(total, error):
+            if cancelada.is_set():
+                return
+            if error is not None:
+                messagebox.showerror('Error MySQL', f'Error al obtener usuarios desde MySQL:\n{str(error)}', parent=ventana)
+            elif total == 0:
+                ventana.destroy()
+                messagebox.showinfo('Sin resultados', 'No se encontraron usuarios para los eventos seleccionados.')
+                return
+            stats_label.config(text=estadisticas_usuarios(modelo.usuarios, modo_texto))
+        
+        def _cargar():
+            # Mientras carga, "Actualizar"/"Auto" no piden cambios con la fuente a medio preparar
+            with fuente.en_curso:
+                try:
+                    # Punto de partida de los cambios antes de leer: nada se pierde entre ambos
+                    try:
+                        fuente.preparar()
+                    except Exception as e:
+                        print(f"⚠️ No se pudo preparar el refresco incremental: {e}")
+                    total = listar_asistentes(eventos, _pagina)
+                    print(f"✅ {total} usuarios obtenidos desde MySQL con {obtener_pool(DB_CONFIG).driver}")
+                    self.en_ui(_terminar, total, None)
+                except Exception as e:
+                    print(f"❌ Error obteniendo usuarios desde MySQL: {e}")
+                    self.en_ui(_terminar, 0, e)
+        
+        threading.Thread(target=_cargar, name="listado-usuarios", daemon=True).start()
+
+    def mostrar_dialogo_lote(self, modelo, padre):
+        """Diálogo para imprimir o exportar (PNG/PDF) un lote de etiquetas desde la tabla."""
+        seleccionados = modelo.seleccionados()
+        asistentes = seleccionados or modelo.usuarios_visibles()
+        
+        if not asistentes:
+            messagebox.showwarning('Sin usuarios', 'No hay usuarios en la tabla para generar etiquetas.', parent=padre)
+            return
+        
+        ventana = tk.Toplevel(padre)
+        ventana.title("📦 Lote de Etiquetas")
+        ventana.geometry("480x260")
+        ventana.transient(padre)
+        ventana.grab_set()
+        
+        frame = ttk.Frame(ventana, padding=20)
+        frame.pack(fill='both', expand=True)
+        
+        origen = "seleccionados" if seleccionados else "visibles en la tabla"
+        ttk.Label(frame, text=f"{len(asistentes)} usuario(s) {origen}",
+                 font=('Segoe UI', 11, 'bold')).pack(anchor='w', pady=(0, 10))
+        
+        destino_var = tk.StringVar(value='pdf')
+        for valor, texto in (('imprimir', "🖨️ Enviar a la impresora"),
+                             ('png', "🖼️ Guardar PNG en una carpeta"),
+                             ('pdf', "📄 Guardar un PDF (una etiqueta por página)")):
+            ttk.Radiobutton(frame, text=texto, variable=destino_var, value=valor).pack(anchor='w')
+        
+        barra = ttk.Progressbar(frame, maximum=len(asistentes), mode='determinate')
+        barra.pack(fill='x', pady=(15, 5))
+        estado = ttk.Label(frame, text="Listo para empezar", foreground='gray')
+        estado.pack(anchor='w')
+        
+        botones = ttk.Frame(frame)
+        botones.pack(fill='x', pady=(10, 0))
+        cancelar = threading.Event()
+        
+        def progreso(hechos, total):
+            if barra.winfo_exists():
+                barra['value'] = hechos
+                estado.config(text=f"Generando etiquetas: {hechos}/{total}")
+        
+        def terminado(mensaje):
+            if ventana.winfo_exists():
+                estado.config(text=mensaje)
+                btn_iniciar.config(state='normal')
+        
+        def iniciar():
+            destino = destino_var.get()
+            ruta = None
+            if destino == 'png':
+                ruta = filedialog.askdirectory(parent=ventana, title="Carpeta para las etiquetas")
+            elif destino == 'pdf':
+                ruta = filedialog.asksaveasfilename(parent=ventana, defaultextension='.pdf',
+                                                    filetypes=[("PDF", "*.pdf")],
+                                                    initialfile="etiquetas_lote.pdf")
+            if destino != 'imprimir' and not ruta:
+                return
+            cancelar.clear()
+            btn_iniciar.config(state='disabled')
+            threading.Thread(target=self.ejecutar_lote_etiquetas,
+                             args=(asistentes, destino, ruta, progreso, terminado, cancelar),
+                             name="lote-etiquetas", daemon=True).start()
+        
+        def cerrar():
+            cancelar.set()
+            ventana.destroy()
+        
+        btn_iniciar = ttk.Button(botones, text="▶️ Iniciar", command=iniciar, style='Success.TButton')
+        btn_iniciar.pack(side='left')
+        ttk.Button(botones, text="⏹️ Cancelar", command=cancelar.set).pack(side='left', padx=(10, 0))
+        ttk.Button(botones, text="✖ Cerrar", command=cerrar).pack(side='right')
+        ventana.protocol("WM_DELETE_WINDOW", cerrar)
+
+    def ejecutar_lote_etiquetas(self, asistentes, destino, ruta, progreso, terminado, cancelar):
+        """Renderiza el lote en el pool de procesos y lo envía a la impresora, a PNG o a PDF (hilo de trabajo)."""
+        total = len(asistentes)
+        hechos = 0
+        paginas = []
+        pdf_iniciado = False
+        try:
+            precargar_nombres_empresas({campos_etiqueta(a)['empresa_id'] for a in asistentes})
+            
+            def _trabajos():
+                for asistente in asistentes:
+                    if self.modo_csv:
+                        nombre_evento = self.obtener_nombre_evento_csv(asistente.get('Evento', '0'))
+                    else:
+                        nombre_evento = CATALOGO_EVENTOS.nombre(asistente.get('Evento'))
+                    empresa = obtener_nombre_empresa(campos_etiqueta(asistente)['empresa_id'])
+                    yield asistente, nombre_evento, empresa
+            
+            impresora = getattr(self, 'impresora_seleccionada', None)
+            for (asistente, _, _), img in renderizar_lote_etiquetas(_trabajos(), cancelar=cancelar):
+                if destino == 'imprimir':
+                    # No adelantarse demasiado a la impresora: cada imagen en cola ocupa memoria
+                    while COLA_IMPRESION.pendientes() >= LOTE_PROCESOS * LOTE_VENTANA_POR_PROCESO and not cancelar.is_set():
+                        time.sleep(0.1)
+                    if cancelar.is_set():
+                        break
+                    COLA_IMPRESION.encolar(img, asistente, impresora,
+                                           al_terminar=lambda trabajo, *_: log_impresion(trabajo['datos']))
+                elif destino == 'png':
+                    img.save(os.path.join(ruta, nombre_archivo_etiqueta(asistente) + '.png'), dpi=LOTE_DPI)
+                else:
+                    # La versión de impresión es blanco y negro: 1 bit por píxel en el PDF
+                    paginas.append(img.convert('1'))
+                    if len(paginas) >= LOTE_PDF_BLOQUE:
+                        # Volcar por bloques: un lote grande no se acumula entero en memoria
+                        volcar_paginas_pdf(ruta, paginas, pdf_iniciado)
+                        pdf_iniciado = True
+                        paginas = []
+                hechos += 1
+                self.en_ui(progreso, hechos, total)
+            
+            if destino == 'pdf' and paginas:
+                volcar_paginas_pdf(ruta, paginas, pdf_iniciado)
+            
+            estado = "cancelado" if cancelar.is_set() else "completado"
+            mensaje = f"Lote {estado}: {hechos}/{total} etiquetas"
+            self.log_message(mensaje, "WARNING" if cancelar.is_set() else "SUCCESS")
+        except Exception as e:
+            mensaje = f"Error en el lote: {e}"
+            print(f"❌ {mensaje}")
+            self.log_message(mensaje, "ERROR")
+        self.en_ui(terminado, mensaje)
+
+    def precargar_datos_eventos(self):
+        """Precarga en segundo plano nombres de empresa y códigos QR de los asistentes de los eventos activos."""
+        eventos = list(EVENTOS_ACTIVOS)
+        if not eventos:
+            return
+        
+        def _precargar():
+            try:
+                if self.modo_csv:
+                    if not self.hay_datos_csv():
+                        return
+                    filas = self.almacen_csv.asistentes(columnas=('idUsuario', 'Empresa'))
+                    ids_usuario = [fila['idUsuario'] for fila in filas if fila['idUsuario'] is not None]
+                    ids_empresa = {fila['Empresa'] for fila in filas if fila['Empresa'] is not None}
+                    precargar_nombres_empresas(ids_empresa)
+                else:
+                    # Descarga completa a la réplica local (incluye los nombres de empresa)
+                    filas = REPLICA_MYSQL.sincronizar(eventos)
+                    ids_usuario = [fila['idUsuario'] for fila in filas]
+                    self.log_message(f"Réplica local: {len(filas)} asistentes disponibles sin conexión", "INFO")
+                precargar_qr(ids_usuario)
+            except Exception as e:
+                print(f"⚠️ Error precargando datos de eventos activos: {e}")
+        
+        threading.Thread(target=_precargar, name="precarga-eventos", daemon=True).start()
+
+    def on_toggle_prerender(self):
+        """Activa o cancela el pre-renderizado de etiquetas."""
+        if self.prerender_mode.get():
+            self.prerenderizar_etiquetas_eventos()
+        else:
+            CACHE_ETIQUETAS.cancelar()
+            self.log_message("Pre-renderizado de etiquetas desactivado", "INFO")
+
+    def prerenderizar_etiquetas_eventos(self):
+        """Genera en un pool de procesos las etiquetas de todos los asistentes de los eventos activos."""
+        if not self.prerender_mode.get() or not EVENTOS_ACTIVOS or self.prerender_activo:
+            return
+        eventos = list(EVENTOS_ACTIVOS)
+        modo_csv = self.modo_csv
+        self.prerender_activo = True
+        self.log_message(f"Pre-renderizando etiquetas de {len(eventos)} evento(s)...", "INFO")
+        
+        def _progreso(hechos, total):
+            if hechos == total or hechos % 25 == 0:
+                self.en_ui(self.actualizar_info_status, f"⚡ Pre-renderizando etiquetas: {hechos}/{total}")
+        
+        def _prerenderizar():
+            try:
+                # Mismos registros que devuelve la búsqueda del escaneo, para que las claves coincidan
+                if modo_csv:
+                    if not self.hay_datos_csv():
+                        return
+                    ids = [fila['idUsuario'] for fila in self.almacen_csv.asistentes(eventos, columnas=('idUsuario',))]
+                    asistentes = [a for a in (self.buscar_usuario_csv(i) for i in ids) if a]
+                else:
+                    # Comparte la descarga con precargar_datos_eventos (se hace una sola vez)
+                    asistentes = REPLICA_MYSQL.sincronizar(eventos)
+                
+                precargar_nombres_empresas({campos_etiqueta(a)['empresa_id'] for a in asistentes})
+                trabajos = []
+                for asistente in asistentes:
+                    if modo_csv:
+                        nombre_evento = self.obtener_nombre_evento_csv(asistente.get('Evento', '0'))
+                    else:
+                        nombre_evento = CATALOGO_EVENTOS.nombre(asistente.get('Evento'))
+                    empresa = obtener_nombre_empresa(campos_etiqueta(asistente)['empresa_id'])
+                    clave = clave_etiqueta(asistente, nombre_evento, empresa)
+                    if clave is not None:  # empresa sin resolver: no se pre-renderiza
+                        trabajos.append((clave, asistente, nombre_evento, empresa))
+                
+                generadas = CACHE_ETIQUETAS.prerenderizar(trabajos, progreso=_progreso)
+                self.log_message(f"Etiquetas pre-renderizadas: {generadas} nuevas de {len(trabajos)} asistentes", "SUCCESS")
+                self.en_ui(self.actualizar_info_status, "✅ Etiquetas pre-renderizadas")
+            except Exception as e:
+                print(f"❌ Error pre-renderizando etiquetas: {e}")
+                self.log_message(f"Error pre-renderizando etiquetas: {e}", "ERROR")
+            finally:
+                self.prerender_activo = False
+        
+        threading.Thread(target=_prerenderizar, name="prerender-etiquetas", daemon=True).start()
 
     def obtener_usuarios_eventos_activos(self):
         """Obtiene todos los usuarios de los eventos activos (CSV o MySQL)."""
-        if not EVENTOS_ACTIVOS:
+        try:
+            return self.leer_usuarios_eventos_activos()
+        except Exception as e:
+            origen = "CSV" if self.modo_csv and self.hay_datos_csv() else "MySQL"
+            messagebox.showerror(f'Error {origen}', f'Error al obtener usuarios desde {origen}:\n{str(e)}')
+            return []
+
+    def leer_usuarios_eventos_activos(self, eventos=None):
+        """Como ``obtener_usuarios_eventos_activos`` pero sin diálogos: los errores se propagan (hilos de trabajo).
+
+        ``eventos`` sustituye a ``EVENTOS_ACTIVOS`` (p. ej. los de una tabla ya abierta).
+        """
+        eventos = list(EVENTOS_ACTIVOS if eventos is None else eventos)
+        if not eventos:
             return []
         
         usuarios = []
         
-        # Modo CSV: filtrar datos del CSV cargado
-        if self.modo_csv and self.datos_csv is not None:
+        # Modo CSV: consulta indexada por Evento en el almacén offline
+        if self.modo_csv and self.hay_datos_csv():
             try:
-                print(f"📊 Obteniendo usuarios desde CSV para eventos: {EVENTOS_ACTIVOS}")
+                print(f"📊 Obteniendo usuarios desde CSV para eventos: {eventos}")
                 
-                # Filtrar usuarios por eventos activos
-                for _, fila in self.datos_csv.iterrows():
-                    evento_usuario = fila.get('Evento')
-                    if evento_usuario:
-                        try:
-                            evento_id = int(evento_usuario)
-                            if evento_id in EVENTOS_ACTIVOS:
-                                # Convertir fila a diccionario con estructura MySQL
-                                usuario = {
-                                    'idUsuario': str(fila.get('idUsuario', '')).strip(),
-                                    'Nombrecompleto': str(fila.get('Nombrecompleto', '')).strip(),
-                                    'apellidos': str(fila.get('Apellidos', '')).strip(),  # Buscar Apellidos con mayúscula
-                                    'Empresa': str(fila.get('Empresa', '')).strip(),
-                                    'entrada': str(fila.get('Entrada', '')).strip(),  # Buscar Entrada con mayúscula
-                                    'Evento': evento_id,
-                                    'comida': int(fila.get('Comida', 0)) if pd.notna(fila.get('Comida')) else 0,
-                                    'pirata': int(fila.get('Pirata', fila.get('pirata', 0))) if pd.notna(fila.get('Pirata', fila.get('pirata', 0))) else 0,  # Campo mochila
-                                    'Dia': str(fila.get('Dia', '1')).strip(),
-                                    'Pagado': int(fila.get('Pagado', 0)) if pd.notna(fila.get('Pagado')) else 0,
-                                    'Pais': str(fila.get('Pais', '')).strip()
-                                }
-                                usuarios.append(usuario)
-                        except (ValueError, TypeError):
-                            continue  # Saltar filas con evento inválido
+                # Estructura MySQL y orden por nombre resueltos en la consulta
+                usuarios = self.almacen_csv.usuarios(eventos)
                 
-                # Ordenar por nombre como en MySQL
-                usuarios.sort(key=lambda x: (x.get('Nombrecompleto', ''), x.get('apellidos', '')))
                 print(f"✅ {len(usuarios)} usuarios obtenidos desde CSV")
                 
             except Exception as e:
                 print(f"❌ Error obteniendo usuarios desde CSV: {e}")
-                messagebox.showerror('Error CSV', f'Error al obtener usuarios desde CSV:\n{str(e)}')
+                raise
                 
         # Modo MySQL: consulta a base de datos
         else:
             try:
-                print(f"🌐 Obteniendo usuarios desde MySQL para eventos: {EVENTOS_ACTIVOS}")
+                print(f"🌐 Obteniendo usuarios desde MySQL para eventos: {eventos}")
                 
-                # Intentar con PyMySQL primero
-                try:
-                    import pymysql
-                    conn = pymysql.connect(**DB_CONFIG)
-                    cursor = conn.cursor(pymysql.cursors.DictCursor)
-                    
-                    # Construir consulta para eventos activos
-                    placeholders = ','.join(['%s'] * len(EVENTOS_ACTIVOS))
-                    query = f"SELECT * FROM asistentes WHERE Evento IN ({placeholders}) ORDER BY Nombrecompleto, apellidos"
-                    
-                    cursor.execute(query, EVENTOS_ACTIVOS)
-                    usuarios = cursor.fetchall()
-                    
-                    cursor.close()
-                    conn.close()
-                    
-                    print(f"✅ {len(usuarios)} usuarios obtenidos desde MySQL con PyMySQL")
-                    
-                except ImportError:
-                    print("📌 PyMySQL no disponible, usando mysql.connector...")
-                    # Fallback con mysql.connector
-                    import mysql.connector
-                    conn = mysql.connector.connect(**DB_CONFIG)
-                    cursor = conn.cursor(dictionary=True)
-                    
-                    placeholders = ','.join(['%s'] * len(EVENTOS_ACTIVOS))
-                    query = f"SELECT * FROM asistentes WHERE Evento IN ({placeholders}) ORDER BY Nombrecompleto, apellidos"
-                    
-                    cursor.execute(query, EVENTOS_ACTIVOS)
-                    usuarios = cursor.fetchall()
-                    
-                    cursor.close()
-                    conn.close()
-                    
-                    print(f"✅ {len(usuarios)} usuarios obtenidos desde MySQL con mysql.connector")
+                # Solo las columnas del listado, leídas por páginas del cursor de servidor
+                listar_asistentes(eventos, usuarios.extend)
+                
+                print(f"✅ {len(usuarios)} usuarios obtenidos desde MySQL con {obtener_pool(DB_CONFIG).driver}")
                 
             except Exception as e:
                 print(f"❌ Error obteniendo usuarios desde MySQL: {e}")
-                messagebox.showerror('Error MySQL', f'Error al obtener usuarios desde MySQL:\n{str(e)}')
+                raise
         
         return usuarios
 
-    def actualizar_tabla_usuarios_optimizada(self, tree):
-        """Actualiza la tabla de usuarios con datos frescos (optimizado)."""
+    def refrescar_estados_tabla(self, modelo, fuente, stats_label, modo_texto):
+        """Pide a ``fuente`` los cambios en segundo plano y parchea solo las filas afectadas."""
+        if not fuente.en_curso.acquire(blocking=False):
+            return  # la consulta anterior aún no terminó
+        
+        def _aplicar(cambios):
+            try:
+                if not stats_label.winfo_exists():
+                    return
+                modificadas = modelo.parchear(cambios)
+                if modificadas:
+                    stats_label.config(text=estadisticas_usuarios(modelo.usuarios, modo_texto))
+                    print(f"🔄 Tabla: {modificadas} fila(s) con estado nuevo")
+            finally:
+                fuente.en_curso.release()
+        
+        def _consultar():
+            try:
+                cambios = fuente.cambios()
+                if cambios is None:
+                    # Cambio masivo (CSV recargado, esquema nuevo...): recarga completa, también aquí
+                    fuente.preparar()
+                    # Los eventos de la tabla abierta, los mismos que sigue la fuente de cambios
+                    self.actualizar_tabla_usuarios_optimizada(modelo, stats_label, fuente.eventos)
+            except Exception as e:
+                print(f"⚠️ No se pudieron obtener cambios de la tabla: {e}")
+                cambios = None
+            if cambios is None:
+                fuente.en_curso.release()
+                return
+            self.en_ui(_aplicar, cambios)
+        
+        threading.Thread(target=_consultar, name="refresco-tabla", daemon=True).start()
+
+    def actualizar_tabla_usuarios_optimizada(self, modelo, stats_label=None, eventos=None):
+        """Lee datos frescos para la tabla de usuarios (hilo de trabajo); la UI solo cambia las celdas modificadas.
+
+        ``eventos`` son los de la tabla abierta (por defecto, los activos).
+        """
         try:
-            # Limpiar tabla actual
-            for item in tree.get_children():
-                tree.delete(item)
-            
             # Obtener eventos una sola vez
             if self.modo_csv:
                 eventos = self.obtener_eventos_csv()
             else:
                 eventos = self.obtener_eventos_seguro()
             eventos_dict = {e['id']: e for e in eventos}
-            
-            # Obtener datos actualizados
-            usuarios = self.obtener_usuarios_eventos_activos()
-            
-            # Volver a insertar datos
-            for usuario in usuarios:
-                pulsera_texto = "✅ SÍ" if usuario.get('comida', 0) == 1 else "❌ NO"
-                # Mochila: pirata = 1 (no mochila), pirata = 0 (sí mochila)
-                mochila_texto = "❌ NO" if usuario.get('pirata', 0) == 1 else "✅ SÍ"
-                evento_id = usuario.get('Evento', '')
-                
-                # Obtener nombre del evento desde el diccionario ya cargado
-                if evento_id in eventos_dict:
-                    evento_nombre = eventos_dict[evento_id]['Nombre']
-                else:
-                    evento_nombre = "No encontrado"
-                
-                tree.insert('', 'end', values=(
-                    usuario.get('idUsuario', ''),
-                    usuario.get('Nombrecompleto', ''),
-                    usuario.get('apellidos', ''),
-                    usuario.get('Empresa', ''),
-                    usuario.get('entrada', ''),
-                    f"{evento_id} - {evento_nombre}",
-                    pulsera_texto,
-                    mochila_texto
-                ))
+            usuarios = self.leer_usuarios_eventos_activos(eventos)
         except Exception as e:
-            messagebox.showerror('Error', f'Error al actualizar tabla:\n{str(e)}')
+            self.en_ui(messagebox.showerror, 'Error', f'Error al actualizar tabla:\n{str(e)}')
+            return
+        self.en_ui(self.aplicar_tabla_usuarios, modelo, stats_label, usuarios, eventos_dict)
 
-    def actualizar_tabla_usuarios(self, tree, usuarios_ref):
-        """Actualiza la tabla de usuarios con datos frescos."""
-        # Limpiar tabla actual
-        for item in tree.get_children():
-            tree.delete(item)
-        
-        # Obtener datos actualizados
-        usuarios = self.obtener_usuarios_eventos_activos()
-        
-        # Volver a insertar datos
-        for usuario in usuarios:
-            pulsera_texto = "✅ SÍ" if usuario.get('comida', 0) == 1 else "❌ NO"
-            evento_nombre = self.obtener_nombre_evento(usuario.get('Evento', ''))
-            
-            tree.insert('', 'end', values=(
-                usuario.get('idUsuario', ''),
-                usuario.get('Nombrecompleto', ''),
-                usuario.get('apellidos', ''),
-                usuario.get('Empresa', ''),
-                usuario.get('entrada', ''),
-                f"{usuario.get('Evento', '')} - {evento_nombre}",
-                pulsera_texto
-            ))
+    def aplicar_tabla_usuarios(self, modelo, stats_label, usuarios, eventos_dict):
+        """Aplica a la tabla solo las diferencias con ``usuarios`` (hilo de la UI)."""
+        if stats_label is not None and not stats_label.winfo_exists():
+            return
+        cambiadas = modelo.actualizar(usuarios, eventos_dict)
+        if stats_label is not None:
+            modo_texto = "📊 CSV" if self.modo_csv else "🌐 MySQL"
+            stats_label.config(text=estadisticas_usuarios(usuarios, modo_texto))
+        print(f"🔄 Tabla actualizada: {cambiadas} fila(s) con cambios de {len(usuarios)}")
 
     def registrar_actividad(self, tipo, mensaje, datos_usuario=None):
         """Registra actividad del sistema con timestamp y detalles del usuario."""
@@ -3693,9 +6906,6 @@ class SistemaEtiquetasProfesional(tk.Tk):
         """Obtiene actividad del sistema desde la base de datos."""
         actividad = []
         try:
-            # Usar la misma lógica de conexión que buscar_asistente
-            import pymysql
-            
             # Usar IP por defecto - no dependemos de widgets UI
             ip_servidor = '192.168.1.100'  # IP por defecto
             
@@ -3706,38 +6916,39 @@ class SistemaEtiquetasProfesional(tk.Tk):
                 {'host': '127.0.0.1', 'user': 'root', 'password': '', 'database': 'agribusi_acreditacion'},
             ]
             
-            conn = None
+            def _consulta(conn):
+                cursor = conn.cursor()
+                base = config['database']
+                try:
+                    # Buscar tabla de actividad o logs si existe
+                    cursor.execute("SHOW TABLES")
+                    tablas = [row[0] for row in cursor.fetchall()]
+                    
+                    if 'actividad' in tablas:
+                        cursor.execute("SELECT * FROM actividad ORDER BY timestamp DESC LIMIT 50")
+                        return ESQUEMA.filas_a_diccionarios(base, 'actividad', cursor, cursor.fetchall())
+                    elif 'logs' in tablas:
+                        cursor.execute("SELECT * FROM logs ORDER BY fecha DESC LIMIT 50")
+                        registros = ESQUEMA.filas_a_diccionarios(base, 'logs', cursor, cursor.fetchall())
+                        return [{
+                            'timestamp': reg.get('fecha', 'Sin fecha'),
+                            'evento': reg.get('evento', 'Sin evento'),
+                            'usuario': reg.get('usuario', 'Sistema')
+                        } for reg in registros]
+                    return []
+                finally:
+                    cursor.close()
+            
+            # Usar el primer pool que consiga conectar
             for config in configuraciones:
                 try:
-                    conn = pymysql.connect(**config)
-                    break
-                except:
+                    pool = obtener_pool(config)
+                    conn = pool.adquirir()
+                except Exception:
                     continue
-            
-            if not conn:
-                return []
-            
-            cursor = conn.cursor(pymysql.cursors.DictCursor)
-            
-            # Buscar tabla de actividad o logs si existe
-            cursor.execute("SHOW TABLES")
-            tablas = [row[list(row.keys())[0]] for row in cursor.fetchall()]
-            
-            if 'actividad' in tablas:
-                cursor.execute("SELECT * FROM actividad ORDER BY timestamp DESC LIMIT 50")
-                actividad = cursor.fetchall()
-            elif 'logs' in tablas:
-                cursor.execute("SELECT * FROM logs ORDER BY fecha DESC LIMIT 50")
-                registros = cursor.fetchall()
-                for reg in registros:
-                    actividad.append({
-                        'timestamp': reg.get('fecha', 'Sin fecha'),
-                        'evento': reg.get('evento', 'Sin evento'),
-                        'usuario': reg.get('usuario', 'Sistema')
-                    })
-            
-            cursor.close()
-            conn.close()
+                pool.liberar(conn)
+                actividad = list(pool.ejecutar(_consulta))
+                break
             
         except Exception as e:
             # Si hay error, registrar y continuar sin actividad de BD
@@ -3748,8 +6959,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
     def obtener_nombre_evento(self, evento_id):
         """Obtiene el nombre de un evento por su ID."""
         try:
-            eventos = self.obtener_eventos_seguro()
-            eventos_dict = {e['id']: e for e in eventos}
+            eventos_dict = CATALOGO_EVENTOS.por_id()
             
             if evento_id in eventos_dict:
                 return eventos_dict[evento_id]['Nombre']
@@ -3801,13 +7011,10 @@ class SistemaEtiquetasProfesional(tk.Tk):
             
             # Obtener nombre del evento desde los eventos cargados
             evento_id = datos.get('Evento')
-            eventos = self.obtener_eventos_seguro()
-            nombre_evento = obtener_nombre_evento(evento_id, eventos)
+            nombre_evento = CATALOGO_EVENTOS.nombre(evento_id)
             
-            # Generar versión para vista previa (con colores)
-            self.img_etiqueta_preview = generar_etiqueta(datos, nombre_evento, version_impresion=False)
-            # Generar versión para impresión (sin colores)
-            self.img_etiqueta = generar_etiqueta(datos, nombre_evento, version_impresion=True)
+            # Generar vista previa (con colores) e impresión (sin colores) desde un mismo layout
+            self.img_etiqueta_preview, self.img_etiqueta = generar_etiquetas(datos, nombre_evento)
             
             # IMPORTANTE: Asignar datos_actual ANTES de show_preview para que los indicadores funcionen correctamente
             self.datos_actual = datos
@@ -3842,21 +7049,26 @@ class SistemaEtiquetasProfesional(tk.Tk):
             {'host': '127.0.0.1', 'user': 'root', 'password': 'root', 'database': 'agribusi_acreditacion'},
         ]
         
-        for i, config in enumerate(configuraciones):
+        def _contar(conn):
+            cursor = conn.cursor()
             try:
-                conn = mysql.connector.connect(**config)
-                cursor = conn.cursor()
                 cursor.execute("SELECT COUNT(*) FROM asistentes")
-                count = cursor.fetchone()[0]
+                return cursor.fetchone()[0]
+            finally:
                 cursor.close()
-                conn.close()
+        
+        for i, config in enumerate(configuraciones):
+            try:
+                # La conexión que funcione queda abierta en su pool para el resto de la sesión
+                count = ejecutar_consulta(config, _contar)
                 
                 mensaje = f"✅ CONEXIÓN EXITOSA!\n\nConfiguración {i+1}:\nHost: {config['host']}\nUsuario: {config['user']}\nPassword: {'*' * len(config['password']) if config['password'] else '(sin password)'}\nBase de datos: {config['database']}\n\nRegistros en tabla 'asistentes': {count}"
                 messagebox.showinfo("Conexión exitosa", mensaje)
                 
-                # Actualiza la configuración global
+                # Actualiza la configuración global (el nuevo servidor puede tener otro esquema)
                 global DB_CONFIG
                 DB_CONFIG = config
+                ESQUEMA.invalidar()
                 return
                 
             except Exception as e:
@@ -3887,26 +7099,100 @@ class SistemaEtiquetasProfesional(tk.Tk):
         self.entry.focus_set()
 
     def on_scan(self, event=None):
+        """Encola el código escaneado; el procesamiento ocurre en el hilo de escaneo."""
         id_asistente = self.entry.get().strip()
+        self.entry.delete(0, 'end')
+        self.focus_entry()
         if not id_asistente:
             return
             
         # Validar que hay datos disponibles (eventos activos o CSV cargado)
         if not EVENTOS_ACTIVOS and not self.modo_csv:
             messagebox.showerror('Error', 'No hay eventos activos seleccionados ni datos CSV cargados.')
-            self.entry.delete(0, 'end')
-            self.focus_entry()
             return
-            
-        # Buscar usuario según el modo
+        
+        # El modo automático se lee aquí: las variables de Tk solo se tocan desde este hilo
+        modo_automatico = self.auto_mode.get()
+        try:
+            self.cola_escaneos.put_nowait((self.procesar_escaneo, (id_asistente, modo_automatico)))
+        except queue.Full:
+            self.log_message(f"Cola de escaneo llena, se descartó el ID {id_asistente}", "ERROR")
+            messagebox.showwarning('Cola llena',
+                f'Hay {ESCANEO_COLA_MAXIMA} escaneos pendientes de procesar.\n\n'
+                f'Espere unos segundos y vuelva a escanear el ID: {id_asistente}')
+            return
+        
+        pendientes = self.cola_escaneos.qsize()
+        if pendientes > 1:
+            self.actualizar_info_status(f"⏳ {pendientes} escaneos en cola...")
+
+    # =====================================================
+    # ⚡ PIPELINE DE ESCANEO (HILO DE TRABAJO)
+    # =====================================================
+    def trabajador_escaneos(self):
+        """Bucle del hilo de escaneo: ejecuta en orden las tareas encoladas."""
+        while True:
+            tarea = self.cola_escaneos.get()
+            try:
+                if tarea is None:
+                    return
+                funcion, argumentos = tarea
+                funcion(*argumentos)
+            except Exception as e:
+                print(f"❌ Error en el pipeline de escaneo: {e}")
+                self.log_message(f"Error procesando escaneo: {e}", "ERROR")
+            finally:
+                self.cola_escaneos.task_done()
+
+    def detener_pipeline_escaneo(self, espera=5):
+        """Deja terminar los escaneos ya encolados y detiene el hilo de escaneo."""
+        try:
+            self.cola_escaneos.put(None, timeout=espera)
+            self.hilo_escaneos.join(timeout=espera)
+        except (AttributeError, queue.Full):
+            pass
+
+    def en_ui(self, funcion, *argumentos):
+        """Programa ``funcion`` para ejecutarse en el hilo de Tk."""
+        self.cola_ui.put((funcion, argumentos))
+
+    def preguntar_en_ui(self, funcion, *argumentos):
+        """Ejecuta ``funcion`` (p. ej. un messagebox) en el hilo de Tk y espera su resultado."""
+        resultado = {}
+        listo = threading.Event()
+        
+        def _ejecutar():
+            try:
+                resultado['valor'] = funcion(*argumentos)
+            finally:
+                listo.set()
+        
+        self.en_ui(_ejecutar)
+        listo.wait()
+        return resultado.get('valor')
+
+    def procesar_cola_ui(self):
+        """Aplica en el hilo de Tk los resultados publicados por el hilo de escaneo."""
+        try:
+            while True:
+                funcion, argumentos = self.cola_ui.get_nowait()
+                try:
+                    funcion(*argumentos)
+                except Exception as e:
+                    print(f"❌ Error actualizando interfaz: {e}")
+        except queue.Empty:
+            pass
+        self.after(ESCANEO_SONDEO_UI_MS, self.procesar_cola_ui)
+
+    def procesar_escaneo(self, id_asistente, modo_automatico):
+        """Pipeline completo de un escaneo: búsqueda → validación → render → marca → impresión → log."""
+        # 1️⃣ Búsqueda del usuario según el modo
         if self.modo_csv:
             datos = self.buscar_usuario_csv(id_asistente)
             if not datos:
-                messagebox.showerror('Error', f'No se encontró el ID: {id_asistente} en el archivo CSV')
+                self.en_ui(messagebox.showerror, 'Error', f'No se encontró el ID: {id_asistente} en el archivo CSV')
                 log_acceso({'idUsuario': id_asistente}, False, "Usuario no encontrado en CSV")
                 self.log_acceso_resultado({'idUsuario': id_asistente}, False, "Usuario no encontrado en CSV")
-                self.entry.delete(0, 'end')
-                self.focus_entry()
                 return
             
             # Para CSV, la validación es más simple - si está en el CSV, está autorizado
@@ -3917,14 +7203,12 @@ class SistemaEtiquetasProfesional(tk.Tk):
             # Modo MySQL normal
             datos = buscar_asistente(id_asistente)
             if not datos:
-                messagebox.showerror('Error', f'No se encontró el ID: {id_asistente}')
+                self.en_ui(messagebox.showerror, 'Error', f'No se encontró el ID: {id_asistente}')
                 log_acceso({'idUsuario': id_asistente}, False, "Usuario no encontrado en BD")
                 self.log_acceso_resultado({'idUsuario': id_asistente}, False, "Usuario no encontrado en BD")
-                self.entry.delete(0, 'end')
-                self.focus_entry()
                 return
             
-            # Validar que el usuario pertenece a un evento activo
+            # 2️⃣ Validar que el usuario pertenece a un evento activo
             autorizado, razon = validar_usuario_evento(datos, EVENTOS_ACTIVOS)
         
         # Registrar acceso independientemente del modo
@@ -3935,11 +7219,9 @@ class SistemaEtiquetasProfesional(tk.Tk):
         
         if not autorizado:
             if self.modo_csv:
-                messagebox.showerror('Acceso Denegado', f"{razon}")
+                self.en_ui(messagebox.showerror, 'Acceso Denegado', f"{razon}")
             else:
-                messagebox.showerror('Acceso Denegado', f"{razon}\n\nEventos activos: {', '.join(map(str, EVENTOS_ACTIVOS))}")
-            self.entry.delete(0, 'end')
-            self.focus_entry()
+                self.en_ui(messagebox.showerror, 'Acceso Denegado', f"{razon}\n\nEventos activos: {', '.join(map(str, EVENTOS_ACTIVOS))}")
             return
         
         # Debug: Mostrar información del usuario antes de validación
@@ -3959,8 +7241,9 @@ class SistemaEtiquetasProfesional(tk.Tk):
             
             print(f"⚠️ VALIDACIÓN: Usuario {nombre_usuario} ya fue escaneado (comida={comida_valor})")
             
-            # Mostrar popup con opción de reimprimir
-            respuesta = messagebox.askyesno('QR Ya Escaneado', 
+            # Mostrar popup con opción de reimprimir (el pipeline espera la respuesta;
+            # los escaneos siguientes se mantienen en la cola)
+            respuesta = self.preguntar_en_ui(messagebox.askyesno, 'QR Ya Escaneado', 
                 f'⚠️ Este QR ya ha sido escaneado previamente.\n\n'
                 f'Usuario: {nombre_usuario}\n'
                 f'ID: {datos.get("idUsuario", "N/A")}\n\n'
@@ -3970,16 +7253,24 @@ class SistemaEtiquetasProfesional(tk.Tk):
             if not respuesta:
                 # Usuario eligió NO imprimir
                 self.log_message("Usuario canceló reimpresión de QR ya escaneado", "INFO")
-                self.entry.delete(0, 'end')
-                self.focus_entry()
                 return
             else:
                 # Usuario eligió SÍ reimprimir - continuar con el proceso normal
                 self.log_message("Usuario confirmó reimpresión de QR ya escaneado", "INFO")
             
-        # Usuario autorizado - proceder con etiqueta
+        # 3️⃣ Usuario autorizado - proceder con etiqueta
         self.log_message("Generando etiqueta...", "INFO")
         
+        img_preview, img_impresion = self.obtener_etiquetas(datos)
+        
+        self.en_ui(self.mostrar_etiqueta_escaneada, datos, img_preview, img_impresion, modo_automatico)
+        
+        # Si está en modo automático, imprimir inmediatamente Y marcar comida
+        if modo_automatico:
+            self.imprimir_y_registrar(datos, img_impresion)
+
+    def obtener_etiquetas(self, datos):
+        """Vista previa e impresión del asistente (pre-renderizadas si existen)."""
         # Obtener nombre del evento
         if self.modo_csv:
             # Para CSV, obtener el nombre del evento desde el archivo de eventos CSV
@@ -3988,13 +7279,22 @@ class SistemaEtiquetasProfesional(tk.Tk):
         else:
             # Para MySQL, obtener desde los eventos cargados
             evento_id = datos.get('Evento')
-            eventos = self.obtener_eventos_seguro()
-            nombre_evento = obtener_nombre_evento(evento_id, eventos)
-        
-        # Generar versión para vista previa (con colores)
-        self.img_etiqueta_preview = generar_etiqueta(datos, nombre_evento, version_impresion=False)
-        # Generar versión para impresión (sin colores)
-        self.img_etiqueta = generar_etiqueta(datos, nombre_evento, version_impresion=True)
+            nombre_evento = CATALOGO_EVENTOS.nombre(evento_id)
+        
+        # Etiqueta pre-renderizada si existe; si no, vista previa e impresión desde un mismo layout
+        empresa = obtener_nombre_empresa(campos_etiqueta(datos)['empresa_id'])
+        clave = clave_etiqueta(datos, nombre_evento, empresa)
+        imagenes = CACHE_ETIQUETAS.obtener(clave) if clave is not None else None
+        if imagenes is None:
+            imagenes = generar_etiquetas(datos, nombre_evento, empresa)
+            if clave is not None:
+                CACHE_ETIQUETAS.guardar(clave, *imagenes)
+        return imagenes
+
+    def mostrar_etiqueta_escaneada(self, datos, img_preview, img_impresion, modo_automatico):
+        """Publica en la interfaz la etiqueta generada por el hilo de escaneo."""
+        self.img_etiqueta_preview = img_preview
+        self.img_etiqueta = img_impresion
         
         # IMPORTANTE: Asignar datos_actual ANTES de show_preview para que los indicadores funcionen correctamente
         self.datos_actual = datos
@@ -4002,20 +7302,8 @@ class SistemaEtiquetasProfesional(tk.Tk):
         self.actualizar_info_status("✅ Etiqueta lista para imprimir")
         self.log_message("¡Etiqueta generada correctamente!", "SUCCESS")
         
-        # Si está en modo automático, imprimir inmediatamente Y marcar comida
-        if self.auto_mode.get():
-            # Marcar comida automáticamente (tanto CSV como MySQL)
-            id_usuario = datos.get('idUsuario') or datos.get('cedula')
-            if marcar_comida(id_usuario, self):
-                self.log_message(f"Comida registrada para usuario {id_usuario}", "SUCCESS")
-            else:
-                self.log_message(f"Error al registrar comida para usuario {id_usuario}", "ERROR")
-            
-            self.imprimir_y_log()
-        else:
+        if not modo_automatico:
             self.btn_print['state'] = 'normal'
-        self.entry.delete(0, 'end')
-        self.focus_entry()
 
     def show_preview(self, img):
         # Mantener proporción 62×100 mm sin deformar - ETIQUETA MUCHO MÁS GRANDE
@@ -4214,16 +7502,10 @@ class SistemaEtiquetasProfesional(tk.Tk):
     def seleccionar_impresora(self):
         """Permite seleccionar manualmente la impresora Brother QL a usar."""
         try:
-            import win32print
             from tkinter import messagebox
             
-            # Escanear impresoras disponibles con refresh forzado
-            print("🔄 Escaneando impresoras disponibles...")
-            impresoras = []
-            for printer_info in win32print.EnumPrinters(6):  # 6 = LOCAL + NETWORK
-                nombre = printer_info[2]
-                if 'Brother' in nombre and ('QL-600' in nombre or 'QL-700' in nombre or 'QL-800' in nombre):
-                    impresoras.append(nombre)
+            # Impresoras ya descubiertas por el registro (se refresca en segundo plano)
+            impresoras = REGISTRO_IMPRESORAS.impresoras()
             
             if not impresoras:
                 messagebox.showerror("Sin impresoras", 
@@ -4291,11 +7573,9 @@ class SistemaEtiquetasProfesional(tk.Tk):
                 lista.delete(0, tk.END)
                 impresoras.clear()
                 print("🔄 Refrescando lista de impresoras...")
-                for printer_info in win32print.EnumPrinters(6):
-                    nombre = printer_info[2]
-                    if 'Brother' in nombre and ('QL-600' in nombre or 'QL-700' in nombre or 'QL-800' in nombre):
-                        impresoras.append(nombre)
-                        lista.insert(tk.END, nombre)
+                for nombre in REGISTRO_IMPRESORAS.descubrir():
+                    impresoras.append(nombre)
+                    lista.insert(tk.END, nombre)
                 if impresoras:
                     lista.selection_set(0)
                 else:
@@ -4335,73 +7615,63 @@ class SistemaEtiquetasProfesional(tk.Tk):
             messagebox.showerror("Error", f"Error al listar impresoras:\n{str(e)}")
 
     def imprimir_y_log(self):
-        # Marcar comida en la base de datos o CSV si estamos en modo manual
-        if not self.auto_mode.get() and hasattr(self, 'datos_actual') and self.datos_actual:
-            id_usuario = self.datos_actual.get('idUsuario')
+        """Encola la impresión (y la marca de comida) de la etiqueta mostrada."""
+        if not self.datos_actual or self.img_etiqueta is None:
+            return
+        try:
+            # En modo automático la comida ya se marcó al escanear
+            marcar = not self.auto_mode.get()
+            self.cola_escaneos.put_nowait((self.imprimir_y_registrar, (self.datos_actual, self.img_etiqueta, marcar)))
+        except queue.Full:
+            messagebox.showwarning('Cola llena', 'Hay demasiados escaneos pendientes. Intente imprimir de nuevo en unos segundos.')
+
+    def imprimir_y_registrar(self, datos, img, marcar=True):
+        """Marca la comida, imprime y registra la impresión (se ejecuta en el hilo de escaneo)."""
+        # 4️⃣ Marcar comida en la base de datos o CSV (tanto CSV como MySQL)
+        if marcar:
+            id_usuario = datos.get('idUsuario') or datos.get('cedula')
             if marcar_comida(id_usuario, self):
                 self.log_message(f"Comida registrada para usuario {id_usuario}", "SUCCESS")
             else:
                 self.log_message(f"Error al registrar comida para usuario {id_usuario}", "ERROR")
         
-        # Usar impresora seleccionada manualmente si existe
+        # 5️⃣ Enviar a la cola de impresión (el registro se hace al terminar el trabajo)
+        self.encolar_impresion(datos, img)
+
+    def encolar_impresion(self, datos, img):
+        """Envía una etiqueta a la cola de impresión usando la impresora seleccionada, si la hay."""
         impresora = getattr(self, 'impresora_seleccionada', None)
-        imprimir_etiqueta(self.img_etiqueta, impresora)
-        log_impresion(self.datos_actual)
-        self.add_log(self.datos_actual)
-
-    def filtrar_tabla_usuarios(self, texto_busqueda, tree, usuarios, eventos_dict):
-        """Filtra la tabla de usuarios según el texto de búsqueda."""
-        # Limpiar tabla actual
-        for item in tree.get_children():
-            tree.delete(item)
-        
-        # Filtrar usuarios
-        texto_busqueda = texto_busqueda.lower().strip()
-        usuarios_filtrados = []
-        
-        if not texto_busqueda:
-            # Si no hay texto de búsqueda, mostrar todos
-            usuarios_filtrados = usuarios
+        return COLA_IMPRESION.encolar(img, datos, impresora, al_terminar=self.impresion_terminada)
+
+    def impresion_terminada(self, trabajo, ok, segundos, error):
+        """Resultado de un trabajo de la cola de impresión (se llama desde el hilo de impresión)."""
+        datos = trabajo['datos']
+        pendientes = COLA_IMPRESION.pendientes()
+        en_cola = f" • {pendientes} en cola" if pendientes else ""
+        
+        if ok:
+            estado = f"🖨️ Etiqueta impresa en {segundos:.1f} s{en_cola}"
+        elif trabajo.get('resultado'):
+            estado = f"💾 Etiqueta guardada en archivo{en_cola}"
         else:
-            # Buscar en nombre y apellidos
-            for usuario in usuarios:
-                nombre = str(usuario.get('Nombrecompleto', '')).lower()
-                apellidos = str(usuario.get('apellidos', '')).lower()
-                
-                if (texto_busqueda in nombre or 
-                    texto_busqueda in apellidos or
-                    texto_busqueda in f"{nombre} {apellidos}"):
-                    usuarios_filtrados.append(usuario)
-        
-        # Insertar usuarios filtrados
-        for usuario in usuarios_filtrados:
-            pulsera_texto = "✅ SÍ" if usuario.get('comida', 0) == 1 else "❌ NO"
-            mochila_texto = "❌ NO" if usuario.get('pirata', 0) == 1 else "✅ SÍ"
-            evento_id = usuario.get('Evento', '')
-            
-            # Obtener nombre del evento
-            if evento_id in eventos_dict:
-                evento_nombre = eventos_dict[evento_id]['Nombre']
-            else:
-                evento_nombre = "No encontrado"
-            
-            tree.insert('', 'end', values=(
-                usuario.get('idUsuario', ''),
-                usuario.get('Nombrecompleto', ''),
-                usuario.get('apellidos', ''),
-                usuario.get('Empresa', ''),
-                usuario.get('entrada', ''),
-                f"{evento_id} - {evento_nombre}",
-                pulsera_texto,
-                mochila_texto
-            ))
-        
-        print(f"🔍 Búsqueda '{texto_busqueda}': {len(usuarios_filtrados)} de {len(usuarios)} usuarios")
+            estado = f"❌ Error de impresión: {error}"
+            self.log_message(f"Error de impresión: {error}", "ERROR")
+        self.en_ui(self.actualizar_info_status, estado)
+        
+        # 6️⃣ Registro de la impresión
+        if datos:
+            log_impresion(datos)
+            self.add_log(datos)
+
+    def filtrar_tabla_usuarios(self, texto_busqueda, modelo):
+        """Filtra la tabla de usuarios según el texto de búsqueda (solo se dibujan las filas visibles)."""
+        encontrados = modelo.filtrar(texto_busqueda)
+        print(f"🔍 Búsqueda '{normalizar_busqueda(texto_busqueda)}': {encontrados} de {len(modelo.usuarios)} usuarios")
 
-    def limpiar_busqueda_tabla(self, search_var, tree, usuarios, eventos_dict):
+    def limpiar_busqueda_tabla(self, search_var, modelo):
         """Limpia el campo de búsqueda y restaura todos los usuarios."""
         search_var.set("")
-        self.filtrar_tabla_usuarios("", tree, usuarios, eventos_dict)
+        self.filtrar_tabla_usuarios("", modelo)
 
     def imprimir_etiqueta_seleccionada(self, tree):
         """Imprime la etiqueta del usuario seleccionado en la tabla."""
@@ -4422,74 +7692,44 @@ class SistemaEtiquetasProfesional(tk.Tk):
         self.imprimir_etiqueta_desde_tabla(id_usuario)
 
     def imprimir_etiqueta_desde_tabla(self, id_usuario):
-        """Imprime la etiqueta de un usuario específico desde la tabla."""
+        """Encola en el hilo de escaneo la impresión de un usuario de la tabla."""
+        try:
+            self.cola_escaneos.put_nowait((self.imprimir_desde_tabla, (str(id_usuario),)))
+        except queue.Full:
+            messagebox.showwarning('Cola llena', 'Hay demasiados escaneos pendientes. Intente imprimir de nuevo en unos segundos.')
+            return
+        self.actualizar_info_status(f"⏳ Etiqueta de {id_usuario} en cola...")
+
+    def imprimir_desde_tabla(self, id_usuario):
+        """Búsqueda → render → marca → impresión de un usuario de la tabla (se ejecuta en el hilo de escaneo)."""
         try:
             print(f"🖨️ Imprimiendo etiqueta para usuario ID: {id_usuario}")
             
             # Buscar usuario según el modo actual
             if self.modo_csv:
-                usuario = self.buscar_usuario_csv(str(id_usuario))
+                usuario = self.buscar_usuario_csv(id_usuario)
             else:
-                usuario = buscar_asistente(str(id_usuario))  # Usar función global para MySQL
+                usuario = buscar_asistente(id_usuario)
             
             if not usuario:
-                messagebox.showerror('Usuario no encontrado', 
+                self.en_ui(messagebox.showerror, 'Usuario no encontrado',
                     f'No se encontró el usuario con ID {id_usuario}.')
                 return
             
-            # Generar etiqueta
-            self.datos_actual = usuario
-            
-            # Obtener nombre del evento usando la misma lógica que el programa principal
-            evento_id = usuario.get('Evento', '')
-            eventos = self.obtener_eventos_seguro()
-            nombre_evento = obtener_nombre_evento(evento_id, eventos)
-            
-            print(f"📅 Evento: {evento_id} - {nombre_evento}")
-            
-            # Generar etiquetas usando la función global
-            self.img_etiqueta_preview = generar_etiqueta(usuario, nombre_evento, version_impresion=False)
-            self.img_etiqueta = generar_etiqueta(usuario, nombre_evento, version_impresion=True)
-            
-            # Marcar comida como entregada
-            if self.modo_csv:
-                self.marcar_comida_csv(id_usuario)
-            else:
-                # Importar función de MySQL si está disponible
-                try:
-                    # Intentar marcar comida en MySQL usando función existente
-                    if hasattr(self, 'marcar_comida_mysql'):
-                        self.marcar_comida_mysql(id_usuario)
-                    else:
-                        print("⚠️ Función marcar_comida_mysql no disponible")
-                except Exception as e:
-                    print(f"⚠️ Error al marcar comida en MySQL: {e}")
-            
-            # Imprimir etiqueta
-            imprimir_etiqueta(self.img_etiqueta)
+            # Misma etiqueta (y caché) que el escaneo; se muestra sin habilitar el botón de imprimir
+            img_preview, img_impresion = self.obtener_etiquetas(usuario)
+            self.en_ui(self.mostrar_etiqueta_escaneada, usuario, img_preview, img_impresion, True)
             
-            # Intentar guardar log con manejo de errores
-            try:
-                log_impresion(self.datos_actual)
-                self.add_log(self.datos_actual)
-            except Exception as log_error:
-                print(f"⚠️ Error al guardar log: {log_error}")
-                # La impresión se realizó exitosamente, solo el log falló
+            # Marcar comida e imprimir (la cola registra la impresión al terminar)
+            self.imprimir_y_registrar(usuario, img_impresion)
             
-            messagebox.showinfo('Éxito', 
-                f'Etiqueta impresa correctamente para {usuario.get("Nombrecompleto", "Usuario desconocido")}')
+            self.en_ui(messagebox.showinfo, 'Éxito',
+                f'Etiqueta enviada a la impresora para {usuario.get("Nombrecompleto", "Usuario desconocido")}')
             
         except Exception as e:
             error_msg = f"Error al imprimir etiqueta: {str(e)}"
             print(f"❌ {error_msg}")
-            # Si el error es solo de log, mostrar mensaje diferente
-            if "permission denied" in str(e).lower() and "log" in str(e).lower():
-                messagebox.showwarning('Impresión realizada', 
-                    f'Etiqueta impresa correctamente para {usuario.get("Nombrecompleto", "Usuario desconocido")}.\n\n'
-                    'Nota: No se pudo guardar el registro debido a permisos de archivo. '
-                    'Cierra Excel u otros programas que puedan tener abierto el archivo de log.')
-            else:
-                messagebox.showerror('Error de impresión', error_msg)
+            self.en_ui(messagebox.showerror, 'Error de impresión', error_msg)
 
     def add_log(self, datos):
         """Registra la impresión en el log de actividad."""
@@ -4521,7 +7761,7 @@ class SistemaEtiquetasProfesional(tk.Tk):
         if self.modo_csv:
             if self.eventos_cargados:
                 num_eventos = len(self.eventos_cargados)
-                total_registros = len(self.datos_csv) if hasattr(self, 'datos_csv') and self.datos_csv is not None else 0
+                total_registros = self.almacen_csv.total()
                 modo_info = f" • OFFLINE ({num_eventos} evento(s), {total_registros} registros)"
             else:
                 modo_info = " • OFFLINE (CSV)"
@@ -4531,6 +7771,10 @@ class SistemaEtiquetasProfesional(tk.Tk):
         self.title(base_titulo + modo_info)
 
 if __name__ == '__main__':
+    # Necesario para el pool de procesos del pre-renderizado en el ejecutable empaquetado
+    multiprocessing.freeze_support()
+    informar_entorno()
+    
     # =====================================================
     # 🚀 INICIO DEL SISTEMA PROFESIONAL
     # =====================================================